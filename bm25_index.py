@@ -0,0 +1,439 @@
+"""
+BM25 Index Module
+Index BM25 dạng ma trận thưa CSR (term x chunk) lưu trên đĩa, memmap khi load,
+chấm điểm nhiều query cùng lúc bằng phép cộng thưa vector hóa
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import Stemmer
+from bm25s.stopwords import STOPWORDS_EN
+
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle
+
+from string_table import StringTable
+
+logger = logging.getLogger(__name__)
+
+BM25_FORMAT_VERSION = 3
+
+# Số posting mỗi block khi tính block-max (upper bound theo block cho dynamic pruning)
+BLOCK_SIZE = 64
+BLOCK_ARRAYS = ("term_max", "block_ptr", "block_last_doc", "block_max")
+
+# Giới hạn số ô (query x chunk) của ma trận điểm khi chấm một batch bằng score_batch
+SCORE_BATCH_MAX_CELLS = 1 << 24
+
+# Cùng cách tách từ với BM25Retriever (bm25s) để điểm BM25 không đổi khi thay engine
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+class BM25Tokenizer:
+    """Lowercase + regex tokens, English stopword removal and stemming (bm25s defaults)"""
+
+    def __init__(self, stemmer_language: Optional[str] = "english"):
+        self.stemmer = Stemmer.Stemmer(stemmer_language) if stemmer_language else None
+        self.stopwords = set(STOPWORDS_EN)
+        self._stem_cache: Dict[str, str] = {}
+
+    def _stem(self, token: str) -> str:
+        stem = self._stem_cache.get(token)
+        if stem is None:
+            stem = self.stemmer.stemWord(token) if self.stemmer else token
+            self._stem_cache[token] = stem
+        return stem
+
+    def __call__(self, text: str) -> List[str]:
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        return [self._stem(token) for token in tokens if token not in self.stopwords]
+
+
+class ChunkSetFingerprint:
+    """
+    Fingerprint of the chunk set an index was built from, accumulated one chunk at a time
+
+    Cộng (mod 2^160) sha1 của (chunk id, sha1 của text) từng chunk: không phụ thuộc thứ tự
+    nên tính được khi ghi chunk store theo luồng mà không phải giữ / sắp xếp danh sách chunk id.
+    Chunk id cố định theo (tài liệu, thứ tự chunk) nên phải hash cả nội dung: tài liệu sửa mà
+    giữ nguyên số chunk vẫn đổi fingerprint.
+    """
+
+    def __init__(self):
+        self._total = 0
+
+    def add(self, node_id: str, text: str):
+        digest = hashlib.sha1(node_id.encode('utf-8') + b'\0' + hashlib.sha1(text.encode('utf-8')).digest())
+        self._total = (self._total + int.from_bytes(digest.digest(), 'big')) % (1 << 160)
+
+    def hexdigest(self) -> str:
+        return f"{self._total:040x}"
+
+
+def nodes_fingerprint(nodes: Iterable[BaseNode]) -> str:
+    """Fingerprint of the chunk set an index was built from (ids and texts)"""
+    fingerprint = ChunkSetFingerprint()
+    for node in nodes:
+        fingerprint.add(node.node_id, node.get_content())
+    return fingerprint.hexdigest()
+
+
+class BM25Index:
+    """
+    BM25 (Lucene variant) over a CSR term-document matrix
+
+    Mỗi posting lưu sẵn trọng số idf * tf / (tf + k1 * (1 - b + b * dl / avgdl)),
+    nên điểm của query = tổng các dòng (term) tương ứng. Layout trong index_dir:
+        meta.json    - tham số, số chunk, fingerprint
+        vocab.bin / vocab_offsets.npy / vocab_table.npy - term theo term id (StringTable)
+        doc_ids.bin / doc_ids_offsets.npy / doc_ids_table.npy - chunk id theo thứ tự cột (StringTable)
+        indptr.npy / indices.npy / data.npy - ma trận CSR (dòng = term, cột = chunk)
+        term_max.npy - trọng số lớn nhất của mỗi term (upper bound cho MaxScore)
+        block_ptr.npy / block_last_doc.npy / block_max.npy - block-max metadata:
+                       posting list mỗi term chia block BLOCK_SIZE posting, lưu chunk cuối
+                       và trọng số lớn nhất của từng block
+    """
+
+    def __init__(self, vocab: StringTable, doc_ids: StringTable, indptr: np.ndarray,
+                 indices: np.ndarray, data: np.ndarray, k1: float = 1.5, b: float = 0.75,
+                 fingerprint: str = None, tokenizer: BM25Tokenizer = None,
+                 block_arrays: Dict[str, np.ndarray] = None):
+        self.vocab = vocab
+        self.doc_ids = doc_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.k1 = k1
+        self.b = b
+        self.fingerprint = fingerprint
+        self.tokenizer = tokenizer or BM25Tokenizer()
+
+        if block_arrays is None:
+            block_arrays = self._build_block_max()
+        self.term_max = block_arrays["term_max"]
+        self.block_ptr = block_arrays["block_ptr"]
+        self.block_last_doc = block_arrays["block_last_doc"]
+        self.block_max = block_arrays["block_max"]
+
+    def _build_block_max(self) -> Dict[str, np.ndarray]:
+        """Per-term and per-block score upper bounds over the posting lists"""
+        num_terms = len(self.indptr) - 1
+        doc_freqs = np.diff(self.indptr)
+        term_of_posting = np.repeat(np.arange(num_terms), doc_freqs)
+        position = np.arange(len(self.indices)) - self.indptr[term_of_posting]
+
+        block_ptr = np.zeros(num_terms + 1, dtype=np.int64)
+        np.cumsum((doc_freqs + BLOCK_SIZE - 1) // BLOCK_SIZE, out=block_ptr[1:])
+        block_of_posting = block_ptr[term_of_posting] + position // BLOCK_SIZE
+
+        block_max = np.zeros(block_ptr[-1], dtype=np.float32)
+        np.maximum.at(block_max, block_of_posting, self.data)
+        # Posting trong mỗi term đã sắp theo chunk nên phần tử cuối block là chunk lớn nhất
+        block_last_doc = np.zeros(block_ptr[-1], dtype=np.int32)
+        np.maximum.at(block_last_doc, block_of_posting, self.indices)
+
+        term_max = np.zeros(num_terms, dtype=np.float32)
+        np.maximum.at(term_max, term_of_posting, self.data)
+        return {
+            "term_max": term_max,
+            "block_ptr": block_ptr,
+            "block_last_doc": block_last_doc,
+            "block_max": block_max,
+        }
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_ids)
+
+    def column_mask(self, doc_ids: List[str]) -> np.ndarray:
+        """Boolean mask over columns selecting the given chunk ids"""
+        columns = [self.doc_ids.get(doc_id) for doc_id in doc_ids]
+        mask = np.zeros(self.num_docs, dtype=bool)
+        mask[[column for column in columns if column is not None]] = True
+        return mask
+
+    @classmethod
+    def build(cls, doc_ids: List[str], texts: List[str], k1: float = 1.5, b: float = 0.75,
+              tokenizer: BM25Tokenizer = None, fingerprint: str = None) -> 'BM25Index':
+        """Tokenize chunk texts once and build the weighted CSR matrix"""
+        tokenizer = tokenizer or BM25Tokenizer()
+        vocab: Dict[str, int] = {}
+        term_ids, doc_columns, term_freqs = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for column, text in enumerate(texts):
+            tokens = tokenizer(text)
+            doc_lengths[column] = len(tokens)
+            for token, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(token, len(vocab)))
+                doc_columns.append(column)
+                term_freqs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_columns = np.asarray(doc_columns, dtype=np.int32)
+        term_freqs = np.asarray(term_freqs, dtype=np.float32)
+
+        # Sắp xếp posting theo (term, chunk) để tạo CSR
+        order = np.lexsort((doc_columns, term_ids))
+        term_ids, doc_columns, term_freqs = term_ids[order], doc_columns[order], term_freqs[order]
+        doc_freqs = np.bincount(term_ids, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(doc_freqs, out=indptr[1:])
+
+        num_docs = len(texts)
+        avg_length = float(doc_lengths.mean()) if num_docs else 0.0
+        idf = np.log(1 + (num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        length_norm = k1 * (1 - b + b * doc_lengths / max(avg_length, 1e-9))
+        data = idf[term_ids] * term_freqs / (term_freqs + length_norm[doc_columns])
+
+        return cls(StringTable.from_strings(vocab), StringTable.from_strings(doc_ids), indptr, doc_columns, data.astype(np.float32), k1=k1, b=b,
+                   fingerprint=fingerprint, tokenizer=tokenizer)
+
+    def save(self, index_dir: str):
+        """Write index files (arrays as .npy so they can be memory-mapped)"""
+        os.makedirs(index_dir, exist_ok=True)
+        np.save(os.path.join(index_dir, "indptr.npy"), self.indptr)
+        np.save(os.path.join(index_dir, "indices.npy"), self.indices)
+        np.save(os.path.join(index_dir, "data.npy"), self.data)
+        for name in BLOCK_ARRAYS:
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        self.vocab.save(*self._string_table_paths(index_dir, "vocab"))
+        self.doc_ids.save(*self._string_table_paths(index_dir, "doc_ids"))
+        # meta.json ghi sau cùng: có meta nghĩa là index đã ghi đủ
+        with open(os.path.join(index_dir, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": BM25_FORMAT_VERSION,
+                "k1": self.k1,
+                "b": self.b,
+                "num_docs": self.num_docs,
+                "num_terms": len(self.vocab),
+                "fingerprint": self.fingerprint,
+            }, f, indent=2)
+
+    @staticmethod
+    def _string_table_paths(index_dir: str, name: str) -> Tuple[str, str, str]:
+        return tuple(os.path.join(index_dir, f"{name}{suffix}") for suffix in (".bin", "_offsets.npy", "_table.npy"))
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional['BM25Index']:
+        """Open a saved index (memory-mapped), None if missing or unreadable"""
+        meta_path = os.path.join(index_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("version") != BM25_FORMAT_VERSION:
+                return None
+            vocab = StringTable.load(*cls._string_table_paths(index_dir, "vocab"))
+            doc_ids = StringTable.load(*cls._string_table_paths(index_dir, "doc_ids"))
+            arrays = {
+                name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r')
+                for name in ("indptr", "indices", "data") + BLOCK_ARRAYS
+            }
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load BM25 index from {index_dir}: {e}")
+            return None
+        return cls(vocab, doc_ids, arrays["indptr"], arrays["indices"], arrays["data"],
+                   k1=meta["k1"], b=meta["b"], fingerprint=meta.get("fingerprint"),
+                   block_arrays={name: arrays[name] for name in BLOCK_ARRAYS})
+
+    def query_term_ids(self, query: str) -> np.ndarray:
+        """Token ids of a query (out-of-vocabulary tokens dropped, duplicates kept)"""
+        term_ids = [self.vocab.get(token) for token in self.tokenizer(query)]
+        return np.asarray([term_id for term_id in term_ids if term_id is not None], dtype=np.int64)
+
+    def score_batch(self, queries: List[str]) -> np.ndarray:
+        """BM25 scores of every chunk for every query, shape (n_queries, num_docs)"""
+        query_rows, columns, weights = [], [], []
+        for row, query in enumerate(queries):
+            for term_id in self.query_term_ids(query).tolist():
+                start, end = self.indptr[term_id], self.indptr[term_id + 1]
+                query_rows.append(np.full(end - start, row, dtype=np.int64))
+                columns.append(self.indices[start:end])
+                weights.append(self.data[start:end])
+
+        if not columns:
+            return np.zeros((len(queries), self.num_docs), dtype=np.float32)
+
+        # Cộng toàn bộ posting của cả batch bằng một lần bincount
+        flat_index = np.concatenate(query_rows) * self.num_docs + np.concatenate(columns)
+        scores = np.bincount(flat_index, weights=np.concatenate(weights),
+                             minlength=len(queries) * self.num_docs)
+        return scores.reshape(len(queries), self.num_docs).astype(np.float32)
+
+    def search(self, query: str, top_k: int,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k with dynamic pruning (MaxScore + block-max upper bounds)
+
+        Term được xử lý theo upper bound giảm dần. Khi tổng upper bound của các term
+        còn lại không vượt quá ngưỡng top-k hiện tại, các term đó là "non-essential":
+        không quét posting list của chúng nữa mà chỉ tra (binary search) cho các chunk
+        ứng viên còn có thể vào top-k theo block-max.
+        """
+        empty = (np.array([], dtype=np.int64), np.array([], dtype=np.float32))
+        term_ids, counts = np.unique(self.query_term_ids(query), return_counts=True)
+        if len(term_ids) == 0 or top_k <= 0 or self.num_docs == 0:
+            return empty
+
+        upper_bounds = self.term_max[term_ids] * counts
+        order = np.argsort(-upper_bounds, kind='stable')
+        term_ids, counts, upper_bounds = term_ids[order], counts[order], upper_bounds[order]
+        # remaining_ub[i] = tổng upper bound của các term i, i+1, ...
+        remaining_ub = np.append(np.cumsum(upper_bounds[::-1])[::-1], 0.0)
+
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        seen = np.zeros(self.num_docs, dtype=bool)
+        last_term = np.full(self.num_docs, -1, dtype=np.int32)
+        top_docs = np.array([], dtype=np.int64)
+        threshold = 0.0
+
+        # Essential terms: quét toàn bộ posting list, chunk mới có thể vào top-k
+        i = 0
+        while i < len(term_ids) and (len(top_docs) < top_k or remaining_ub[i] > threshold):
+            start, end = self.indptr[term_ids[i]], self.indptr[term_ids[i] + 1]
+            docs = np.asarray(self.indices[start:end], dtype=np.int64)
+            weights = self.data[start:end] * counts[i]
+            if mask is not None:
+                allowed = mask[docs]
+                docs, weights = docs[allowed], weights[allowed]
+            scores[docs] += weights
+            seen[docs] = True
+            last_term[docs] = i
+
+            # Top-k mới chỉ có thể nằm trong top-k cũ + các chunk vừa được cộng điểm
+            pool = np.concatenate([top_docs[last_term[top_docs] != i], docs])
+            if len(pool) > top_k:
+                pool = pool[np.argpartition(-scores[pool], top_k - 1)[:top_k]]
+            top_docs = pool
+            threshold = float(scores[top_docs].min()) if len(top_docs) >= top_k else 0.0
+            i += 1
+        candidates = np.flatnonzero(seen)
+
+        # Non-essential terms: chỉ chấm các ứng viên còn đủ upper bound
+        for j in range(i, len(term_ids)):
+            term_id = term_ids[j]
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            block_start, block_end = self.block_ptr[term_id], self.block_ptr[term_id + 1]
+
+            # Block chứa (nếu có) từng ứng viên trong posting list của term
+            blocks = np.searchsorted(self.block_last_doc[block_start:block_end], candidates)
+            in_range = blocks < block_end - block_start
+            block_ub = np.zeros(len(candidates), dtype=np.float32)
+            block_ub[in_range] = self.block_max[block_start + blocks[in_range]] * counts[j]
+
+            keep = scores[candidates] + block_ub + remaining_ub[j + 1] >= threshold
+            candidates, block_ub = candidates[keep], block_ub[keep]
+
+            # Chỉ tra posting (binary search) cho ứng viên có block upper bound > 0
+            docs_to_check = candidates[block_ub > 0]
+            if len(docs_to_check):
+                term_docs = self.indices[start:end]
+                positions = np.minimum(np.searchsorted(term_docs, docs_to_check), end - start - 1)
+                found = term_docs[positions] == docs_to_check
+                scores[docs_to_check[found]] += self.data[start + positions[found]] * counts[j]
+            threshold = self._kth_score(scores[candidates], top_k)
+
+        candidate_scores = scores[candidates]
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return empty
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top], kind='stable')]
+        top = top[candidate_scores[top] > 0]
+        return candidates[top], candidate_scores[top]
+
+    @staticmethod
+    def _kth_score(scores: np.ndarray, k: int) -> float:
+        """Current top-k threshold (0 until k candidates have been seen)"""
+        if len(scores) < k:
+            return 0.0
+        return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+    def search_batch(self, queries: List[str], top_k: int, mask: Optional[np.ndarray] = None,
+                     pruning: bool = True) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k (columns, scores) per query, only chunks with a positive score
+
+        Batch nhiều query luôn chấm bằng phép cộng thưa (score_batch), chia nhỏ sao cho
+        ma trận điểm không vượt SCORE_BATCH_MAX_CELLS ô. pruning chỉ áp dụng cho batch
+        một query: True dùng MaxScore/block-max, False chấm toàn bộ như batch.
+        """
+        if pruning and len(queries) == 1:
+            return [self.search(queries[0], top_k, mask)]
+
+        results = []
+        step = max(1, SCORE_BATCH_MAX_CELLS // max(self.num_docs, 1))
+        for offset in range(0, len(queries), step):
+            for scores in self.score_batch(queries[offset:offset + step]):
+                results.append(self._top_k(scores, top_k, mask))
+        return results
+
+    def _top_k(self, scores: np.ndarray, top_k: int,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k (columns, scores) of one dense score row"""
+        if mask is not None:
+            scores[~mask] = 0.0
+        k = min(top_k, self.num_docs)
+        if k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[scores[top] > 0]
+        return top, scores[top]
+
+
+def build_bm25_index(nodes: List[BaseNode]) -> BM25Index:
+    """Build a BM25 index from nodes (text as embedded: content + metadata)"""
+    return BM25Index.build(
+        [node.node_id for node in nodes],
+        [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes],
+        fingerprint=nodes_fingerprint(nodes),
+    )
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """Keyword retriever backed by a persisted BM25Index"""
+
+    def __init__(self, bm25_index: BM25Index, get_node: Callable[[str], BaseNode],
+                 similarity_top_k: int = 10, pruning: bool = True):
+        super().__init__()
+        self.bm25_index = bm25_index
+        self.get_node = get_node  # chunk id -> node
+        self.similarity_top_k = similarity_top_k
+        self.pruning = pruning
+
+    def _to_nodes(self, columns: np.ndarray, scores: np.ndarray) -> List[NodeWithScore]:
+        return [
+            NodeWithScore(node=self.get_node(self.bm25_index.doc_ids[column]), score=float(score))
+            for column, score in zip(columns.tolist(), scores.tolist())
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        columns, scores = self.bm25_index.search_batch(
+            [query_bundle.query_str], self.similarity_top_k, pruning=self.pruning)[0]
+        return self._to_nodes(columns, scores)
+
+    def retrieve_restricted(self, query: str, node_ids: List[str],
+                            top_k: int = None) -> List[NodeWithScore]:
+        """BM25 top-k among the given chunks only (mask pushed into the search)"""
+        columns, scores = self.bm25_index.search_batch(
+            [query], top_k or self.similarity_top_k, mask=self.bm25_index.column_mask(node_ids),
+            pruning=self.pruning)[0]
+        return self._to_nodes(columns, scores)
+
+    def retrieve_batch(self, queries: List[str]) -> List[List[NodeWithScore]]:
+        """Score many queries in one vectorized pass"""
+        return [
+            self._to_nodes(columns, scores)
+            for columns, scores in self.bm25_index.search_batch(queries, self.similarity_top_k,
+                                                               pruning=self.pruning)
+        ]
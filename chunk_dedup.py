@@ -0,0 +1,238 @@
+"""
+Chunk Dedup Module
+Phát hiện chunk gần trùng lúc ingest bằng MinHash + LSH: chunk trùng không được embed/lưu,
+chunk giữ lại ghi nhận document id của mọi tài liệu nguồn (metadata "source_docs")
+"""
+
+import os
+import re
+import json
+import zlib
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from llama_index.core.schema import BaseNode
+
+from document_index import SOURCE_DOCS_KEY, node_document_id, node_document_ids
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+# Hash họ (a * x + b) mod p với x là crc32 của shingle (như datasketch: phép nhân tràn uint64)
+MINHASH_PRIME = np.uint64((1 << 61) - 1)
+
+
+def shingles(text: str, size: int = 5) -> Set[int]:
+    """Hashed word n-grams of a chunk (lowercased)"""
+    words = TOKEN_PATTERN.findall(text.lower())
+    if len(words) <= size:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))} if words else set()
+    return {
+        zlib.crc32(' '.join(words[i:i + size]).encode('utf-8'))
+        for i in range(len(words) - size + 1)
+    }
+
+
+def add_source_document(node: BaseNode, doc_id: str) -> bool:
+    """Record one more source document on a kept chunk, False if it was already recorded"""
+    doc_ids = node_document_ids(node)
+    if doc_id in doc_ids:
+        return False
+    node.metadata[SOURCE_DOCS_KEY] = doc_ids + [doc_id]
+    # Không đưa vào text khi embed / prompt
+    if SOURCE_DOCS_KEY not in node.excluded_embed_metadata_keys:
+        node.excluded_embed_metadata_keys.append(SOURCE_DOCS_KEY)
+    if SOURCE_DOCS_KEY not in node.excluded_llm_metadata_keys:
+        node.excluded_llm_metadata_keys.append(SOURCE_DOCS_KEY)
+    return True
+
+
+def remove_source_documents(node: BaseNode, doc_ids: Set[str]) -> bool:
+    """Drop source documents from a kept chunk (its own document stays), False if none was recorded"""
+    current = node_document_ids(node)
+    remaining = [doc_id for doc_id in current if doc_id not in doc_ids or doc_id == node_document_id(node)]
+    if len(remaining) == len(current):
+        return False
+    if len(remaining) > 1:
+        node.metadata[SOURCE_DOCS_KEY] = remaining
+    else:
+        node.metadata.pop(SOURCE_DOCS_KEY, None)
+    return True
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index over the kept chunks (this ingest + stored chunks it was seeded with)
+
+    Signature `num_perm` hàm hash chia thành `bands` băng; chunk mới chung ít nhất
+    một băng với chunk đã giữ là ứng viên, xác nhận khi Jaccard ước lượng từ signature
+    >= threshold. Chỉ lưu signature (uint32), id và file_name của chunk giữ lại, không lưu node.
+    Signature được lưu ra đĩa sau mỗi lần ingest (save) để lần cập nhật incremental nạp lại
+    (load_signatures) và so chunk của file mới với cả các chunk đã lưu. Node của chunk giữ lại
+    chỉ được lấy khi nó là chunk đại diện của một chunk trùng: từ window đang chờ ghi
+    (`pending` của collapse) hoặc đọc lại qua `stored_node` (chunk đã ghi của lần ingest này
+    hoặc đã lưu từ trước).
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, threshold: float = 0.85,
+                 shingle_size: int = 5, seed: int = 1,
+                 stored_node: Callable[[str], BaseNode] = None):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.stored_node = stored_node  # chunk id -> node của chunk đã ghi
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(MINHASH_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(MINHASH_PRIME), size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._files: Dict[str, str] = {}  # chunk id -> file_name
+        # Chunk đại diện đã đọc qua stored_node (đã nhận thêm tài liệu nguồn), để chunk trùng
+        # sau gộp tiếp vào cùng node; chỉ gồm chunk có chunk trùng
+        self._representatives: Dict[str, BaseNode] = {}
+
+        # Thống kê cho báo cáo build
+        self.num_chunks = 0
+        self.num_duplicates = 0
+        self.saved_bytes = 0
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash signature of a chunk, None when it has no words"""
+        hashes = np.fromiter(shingles(text, self.shingle_size), dtype=np.uint64)
+        if not len(hashes):
+            return None
+        values = (np.outer(hashes, self._a) + self._b) % MINHASH_PRIME
+        return (values.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray):
+        rows = self.num_perm // self.bands
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows].tobytes()
+
+    def find(self, signature: np.ndarray) -> Optional[Tuple[str, float]]:
+        """Most similar kept chunk above the threshold, as (node id, estimated Jaccard)"""
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        best = None
+        for node_id in candidates:
+            similarity = float(np.mean(self._signatures[node_id] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (node_id, similarity)
+        return best
+
+    def add(self, node: BaseNode, signature: np.ndarray):
+        self._add_signature(node.node_id, node.metadata.get('file_name', ''), signature)
+
+    def _add_signature(self, node_id: str, file_name: str, signature: np.ndarray):
+        self._signatures[node_id] = signature
+        self._files[node_id] = file_name
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(node_id)
+
+    def seed_chunks(self, chunks: Iterable[Tuple[str, str, str]]) -> int:
+        """Add stored chunks given as (chunk id, file_name, text), returns how many were added"""
+        added = 0
+        for node_id, file_name, text in chunks:
+            signature = self.signature(text)
+            if signature is not None:
+                self._add_signature(node_id, file_name, signature)
+                added += 1
+        return added
+
+    def _params(self) -> Dict:
+        return {"num_perm": self.num_perm, "shingle_size": self.shingle_size, "seed": self.seed}
+
+    def save(self, path: str):
+        """Write the signatures of every kept chunk (atomic rename)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        node_ids = list(self._signatures)
+        signatures = np.stack([self._signatures[node_id] for node_id in node_ids]) if node_ids \
+            else np.zeros((0, self.num_perm), dtype=np.uint32)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, params=np.array(json.dumps(self._params())),
+                     node_ids=np.array(node_ids, dtype=str),
+                     file_names=np.array([self._files[node_id] for node_id in node_ids], dtype=str),
+                     signatures=signatures)
+        os.replace(tmp_path, path)
+
+    def load_signatures(self, path: str, exclude_files: Set[str] = None,
+                        is_stored: Callable[[str], bool] = None) -> Optional[int]:
+        """
+        Seed from saved signatures, skipping chunks of `exclude_files`
+
+        Trả về số signature nạp được, None nếu file thiếu, khác tham số MinHash hoặc có
+        chunk không còn được lưu (`is_stored`) - khi đó nên seed lại từ text (seed_chunks).
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if json.loads(str(data["params"])) != self._params():
+                    return None
+                node_ids, file_names = data["node_ids"].tolist(), data["file_names"].tolist()
+                signatures = data["signatures"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load MinHash signatures from {path}: {e}")
+            return None
+        exclude_files = exclude_files or set()
+        rows = [row for row, file_name in enumerate(file_names) if file_name not in exclude_files]
+        if is_stored is not None and not all(is_stored(node_ids[row]) for row in rows):
+            return None
+        for row in rows:
+            self._add_signature(node_ids[row], file_names[row], signatures[row])
+        return len(rows)
+
+    def collapse(self, nodes: List[BaseNode], pending: Dict[str, BaseNode] = None
+                 ) -> Tuple[List[BaseNode], List[Tuple[BaseNode, BaseNode]]]:
+        """
+        Split chunks into those to store and (duplicate, kept chunk) pairs
+
+        Chunk trùng được gộp vào chunk giữ lại đầu tiên (theo thứ tự ingest), tài liệu
+        của chunk trùng được thêm vào source_docs của chunk giữ lại. `pending`: chunk giữ
+        lại chưa ghi (window đang chờ), theo chunk id.
+        """
+        pending = pending or {}
+        kept, duplicates = [], []
+        kept_here: Dict[str, BaseNode] = {}
+        for node in nodes:
+            self.num_chunks += 1
+            text = node.get_content()
+            signature = self.signature(text)
+            match = self.find(signature) if signature is not None else None
+            if match is None:
+                if signature is not None:
+                    self.add(node, signature)
+                    kept_here[node.node_id] = node
+                kept.append(node)
+                continue
+            representative = kept_here.get(match[0]) or pending.get(match[0]) \
+                or self._representatives.get(match[0])
+            if representative is None:
+                # Chunk đã ghi: đọc node một lần, giữ lại để gộp tiếp
+                representative = self._representatives[match[0]] = self.stored_node(match[0])
+            add_source_document(representative, node_document_id(node))
+            duplicates.append((node, representative))
+            self.num_duplicates += 1
+            self.saved_bytes += len(text.encode('utf-8'))
+        return kept, duplicates
+
+    def report(self) -> Dict:
+        """Space saved by the compaction"""
+        return {
+            "chunks": self.num_chunks,
+            "duplicates": self.num_duplicates,
+            "kept": self.num_chunks - self.num_duplicates,
+            "ratio": self.num_duplicates / self.num_chunks if self.num_chunks else 0.0,
+            "text_mb": self.saved_bytes / 1024 / 1024,
+        }
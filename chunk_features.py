@@ -0,0 +1,66 @@
+"""
+Chunk Features Module
+Đặc trưng của chunk dùng để sắp xếp lại trong adaptive retrieval (số lượng số,
+từ khóa bảng, từ khóa định nghĩa), tính một lần lúc ingest và lưu trong metadata
+"""
+
+import re
+from typing import Callable, Dict, List
+
+from llama_index.core.schema import BaseNode
+
+NUMBER_PATTERN = re.compile(r'\d+\.?\d*')
+TABLE_KEYWORD_PATTERNS = [re.compile(keyword) for keyword in ('bảng', 'table', r'bảng \d+', r'table \d+')]
+DEFINITION_KEYWORD_PATTERNS = [
+    re.compile(keyword) for keyword in ('định nghĩa', 'là', 'được gọi', 'khái niệm', 'nghĩa là')
+]
+
+NUMBERS_KEY = "num_numbers"
+TABLE_KEYWORDS_KEY = "num_table_keywords"
+DEFINITION_KEYWORDS_KEY = "num_definition_keywords"
+
+
+def count_numbers(text: str) -> int:
+    """Đếm số lượng số trong text"""
+    return len(NUMBER_PATTERN.findall(text))
+
+
+def count_table_keywords(text: str) -> int:
+    """Đếm số lượng từ khóa liên quan đến bảng"""
+    text_lower = text.lower()
+    return sum(len(pattern.findall(text_lower)) for pattern in TABLE_KEYWORD_PATTERNS)
+
+
+def count_definition_keywords(text: str) -> int:
+    """Đếm số lượng từ khóa định nghĩa"""
+    text_lower = text.lower()
+    return sum(len(pattern.findall(text_lower)) for pattern in DEFINITION_KEYWORD_PATTERNS)
+
+
+FEATURES: Dict[str, Callable[[str], int]] = {
+    NUMBERS_KEY: count_numbers,
+    TABLE_KEYWORDS_KEY: count_table_keywords,
+    DEFINITION_KEYWORDS_KEY: count_definition_keywords,
+}
+
+
+def add_chunk_features(nodes: List[BaseNode]):
+    """Compute every feature once per chunk and store it in the chunk's metadata"""
+    for node in nodes:
+        text = node.get_content()
+        for key, feature in FEATURES.items():
+            node.metadata[key] = feature(text)
+        # Không đưa vào text khi embed / prompt
+        for key in FEATURES:
+            if key not in node.excluded_embed_metadata_keys:
+                node.excluded_embed_metadata_keys.append(key)
+            if key not in node.excluded_llm_metadata_keys:
+                node.excluded_llm_metadata_keys.append(key)
+
+
+def chunk_feature(node: BaseNode, key: str) -> int:
+    """Stored feature value (computed from the text for chunks indexed before features existed)"""
+    value = node.metadata.get(key)
+    if value is None:
+        value = FEATURES[key](node.get_content())
+    return value
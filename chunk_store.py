@@ -0,0 +1,525 @@
+"""
+Chunk Store Module
+Kho chunk dạng cột, memory-map: text UTF-8 nối liền + offset, document id, đặc trưng
+chunk và vector là mảng số; tra cứu theo chunk id / document id O(1) mà không nạp node vào RAM
+"""
+
+import os
+import json
+import shutil
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from llama_index.core.schema import BaseNode, TextNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+from bm25_index import ChunkSetFingerprint
+from chunk_features import FEATURES, chunk_feature
+from document_index import document_id, node_document_ids
+from string_table import StringTable, build_hash_table
+
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_VERSION = 2
+
+
+class _ColumnWriter:
+    """
+    Append-only fixed-width column spooled to a raw file (readable while writing)
+
+    Không giữ giá trị trong RAM; save() chép sang .npy theo block để load() memory-map được.
+    """
+
+    def __init__(self, path: str, dtype, width: int = 1):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.rows = 0
+        self.file = open(path, 'w+b')
+
+    def append(self, values):
+        values = np.asarray(values, dtype=self.dtype).reshape(-1, self.width)
+        self.file.write(values.tobytes())
+        self.rows += len(values)
+
+    def view(self) -> np.ndarray:
+        """Memory-mapped (rows x width) view of what has been appended so far"""
+        self.file.flush()
+        if not self.rows:
+            return np.zeros((0, self.width), dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', shape=(self.rows, self.width))
+
+    def save(self, npy_path: str, head=None, block_rows: int = 1 << 20):
+        """Write `head` + the column as a 1-d (width 1) or 2-d .npy file, then drop the spool"""
+        head = np.asarray(head if head is not None else [], dtype=self.dtype).reshape(-1, self.width)
+        view = self.view()
+        shape = (len(head) + self.rows,) if self.width == 1 else (len(head) + self.rows, self.width)
+        out = np.lib.format.open_memmap(npy_path, mode='w+', dtype=self.dtype, shape=shape)
+        out_rows = out.reshape(-1, self.width)
+        out_rows[:len(head)] = head
+        for start in range(0, self.rows, block_rows):
+            stop = min(start + block_rows, self.rows)
+            out_rows[len(head) + start:len(head) + stop] = view[start:stop]
+        out.flush()
+        del out, out_rows, view
+        self.close()
+        os.remove(self.path)
+
+    def close(self):
+        self.file.close()
+
+
+class _BlobWriter:
+    """Append-only byte blob plus its row end offsets (row i = blob[ends[i - 1]:ends[i]])"""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'w+b')
+        self.size = 0
+        self.ends = _ColumnWriter(path + ".ends", np.int64)
+
+    def append(self, data: bytes):
+        self.file.write(data)
+        self.size += len(data)
+        self.ends.append([self.size])
+
+    def read(self, start_row: int, stop_row: int) -> List[bytes]:
+        """Rows [start_row, stop_row) in one read"""
+        self.file.flush()
+        ends = self.ends.view()[:, 0]
+        start = int(ends[start_row - 1]) if start_row else 0
+        bounds = [start] + ends[start_row:stop_row].tolist()
+        data = os.pread(self.file.fileno(), bounds[-1] - start, start)
+        return [data[bounds[i] - start:bounds[i + 1] - start] for i in range(len(bounds) - 1)]
+
+    def close(self, offsets_path: str):
+        self.file.close()
+        self.ends.save(offsets_path, head=[0])
+
+
+class ChunkStore:
+    """
+    Read-only columnar chunk store over memory-mapped files
+
+    Layout trong store_dir:
+        meta.json           - version, số chunk, fingerprint, các cột đặc trưng
+        text.bin            - text của các chunk (UTF-8) nối liền, text_offsets.npy (n + 1)
+        ids.bin             - chunk id theo dòng, id_offsets.npy
+        metadata.bin        - metadata JSON (node_to_metadata_dict) theo dòng, metadata_offsets.npy
+        id_table.npy        - bảng băm open addressing: slot -> dòng (-1 = trống)
+        doc_ids.json        - danh sách document id (một entry mỗi tài liệu)
+        doc_codes.npy       - int32: mã document id (tài liệu chứa chunk) của từng chunk
+        doc_ptr.npy / doc_rows.npy - CSR document -> các dòng chunk (kể cả qua source_docs)
+        feature_<key>.npy   - int32: đặc trưng chunk (chunk_features)
+        vectors.bin         - float16 (n x vector_dim): embedding đầy đủ số chiều (trước khi cắt
+                              Matryoshka) của từng chunk; chỉ có khi store được ghi kèm vector
+    """
+
+    def __init__(self, store_dir: str, meta: Dict):
+        self.store_dir = store_dir
+        self.fingerprint = meta.get("fingerprint")
+        self.num_chunks = meta["num_chunks"]
+        with open(self._path("doc_ids.json"), 'r', encoding='utf-8') as f:
+            self.doc_ids: List[str] = json.load(f)
+        self._doc_codes_by_id = {doc_id: code for code, doc_id in enumerate(self.doc_ids)}
+
+        self._text = self._open_blob("text.bin")
+        self._text_offsets = self._open_array("text_offsets.npy")
+        # Chunk id theo dòng + bảng băm id -> dòng (ids.bin, id_offsets.npy, id_table.npy)
+        self._chunk_ids = StringTable.load(self._path("ids.bin"), self._path("id_offsets.npy"),
+                                           self._path("id_table.npy"))
+        self._metadata = self._open_blob("metadata.bin")
+        self._metadata_offsets = self._open_array("metadata_offsets.npy")
+        self.doc_codes = self._open_array("doc_codes.npy")
+        self._doc_ptr = self._open_array("doc_ptr.npy")
+        self._doc_rows = self._open_array("doc_rows.npy")
+        self.features = {key: self._open_array(f"feature_{key}.npy") for key in meta.get("features", [])}
+        self.vector_dim: Optional[int] = meta.get("vector_dim")
+        self.vectors: Optional[np.ndarray] = None
+        if self.vector_dim and self.num_chunks:
+            self.vectors = np.memmap(self._path("vectors.bin"), dtype=np.float16, mode='r',
+                                     shape=(self.num_chunks, self.vector_dim))
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.store_dir, file_name)
+
+    def _open_blob(self, file_name: str) -> np.ndarray:
+        # np.memmap không map được file rỗng
+        if os.path.getsize(self._path(file_name)) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(self._path(file_name), dtype=np.uint8, mode='r')
+
+    def _open_array(self, file_name: str) -> np.ndarray:
+        return np.load(self._path(file_name), mmap_mode='r')
+
+    def __len__(self) -> int:
+        return self.num_chunks
+
+    @staticmethod
+    def _slice(blob: np.ndarray, offsets: np.ndarray, row: int) -> bytes:
+        return blob[int(offsets[row]):int(offsets[row + 1])].tobytes()
+
+    def chunk_id(self, row: int) -> str:
+        return self._chunk_ids[row]
+
+    def text(self, row: int) -> str:
+        return self._slice(self._text, self._text_offsets, row).decode('utf-8')
+
+    def metadata(self, row: int) -> Dict:
+        return json.loads(self._slice(self._metadata, self._metadata_offsets, row))
+
+    def row(self, chunk_id: str) -> Optional[int]:
+        """Row of a chunk id (hash table probe), None if the chunk is not stored"""
+        return self._chunk_ids.get(chunk_id)
+
+    def node(self, row: int) -> BaseNode:
+        """Rebuild the node stored at a row"""
+        metadata = self.metadata(row)
+        try:
+            return metadata_dict_to_node(metadata, text=self.text(row))
+        except ValueError:
+            return TextNode(text=self.text(row), id_=self.chunk_id(row), metadata=metadata)
+
+    def get_node(self, chunk_id: str) -> BaseNode:
+        row = self.row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        return self.node(row)
+
+    def document_rows(self, doc_id: str) -> np.ndarray:
+        """Rows of the chunks of a document, in ingest order"""
+        code = self._doc_codes_by_id.get(doc_id)
+        if code is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.asarray(self._doc_rows[self._doc_ptr[code]:self._doc_ptr[code + 1]])
+
+    def feature(self, chunk_id: str, key: str) -> Optional[int]:
+        """Stored feature of a chunk (feature column), None if the chunk or the column is missing"""
+        column = self.features.get(key)
+        row = self.row(chunk_id) if column is not None else None
+        return None if row is None else int(column[row])
+
+    def chunk_ids(self, doc_id: str) -> List[str]:
+        """Chunk ids of a document (same interface as DocumentChunkIndex)"""
+        return [self.chunk_id(int(row)) for row in self.document_rows(doc_id)]
+
+    @property
+    def has_vectors(self) -> bool:
+        return self.vector_dim is not None
+
+    def get_embeddings(self, chunk_ids: List[str]) -> Optional[np.ndarray]:
+        """Stored (float32) vectors of the given chunk ids, None if a chunk or the vector column is missing"""
+        if not self.has_vectors:
+            return None
+        rows = [self.row(chunk_id) for chunk_id in chunk_ids]
+        if any(row is None for row in rows):
+            return None
+        return np.asarray(self.vectors[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    def _file_mask(self, file_names: Iterable[str]) -> np.ndarray:
+        """Rows whose chunk belongs to one of the files (by document code, no metadata parsing)"""
+        codes = [self._doc_codes_by_id[doc_id] for doc_id in map(document_id, file_names)
+                 if doc_id in self._doc_codes_by_id]
+        return np.isin(self.doc_codes, codes)
+
+    def file_rows(self, file_names: Iterable[str]) -> np.ndarray:
+        """Rows of the chunks of some files, in order"""
+        return np.flatnonzero(self._file_mask(file_names))
+
+    def iter_rows(self, exclude_files: Set[str] = None) -> Iterator[int]:
+        """Rows in order, optionally skipping the chunks of some files"""
+        if not exclude_files:
+            yield from range(self.num_chunks)
+            return
+        yield from np.flatnonzero(~self._file_mask(exclude_files)).tolist()
+
+    def iter_nodes(self, exclude_files: Set[str] = None) -> Iterator[BaseNode]:
+        """Yield stored nodes one at a time, optionally skipping the chunks of some files"""
+        for row in self.iter_rows(exclude_files):
+            yield self.node(row)
+
+    def iter_vectors(self, exclude_files: Set[str] = None) -> Iterator[np.ndarray]:
+        """Vector rows aligned with iter_nodes (requires the vector column)"""
+        for row in self.iter_rows(exclude_files):
+            yield self.vectors[row]
+
+    def iter_batches(self, batch_size: int = 512) -> Iterator[Tuple[List[BaseNode], np.ndarray]]:
+        """Stored nodes with their (float32) vectors, batch by batch in row order (requires the vector column)"""
+        for start in range(0, self.num_chunks, batch_size):
+            stop = min(start + batch_size, self.num_chunks)
+            yield [self.node(row) for row in range(start, stop)], \
+                np.asarray(self.vectors[start:stop], dtype=np.float32)
+
+    @classmethod
+    def write(cls, store_dir: str, nodes: Iterable[BaseNode],
+              vectors: Iterable[np.ndarray] = None) -> 'ChunkStore':
+        """
+        Write nodes into a new store (streamed through ChunkStoreWriter)
+
+        `vectors` (nếu có) cho một vector mỗi node, cùng thứ tự, và được ghi thành cột vectors.bin.
+        """
+        vector_rows = iter(vectors) if vectors is not None else None
+        with ChunkStoreWriter(store_dir, with_vectors=vector_rows is not None) as writer:
+            for row, node in enumerate(nodes):
+                vector = None
+                if vector_rows is not None:
+                    vector = next(vector_rows, None)
+                    if vector is None:
+                        raise ValueError(f"Fewer vectors than chunks (no vector for row {row})")
+                    vector = [vector]
+                writer.append([node], vector)
+        return writer.chunk_store
+
+    @classmethod
+    def load(cls, store_dir: str) -> Optional['ChunkStore']:
+        """Open a saved store, None if missing or unreadable"""
+        meta_path = os.path.join(store_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("version") != CHUNK_STORE_VERSION:
+                return None
+            return cls(store_dir, meta)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load chunk store from {store_dir}: {e}")
+            return None
+
+
+class ChunkStoreWriter:
+    """
+    Streaming writer of a new chunk store (one ingest window at a time)
+
+    Mọi cột (text, metadata, id, mã tài liệu, đặc trưng, vector) được ghi thẳng ra file trong
+    thư mục tạm khi append, nên bộ nhớ không tăng theo số chunk; chỉ giữ bảng document id
+    -> mã / dải dòng (theo số tài liệu) và các node được cập nhật metadata (update_nodes).
+    Các dòng đã append đọc lại được (get_node / vector) trong lúc ghi. close() hoàn thiện
+    file (offset, bảng băm id, CSR document -> dòng) rồi đổi tên thư mục tạm thành store_dir,
+    nên store cũ (có thể đang là nguồn của các chunk được append) vẫn đọc được tới lúc đó.
+    """
+
+    def __init__(self, store_dir: str, with_vectors: bool = True):
+        self.store_dir = store_dir
+        self.tmp_dir = store_dir + ".tmp"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.with_vectors = with_vectors
+        self.vector_dim: Optional[int] = None
+        self.chunk_store: Optional[ChunkStore] = None
+        self.num_chunks = 0
+
+        self._texts = _BlobWriter(self._path("text.bin"))
+        self._ids = _BlobWriter(self._path("ids.bin"))
+        self._metadata = _BlobWriter(self._path("metadata.bin"))
+        self._doc_codes = _ColumnWriter(self._path("doc_codes.bin"), np.int32)
+        # (mã tài liệu, dòng) cho mọi tài liệu nguồn của chunk, gom thành CSR lúc close
+        self._doc_pairs = _ColumnWriter(self._path("doc_pairs.bin"), np.int64, width=2)
+        self._features = {key: _ColumnWriter(self._path(f"feature_{key}.bin"), np.int32) for key in FEATURES}
+        self._vectors: Optional[_ColumnWriter] = None
+        self._doc_codes_by_id: Dict[str, int] = {}
+        self._doc_spans: Dict[int, List[int]] = {}  # mã tài liệu -> [dòng đầu, dòng cuối] chunk của nó
+        self._updated: Dict[int, BaseNode] = {}
+        self._fingerprint = ChunkSetFingerprint()
+
+    def __enter__(self) -> 'ChunkStoreWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        elif self.chunk_store is None:
+            self.close()
+
+    def __len__(self) -> int:
+        return self.num_chunks
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.tmp_dir, file_name)
+
+    def _doc_code(self, doc_id: str) -> int:
+        return self._doc_codes_by_id.setdefault(doc_id, len(self._doc_codes_by_id))
+
+    def append(self, nodes: List[BaseNode], vectors: np.ndarray = None):
+        """Append chunks (and their full-dimension vectors when the store has a vector column)"""
+        if self.with_vectors:
+            if vectors is None:
+                raise ValueError("Vector column requires a vector for every chunk")
+            matrix = np.asarray(vectors, dtype=np.float16).reshape(len(nodes), -1)
+            if self._vectors is None:
+                self.vector_dim = matrix.shape[1]
+                self._vectors = _ColumnWriter(self._path("vectors.bin"), np.float16, width=self.vector_dim)
+            elif matrix.shape[1] != self.vector_dim:
+                raise ValueError(f"Vector dim {matrix.shape[1]} does not match store dim {self.vector_dim}")
+            self._vectors.append(matrix)
+
+        for node in nodes:
+            row = self.num_chunks
+            text = node.get_content()
+            self._texts.append(text.encode('utf-8'))
+            self._ids.append(node.node_id.encode('utf-8'))
+            self._metadata.append(self._encode_metadata(node))
+            self._fingerprint.add(node.node_id, text)
+            node_docs = node_document_ids(node)
+            codes = [self._doc_code(doc_id) for doc_id in node_docs]
+            self._doc_codes.append([codes[0]])
+            self._doc_pairs.append([[code, row] for code in codes])
+            span = self._doc_spans.setdefault(codes[0], [row, row])
+            span[1] = row
+            for key, column in self._features.items():
+                column.append([chunk_feature(node, key)])
+            self.num_chunks += 1
+
+    @staticmethod
+    def _encode_metadata(node: BaseNode) -> bytes:
+        return json.dumps(node_to_metadata_dict(node, remove_text=True), ensure_ascii=False).encode('utf-8')
+
+    def row(self, chunk_id: str) -> Optional[int]:
+        """Row of an appended chunk, None if it was not appended"""
+        key = chunk_id.encode('utf-8')
+        # Chunk id cố định "<file>#<vị trí>": chỉ quét dải dòng của tài liệu đó
+        span = self._doc_spans.get(self._doc_codes_by_id.get(document_id(chunk_id.rsplit('#', 1)[0])))
+        if span is not None:
+            for offset, stored in enumerate(self._ids.read(span[0], span[1] + 1)):
+                if stored == key:
+                    return span[0] + offset
+        # Id không theo dạng trên (index cũ): quét cả cột id theo block
+        for start in range(0, self.num_chunks, 4096):
+            stop = min(start + 4096, self.num_chunks)
+            for offset, stored in enumerate(self._ids.read(start, stop)):
+                if stored == key:
+                    return start + offset
+        return None
+
+    def get_node(self, chunk_id: str) -> BaseNode:
+        """Appended chunk (the updated node if update_nodes replaced it)"""
+        row = self.row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        if row in self._updated:
+            return self._updated[row]
+        text = self._texts.read(row, row + 1)[0].decode('utf-8')
+        metadata = json.loads(self._metadata.read(row, row + 1)[0])
+        try:
+            return metadata_dict_to_node(metadata, text=text)
+        except ValueError:
+            return TextNode(text=text, id_=chunk_id, metadata=metadata)
+
+    def vector(self, chunk_id: str) -> Optional[np.ndarray]:
+        """Appended (float32) vector of a chunk, None without a vector column or if the chunk was not appended"""
+        if self._vectors is None:
+            return None
+        row = self.row(chunk_id)
+        if row is None:
+            return None
+        return np.asarray(self._vectors.view()[row], dtype=np.float32)
+
+    def update_nodes(self, nodes: Iterable[BaseNode]):
+        """Replace the metadata of appended chunks (applied on close; text and vectors stay)"""
+        for node in nodes:
+            row = self.row(node.node_id)
+            if row is None:
+                raise KeyError(node.node_id)
+            self._updated[row] = node
+
+    def _apply_updates(self, block_rows: int = 1 << 16):
+        """Rewrite the metadata blob and the document pairs of updated chunks (streamed)"""
+        old_blob, old_ends = self._path("metadata.bin.old"), self._path("metadata.ends.old")
+        self._metadata.file.close()
+        self._metadata.ends.close()
+        os.replace(self._path("metadata.bin"), old_blob)
+        os.replace(self._metadata.ends.path, old_ends)
+        self._metadata = _BlobWriter(self._path("metadata.bin"))
+        ends = np.memmap(old_ends, dtype=np.int64, mode='r') if self.num_chunks else np.zeros(0, dtype=np.int64)
+        with open(old_blob, 'rb') as f:
+            start = 0
+            for row in range(self.num_chunks):
+                end = int(ends[row])
+                data = f.read(end - start)
+                start = end
+                node = self._updated.get(row)
+                self._metadata.append(self._encode_metadata(node) if node is not None else data)
+        del ends
+        os.remove(old_blob)
+        os.remove(old_ends)
+
+        # Tài liệu nguồn của chunk được cập nhật có thể đã đổi: bỏ cặp cũ, thêm cặp mới
+        old_pairs = self._path("doc_pairs.old")
+        self._doc_pairs.close()
+        os.replace(self._doc_pairs.path, old_pairs)
+        num_pairs = self._doc_pairs.rows
+        self._doc_pairs = _ColumnWriter(self._doc_pairs.path, np.int64, width=2)
+        pairs = np.memmap(old_pairs, dtype=np.int64, mode='r', shape=(num_pairs, 2)) if num_pairs \
+            else np.zeros((0, 2), dtype=np.int64)
+        updated_rows = np.fromiter(self._updated, dtype=np.int64, count=len(self._updated))
+        for start in range(0, num_pairs, block_rows):
+            block = pairs[start:start + block_rows]
+            self._doc_pairs.append(block[~np.isin(block[:, 1], updated_rows)])
+        del pairs
+        os.remove(old_pairs)
+        for row, node in self._updated.items():
+            self._doc_pairs.append([[self._doc_code(doc_id), row] for doc_id in node_document_ids(node)])
+
+    def close(self) -> ChunkStore:
+        """Finish the files and replace the previous store"""
+        if self._updated:
+            self._apply_updates()
+        self._texts.close(self._path("text_offsets.npy"))
+        self._ids.close(self._path("id_offsets.npy"))
+        self._metadata.close(self._path("metadata_offsets.npy"))
+        self._doc_codes.save(self._path("doc_codes.npy"))
+        for key, column in self._features.items():
+            column.save(self._path(f"feature_{key}.npy"))
+        if self._vectors is not None:
+            self._vectors.close()
+
+        # Bảng băm chunk id -> dòng (cùng định dạng StringTable với ids.bin / id_offsets.npy)
+        id_offsets = np.load(self._path("id_offsets.npy"), mmap_mode='r')
+        ids = np.memmap(self._path("ids.bin"), dtype=np.uint8, mode='r') if id_offsets[-1] else None
+        np.save(self._path("id_table.npy"), build_hash_table(
+            (ids[int(id_offsets[row]):int(id_offsets[row + 1])].tobytes() for row in range(self.num_chunks)),
+            self.num_chunks))
+        del ids, id_offsets
+
+        # CSR document -> dòng: sắp xếp cặp (mã tài liệu, dòng) theo mã rồi theo dòng
+        pairs = self._doc_pairs.view()
+        order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        doc_ptr = np.zeros(len(self._doc_codes_by_id) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs[:, 0], minlength=len(self._doc_codes_by_id)), out=doc_ptr[1:])
+        np.save(self._path("doc_ptr.npy"), doc_ptr)
+        np.save(self._path("doc_rows.npy"), np.asarray(pairs[order, 1], dtype=np.int64))
+        del pairs, order
+        self._doc_pairs.close()
+        os.remove(self._doc_pairs.path)
+        with open(self._path("doc_ids.json"), 'w', encoding='utf-8') as f:
+            json.dump(list(self._doc_codes_by_id), f, ensure_ascii=False)
+
+        # meta.json ghi sau cùng: có meta nghĩa là store đã ghi đủ
+        with open(self._path("meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": CHUNK_STORE_VERSION,
+                "num_chunks": self.num_chunks,
+                "fingerprint": self._fingerprint.hexdigest(),
+                "features": list(FEATURES),
+                "vector_dim": self.vector_dim,
+            }, f, indent=2)
+
+        old_dir = self.store_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.store_dir):
+            os.replace(self.store_dir, old_dir)
+        os.replace(self.tmp_dir, self.store_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        self.chunk_store = ChunkStore.load(self.store_dir)
+        return self.chunk_store
+
+    def abort(self):
+        """Drop the partially written store (the previous one is kept)"""
+        for writer in [self._texts, self._ids, self._metadata]:
+            writer.file.close()
+            writer.ends.close()
+        for column in [self._doc_codes, self._doc_pairs, self._vectors, *self._features.values()]:
+            if column is not None:
+                column.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
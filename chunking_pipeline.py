@@ -0,0 +1,109 @@
+"""
+Chunking Pipeline Module
+Chunk tài liệu song song trên process pool (mỗi tài liệu một task), node id cố định
+theo tài liệu + thứ tự chunk (vd. "Public_012#0007") để kết quả tái lập được
+"""
+
+import os
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+from llama_index.core.node_parser import MarkdownNodeParser, SentenceSplitter
+from llama_index.core.schema import BaseNode, Document
+
+from chunk_features import add_chunk_features
+
+logger = logging.getLogger(__name__)
+
+# Parser của mỗi worker process, tạo một lần theo (chunk_size, chunk_overlap)
+_worker_transformations = {}
+
+
+def build_transformations(chunk_size: int, chunk_overlap: int) -> List:
+    """Structure-aware Markdown parsing followed by sentence-level splitting"""
+    return [
+        MarkdownNodeParser(),
+        SentenceSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            paragraph_separator="\n\n",
+            secondary_chunking_regex="[.!?。！？]"  # Vietnamese support
+        ),
+    ]
+
+
+def chunk_node_id(file_name: str, position: int) -> str:
+    """Deterministic chunk id: file stem + position of the chunk in the document"""
+    return f"{os.path.splitext(os.path.basename(file_name))[0]}#{position:04d}"
+
+
+def chunk_document(document: Document, chunk_size: int, chunk_overlap: int) -> List[BaseNode]:
+    """Chunk one document (runs inside a worker process)"""
+    key = (chunk_size, chunk_overlap)
+    if key not in _worker_transformations:
+        _worker_transformations[key] = build_transformations(chunk_size, chunk_overlap)
+
+    # Id tài liệu nguồn (ref_doc_id của chunk) cũng cố định theo tên file
+    file_name = document.metadata.get('file_name', document.doc_id)
+    document.id_ = os.path.splitext(os.path.basename(file_name))[0]
+
+    nodes = [document]
+    for transformation in _worker_transformations[key]:
+        nodes = transformation(nodes)
+
+    # Đổi id ngẫu nhiên thành id theo thứ tự, cập nhật cả quan hệ prev/next/parent/child
+    new_ids = {node.node_id: chunk_node_id(file_name, position) for position, node in enumerate(nodes)}
+    for node in nodes:
+        node.id_ = new_ids[node.node_id]
+        for relationship in node.relationships.values():
+            for related in (relationship if isinstance(relationship, list) else [relationship]):
+                if related.node_id in new_ids:
+                    related.node_id = new_ids[related.node_id]
+
+    add_chunk_features(nodes)
+    return nodes
+
+
+def worker_context() -> multiprocessing.context.BaseContext:
+    """
+    Start context for chunking workers
+
+    Không dùng fork: process cha có thể đã khởi tạo CUDA / thread của tokenizer.
+    forkserver (nếu có) fork worker từ một server đã preload __main__ và module này, nên
+    script chính chỉ được import một lần ở server thay vì lại ở mỗi worker như spawn.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["__main__", __name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def iter_document_chunks(documents: Iterable[Document], chunk_size: int, chunk_overlap: int,
+                         num_workers: int = 4, max_pending: int = 16
+                         ) -> Iterator[Tuple[Document, List[BaseNode]]]:
+    """
+    Yield (document, chunks) in document order while workers keep chunking ahead
+
+    Tối đa `max_pending` tài liệu đang chờ (hàng đợi có giới hạn): phía tiêu thụ
+    (embedding) chạy song song với chunking mà bộ nhớ không tăng theo corpus.
+    num_workers <= 1: chunk tuần tự trong process hiện tại.
+    """
+    if num_workers <= 1:
+        for document in documents:
+            yield document, chunk_document(document, chunk_size, chunk_overlap)
+        return
+
+    context = worker_context()
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context) as executor:
+        pending = deque()
+        for document in documents:
+            pending.append((document, executor.submit(chunk_document, document, chunk_size, chunk_overlap)))
+            if len(pending) >= max_pending:
+                document, future = pending.popleft()
+                yield document, future.result()
+        for document, future in pending:
+            yield document, future.result()
@@ -0,0 +1,73 @@
+"""
+Document Index Module
+Gắn document id (vd. "public_012" cho Public_012.md) vào metadata lúc ingest
+và map document id -> chunk ids để lọc retrieval theo tài liệu
+"""
+
+import os
+import re
+from typing import Dict, List, Optional
+
+from llama_index.core.schema import BaseNode
+
+# Không dùng key "doc_id": node_to_metadata_dict ghi đè key này bằng ref_doc_id
+DOC_ID_KEY = "source_doc_id"
+# Chunk đại diện cho các chunk gần trùng: document id của mọi tài liệu nguồn
+SOURCE_DOCS_KEY = "source_docs"
+
+QUESTION_DOC_PATTERN = re.compile(r'public[_-](\d+)', re.IGNORECASE)
+
+
+def document_id(file_name: str) -> str:
+    """Normalized document id of a file ("Public-012.md" -> "public_012")"""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    return stem.strip().lower().replace('-', '_')
+
+
+def question_document_id(question: str) -> Optional[str]:
+    """Document id referenced by a question ("... trong Public_012 ..."), None if there is none"""
+    match = QUESTION_DOC_PATTERN.search(question)
+    return f"public_{match.group(1)}" if match else None
+
+
+def add_document_ids(documents: List):
+    """Store the document id in each loaded document's metadata (inherited by its chunks)"""
+    for doc in documents:
+        doc.metadata[DOC_ID_KEY] = document_id(doc.metadata.get('file_name', ''))
+        # Không đưa vào text khi embed / prompt để embedding (và cache) không đổi
+        if DOC_ID_KEY not in doc.excluded_embed_metadata_keys:
+            doc.excluded_embed_metadata_keys.append(DOC_ID_KEY)
+        if DOC_ID_KEY not in doc.excluded_llm_metadata_keys:
+            doc.excluded_llm_metadata_keys.append(DOC_ID_KEY)
+
+
+def node_document_id(node: BaseNode) -> str:
+    """Document id of a chunk (falls back to file_name for chunks indexed before doc ids existed)"""
+    metadata = node.metadata or {}
+    return metadata.get(DOC_ID_KEY) or document_id(metadata.get('file_name', ''))
+
+
+def node_document_ids(node: BaseNode) -> List[str]:
+    """Every document a chunk stands for (more than one when near-duplicates were collapsed into it)"""
+    return (node.metadata or {}).get(SOURCE_DOCS_KEY) or [node_document_id(node)]
+
+
+class DocumentChunkIndex:
+    """document id -> ids of its chunks, in ingest order"""
+
+    def __init__(self, chunks: Dict[str, List[str]] = None):
+        self.chunks = chunks or {}
+
+    @classmethod
+    def build(cls, nodes: List[BaseNode]) -> 'DocumentChunkIndex':
+        chunks: Dict[str, List[str]] = {}
+        for node in nodes:
+            for doc_id in node_document_ids(node):
+                chunks.setdefault(doc_id, []).append(node.node_id)
+        return cls(chunks)
+
+    def chunk_ids(self, doc_id: str) -> List[str]:
+        return self.chunks.get(doc_id, [])
+
+    def __len__(self) -> int:
+        return len(self.chunks)
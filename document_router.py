@@ -0,0 +1,114 @@
+"""
+Document Router Module
+Tầng trên của index hai tầng: mỗi tài liệu một entry (embedding trung bình các chunk
++ BM25 trên toàn văn), chọn top-N tài liệu rồi mới tìm chunk trong các tài liệu đó
+"""
+
+import os
+import json
+import logging
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+from bm25_index import BM25Index, nodes_fingerprint
+from document_index import DocumentChunkIndex
+
+logger = logging.getLogger(__name__)
+
+ROUTER_FORMAT_VERSION = 1
+
+
+class DocumentRouter:
+    """
+    First-stage document routing: alpha * cosine(query, document embedding)
+    + (1 - alpha) * BM25 (chuẩn hóa theo điểm cao nhất của query)
+
+    Layout trong router_dir:
+        meta.json       - fingerprint của tập chunk, alpha
+        doc_ids.json    - document id theo thứ tự dòng
+        embeddings.npy  - embedding tài liệu (n_docs x dim), đã chuẩn hóa
+        bm25/           - BM25Index với mỗi tài liệu là một cột
+    """
+
+    def __init__(self, doc_ids: List[str], embeddings: np.ndarray, bm25_index: BM25Index,
+                 fingerprint: str = None, alpha: float = 0.5):
+        self.doc_ids = doc_ids
+        self.embeddings = embeddings
+        self.bm25_index = bm25_index
+        self.fingerprint = fingerprint
+        self.alpha = alpha
+
+    @classmethod
+    def build(cls, nodes: List[BaseNode], chunk_embeddings: np.ndarray,
+              alpha: float = 0.5) -> 'DocumentRouter':
+        """Build document entries from chunks and their embeddings (row i = nodes[i])"""
+        rows = {node.node_id: row for row, node in enumerate(nodes)}
+        document_index = DocumentChunkIndex.build(nodes)
+        doc_ids = sorted(document_index.chunks)
+
+        embeddings, texts = [], []
+        for doc_id in doc_ids:
+            doc_rows = [rows[chunk_id] for chunk_id in document_index.chunk_ids(doc_id)]
+            embeddings.append(np.asarray(chunk_embeddings[doc_rows], dtype=np.float32).mean(axis=0))
+            texts.append("\n\n".join(nodes[row].get_content(metadata_mode=MetadataMode.EMBED) for row in doc_rows))
+
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(doc_ids), -1)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return cls(doc_ids, embeddings, BM25Index.build(doc_ids, texts),
+                   fingerprint=nodes_fingerprint(nodes), alpha=alpha)
+
+    def save(self, router_dir: str):
+        os.makedirs(router_dir, exist_ok=True)
+        np.save(os.path.join(router_dir, "embeddings.npy"), self.embeddings)
+        with open(os.path.join(router_dir, "doc_ids.json"), 'w', encoding='utf-8') as f:
+            json.dump(self.doc_ids, f, ensure_ascii=False)
+        self.bm25_index.save(os.path.join(router_dir, "bm25"))
+        # meta.json ghi sau cùng: có meta nghĩa là router đã ghi đủ
+        with open(os.path.join(router_dir, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": ROUTER_FORMAT_VERSION,
+                "num_docs": len(self.doc_ids),
+                "alpha": self.alpha,
+                "fingerprint": self.fingerprint,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, router_dir: str) -> Optional['DocumentRouter']:
+        """Open a saved router, None if missing or unreadable"""
+        meta_path = os.path.join(router_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("version") != ROUTER_FORMAT_VERSION:
+                return None
+            with open(os.path.join(router_dir, "doc_ids.json"), 'r', encoding='utf-8') as f:
+                doc_ids = json.load(f)
+            embeddings = np.load(os.path.join(router_dir, "embeddings.npy"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load document router from {router_dir}: {e}")
+            return None
+        bm25_index = BM25Index.load(os.path.join(router_dir, "bm25"))
+        if bm25_index is None:
+            return None
+        return cls(doc_ids, embeddings, bm25_index, fingerprint=meta.get("fingerprint"),
+                   alpha=meta.get("alpha", 0.5))
+
+    def route(self, query: str, query_embedding: List[float], top_n: int = 3) -> List[Tuple[str, float]]:
+        """Top-N (document id, score) for a query"""
+        if not self.doc_ids or top_n <= 0:
+            return []
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_vector /= (np.linalg.norm(query_vector) or 1.0)
+        scores = self.alpha * (self.embeddings @ query_vector)
+
+        keyword_scores = self.bm25_index.score_batch([query])[0]
+        if keyword_scores.max() > 0:
+            scores += (1 - self.alpha) * keyword_scores / keyword_scores.max()
+
+        top = np.argsort(-scores, kind='stable')[:top_n]
+        return [(self.doc_ids[row], float(scores[row])) for row in top]
@@ -0,0 +1,237 @@
+"""
+Embedding Cache Module
+Cache embedding theo nội dung (content-addressed) lưu trên đĩa dạng float16 memmap
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 16  # Độ dài digest (blake2b) cho mỗi text
+
+
+def text_key(text: str) -> bytes:
+    """Hash a text into a fixed-size binary key"""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding cache
+
+    Layout trong cache_dir (mỗi namespace = model + instruction + max_length):
+        <namespace>.json  - tham số sinh namespace và số chiều vector
+        <namespace>.keys  - digest 16 byte của từng text, nối tiếp nhau (index file)
+        <namespace>.f16   - ma trận float16 (n_rows x dim), dòng i ứng với key thứ i
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, instruction: str = None,
+                 max_length: int = None):
+        self.cache_dir = cache_dir
+        self.params = {
+            "model_name": model_name,
+            "instruction": instruction,
+            "max_length": max_length,
+        }
+        namespace_source = json.dumps(self.params, sort_keys=True)
+        self.namespace = hashlib.sha1(namespace_source.encode('utf-8')).hexdigest()[:16]
+
+        os.makedirs(cache_dir, exist_ok=True)
+        base_path = os.path.join(cache_dir, self.namespace)
+        self.meta_path = base_path + ".json"
+        self.keys_path = base_path + ".keys"
+        self.vectors_path = base_path + ".f16"
+
+        self.dim: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._n_rows = 0  # Số dòng trên đĩa (có thể > len(_rows) nếu có key trùng)
+        self._vectors: Optional[np.memmap] = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()  # Dùng chung giữa retriever và các luồng ingest
+        self._load()
+
+    def _load(self):
+        """Load key index and memory-map the vector file"""
+        if not os.path.exists(self.meta_path):
+            return
+
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            self.dim = json.load(f)["dim"]
+
+        keys = b''
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'rb') as f:
+                keys = f.read()
+
+        # Số dòng hợp lệ = min(số key, số vector) - bỏ qua phần ghi dở nếu bị ngắt
+        row_bytes = self.dim * 2
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        n_rows = min(len(keys) // KEY_BYTES, vector_rows)
+        self._truncate(n_rows)
+
+        for row in range(n_rows):
+            self._rows[keys[row * KEY_BYTES:(row + 1) * KEY_BYTES]] = row
+        self._n_rows = n_rows
+        self._open_vectors(n_rows)
+
+    def _truncate(self, n_rows: int):
+        """Cắt bỏ dữ liệu thừa ở cuối file để key và vector luôn khớp dòng"""
+        for path, row_bytes in ((self.keys_path, KEY_BYTES), (self.vectors_path, self.dim * 2)):
+            if os.path.exists(path) and os.path.getsize(path) > n_rows * row_bytes:
+                with open(path, 'r+b') as f:
+                    f.truncate(n_rows * row_bytes)
+
+    def _open_vectors(self, n_rows: int):
+        """(Re)open the float16 memmap with the given number of rows"""
+        if n_rows == 0:
+            self._vectors = None
+            return
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r',
+                                  shape=(n_rows, self.dim))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts, None for cache misses"""
+        keys = [text_key(text) for text in texts]
+        results = []
+        with self._lock:
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(self._vectors[row].astype(np.float32).tolist())
+        return results
+
+    def put_many(self, texts: List[str], embeddings: List[List[float]]):
+        """Append new embeddings to the cache files"""
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            new_rows: Dict[bytes, int] = {}
+            new_vectors = []
+            for key, embedding in zip(keys, embeddings):
+                if key in self._rows or key in new_rows:
+                    continue
+                new_rows[key] = self._n_rows + len(new_rows)
+                new_vectors.append(embedding)
+
+            if not new_rows:
+                return
+
+            matrix = np.asarray(new_vectors, dtype=np.float16)
+            if self.dim is not None and matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dim {matrix.shape[1]} does not match cache dim {self.dim}")
+            if self.dim is None:
+                with open(self.meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({"dim": matrix.shape[1], **self.params}, f, ensure_ascii=False, indent=2)
+                self.dim = matrix.shape[1]
+
+            # Ghi vector trước rồi mới ghi key, để key luôn trỏ tới vector đã có trên đĩa;
+            # ghi lỗi thì cắt file về số dòng cũ, _rows chỉ nhận key mới sau khi ghi xong
+            try:
+                with open(self.vectors_path, 'ab') as f:
+                    f.write(matrix.tobytes())
+                with open(self.keys_path, 'ab') as f:
+                    f.write(b''.join(new_rows))
+            except OSError:
+                self._truncate(self._n_rows)
+                raise
+
+            self._rows.update(new_rows)
+            self._n_rows += len(new_rows)
+            self._open_vectors(self._n_rows)
+
+    def stats(self) -> Dict:
+        """Cache size and hit/miss counters"""
+        return {
+            "entries": len(self._rows),
+            "hits": self.hits,
+            "misses": self.misses,
+            "size_mb": (len(self._rows) * (self.dim or 0) * 2) / 1024**2,
+        }
+
+
+def normalize_query(text: str) -> str:
+    """Normalize a query so near-duplicates (unicode form, whitespace) share a key"""
+    # Không casefold: Qwen3-Embedding phân biệt hoa/thường nên "CPU" và "cpu" cho vector khác nhau
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded, thread-safe LRU cache of query embeddings keyed on normalized query text
+
+    Nếu có `persistent` (EmbeddingCache), miss ở LRU sẽ tra tiếp trên đĩa và mọi embedding
+    mới đều được ghi xuống, để các lần chạy evaluation sau không embed lại cùng query.
+    """
+
+    def __init__(self, max_size: int = 4096, persistent: Optional[EmbeddingCache] = None):
+        self.max_size = max_size
+        self.persistent = persistent
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """Return cached embedding (and mark it recently used), None on miss"""
+        key = normalize_query(text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+
+        embedding = self.persistent.get_many([key])[0] if self.persistent is not None else None
+        with self._lock:
+            if embedding is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, embedding)
+        return embedding
+
+    def put(self, text: str, embedding: List[float]):
+        """Insert embedding, evicting the least recently used entry when full"""
+        key = normalize_query(text)
+        with self._lock:
+            self._insert(key, embedding)
+        if self.persistent is not None:
+            self.persistent.put_many([key], [embedding])
+
+    def _insert(self, key: str, embedding: List[float]):
+        """Insert under the lock, evicting least recently used entries beyond max_size"""
+        self._entries[key] = embedding
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """Cache size and hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
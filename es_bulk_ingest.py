@@ -0,0 +1,157 @@
+"""
+Elasticsearch Bulk Ingest Module
+Ghi chunk vào Elasticsearch bằng nhiều bulk request song song khi build index: tắt refresh
+và replica trong lúc ghi (khôi phục sau khi xong), retry với backoff khi bị 429
+"""
+
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from elasticsearch import Elasticsearch, helpers
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+logger = logging.getLogger(__name__)
+
+# Setting của index trong lúc ingest: không refresh, không replica
+INGEST_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+
+
+class ElasticsearchBulkWriter:
+    """
+    Parallel bulk writer producing the same documents as ElasticsearchStore.add
+
+    Mỗi lần write được chia thành các bulk request `bulk_size` document, gửi trên
+    `threads` thread; write không chờ request xong (tối đa 2 * threads request đang chờ),
+    nên embedding window kế tiếp chạy song song với việc ghi. Dùng như context manager:
+    vào thì tắt refresh/replica, ra thì chờ ghi xong, khôi phục setting cũ và refresh.
+    """
+
+    def __init__(self, es_client: Elasticsearch, index_name: str, text_field: str, vector_field: str,
+                 index_mappings: Callable[[int], Dict], bulk_size: int = 500, threads: int = 4,
+                 max_retries: int = 5, initial_backoff: float = 2.0, max_backoff: float = 60.0):
+        self.es_client = es_client
+        self.index_name = index_name
+        self.text_field = text_field
+        self.vector_field = vector_field
+        self.index_mappings = index_mappings  # số chiều vector -> mappings khi phải tạo index
+        self.bulk_size = bulk_size
+        self.threads = threads
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self._executor = None
+        self._pending = deque()
+        self._index_ready = False
+        self._restore_settings = None
+        self._errors: List[Dict] = []
+        self.num_written = 0
+        self.num_updated = 0
+        self.start_time = None
+
+    def __enter__(self) -> 'ElasticsearchBulkWriter':
+        self.start_time = time.time()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="es-bulk")
+        if self.es_client.indices.exists(index=self.index_name):
+            self._apply_ingest_settings()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self._wait(0)
+        finally:
+            self._executor.shutdown(wait=True)
+            if self._restore_settings is not None:
+                # null = về giá trị mặc định của cluster
+                self.es_client.indices.put_settings(index=self.index_name, settings=self._restore_settings)
+                self.es_client.indices.refresh(index=self.index_name)
+        if self._errors and exc_type is None:
+            raise helpers.BulkIndexError(f"{len(self._errors)} document(s) failed to index", self._errors)
+
+    def _apply_ingest_settings(self):
+        response = self.es_client.indices.get_settings(index=self.index_name)
+        current = next(iter(response.values()))["settings"]["index"]
+        self._restore_settings = {key: current.get(key) for key in INGEST_SETTINGS}
+        self.es_client.indices.put_settings(index=self.index_name, settings=INGEST_SETTINGS)
+
+    def _create_index(self, num_dimensions: int):
+        # Index mới tạo thẳng với setting ingest, khôi phục về mặc định khi xong
+        self.es_client.indices.create(
+            index=self.index_name,
+            mappings=self.index_mappings(num_dimensions),
+            settings=INGEST_SETTINGS,
+        )
+        self._restore_settings = {key: None for key in INGEST_SETTINGS}
+
+    def _action(self, node: BaseNode, embedding: List[float]) -> Dict:
+        return {
+            "_op_type": "index",
+            "_index": self.index_name,
+            "_id": node.node_id,
+            self.text_field: node.get_content(metadata_mode=MetadataMode.NONE),
+            "metadata": node_to_metadata_dict(node, remove_text=True),
+            self.vector_field: embedding,
+        }
+
+    def _send(self, actions: List[Dict]) -> Tuple[int, List[Dict]]:
+        # helpers.bulk retry với exponential backoff khi ES trả về 429
+        return helpers.bulk(
+            self.es_client,
+            actions,
+            chunk_size=len(actions),
+            max_retries=self.max_retries,
+            initial_backoff=self.initial_backoff,
+            max_backoff=self.max_backoff,
+            raise_on_error=False,
+            raise_on_exception=True,
+        )
+
+    def _wait(self, max_pending: int):
+        # Chờ đến khi còn tối đa max_pending request, thu luôn các request đã xong
+        while self._pending and (len(self._pending) > max_pending or self._pending[0][0].done()):
+            future, is_update = self._pending.popleft()
+            success, errors = future.result()
+            if is_update:
+                self.num_updated += success
+            else:
+                self.num_written += success
+            if errors:
+                logger.error(f"Bulk request failed for {len(errors)} document(s), first error: {errors[0]}")
+                self._errors.extend(errors)
+
+    def _submit(self, actions: List[Dict], is_update: bool = False):
+        for start in range(0, len(actions), self.bulk_size):
+            future = self._executor.submit(self._send, actions[start:start + self.bulk_size])
+            self._pending.append((future, is_update))
+            # Giới hạn số request đang chờ để bộ nhớ không tăng khi ES chậm hơn embedding
+            self._wait(2 * self.threads)
+
+    def write(self, nodes: List[BaseNode], embeddings: List[List[float]]):
+        """Queue nodes (with their embeddings) for indexing, without waiting for the requests"""
+        if not nodes:
+            return
+        if not self._index_ready:
+            if not self.es_client.indices.exists(index=self.index_name):
+                self._create_index(len(embeddings[0]))
+            self._index_ready = True
+        self._submit([self._action(node, embedding) for node, embedding in zip(nodes, embeddings)])
+
+    def update_metadata(self, nodes: List[BaseNode]):
+        """Queue partial updates replacing the metadata of already indexed nodes"""
+        self._submit([
+            {
+                "_op_type": "update",
+                "_index": self.index_name,
+                "_id": node.node_id,
+                "doc": {"metadata": node_to_metadata_dict(node, remove_text=True)},
+            }
+            for node in nodes
+        ], is_update=True)
+
+    def docs_per_second(self) -> float:
+        elapsed = time.time() - self.start_time
+        return self.num_written / elapsed if elapsed > 0 else 0.0
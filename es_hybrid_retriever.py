@@ -0,0 +1,162 @@
+"""
+Elasticsearch Hybrid Retriever Module
+Hybrid search chạy hoàn toàn phía Elasticsearch: một request gồm kNN + match,
+gộp kết quả bằng RRF hoặc cộng điểm có trọng số (tương đương HYBRID_ALPHA).
+Nhiều query được gửi chung một request _msearch.
+"""
+
+import logging
+from typing import Any, Dict, List
+
+from elasticsearch import Elasticsearch
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.vector_stores.elasticsearch.utils import convert_es_hit_to_node
+
+logger = logging.getLogger(__name__)
+
+
+def msearch(es_client: Elasticsearch, index_name: str, bodies: List[Dict[str, Any]],
+            vector_field: str = "embedding") -> List[Dict[str, Any]]:
+    """
+    Send many search bodies in a single _msearch request
+
+    Trả về response của từng body theo đúng thứ tự; body lỗi được log và trả về
+    kết quả rỗng để không làm hỏng cả batch.
+    """
+    if not bodies:
+        return []
+    searches = []
+    for body in bodies:
+        searches.append({"index": index_name})
+        searches.append({**body, "_source": {"excludes": [vector_field]}})
+
+    responses = es_client.msearch(searches=searches)["responses"]
+    for i, response in enumerate(responses):
+        if "error" in response:
+            logger.error(f"_msearch item {i} failed: {response['error']}")
+            responses[i] = {"hits": {"hits": []}}
+    return responses
+
+
+def msearch_knn(es_client: Elasticsearch, index_name: str, query_embeddings: List[List[float]],
+                top_k: int, text_field: str = "content", vector_field: str = "embedding",
+                num_candidates: int = None) -> List[List[NodeWithScore]]:
+    """kNN search for many query vectors in one _msearch (same query shape as ElasticsearchStore)"""
+    num_candidates = num_candidates or top_k * 10
+    bodies = [
+        {
+            "knn": {
+                "field": vector_field,
+                "query_vector": embedding,
+                "k": top_k,
+                "num_candidates": num_candidates,
+            },
+            "size": top_k,
+        }
+        for embedding in query_embeddings
+    ]
+    return [
+        [NodeWithScore(node=convert_es_hit_to_node(hit, text_field), score=float(hit["_score"] or 0.0))
+         for hit in response["hits"]["hits"]]
+        for response in msearch(es_client, index_name, bodies, vector_field)
+    ]
+
+
+class ElasticsearchHybridRetriever(BaseRetriever):
+    """
+    Server-side hybrid retrieval (kNN on the vector field + BM25 match on the text field)
+
+    fusion="linear": score = alpha * knn_score + (1 - alpha) * bm25_score (boost của từng
+                     nhánh, giống cách HybridRetriever gộp điểm trong Python)
+    fusion="rrf":    reciprocal rank fusion của Elasticsearch (cần ES hỗ trợ `rank.rrf`)
+    """
+
+    def __init__(self, es_client: Elasticsearch, index_name: str, embed_model: BaseEmbedding,
+                 text_field: str = "content", vector_field: str = "embedding",
+                 alpha: float = 0.5, top_k: int = 10, num_candidates: int = 100,
+                 fusion: str = "linear", rrf_rank_constant: int = 60):
+        super().__init__()
+        if fusion not in ("linear", "rrf"):
+            raise ValueError(f"Unknown hybrid fusion: {fusion}")
+        self.es_client = es_client
+        self.index_name = index_name
+        self.embed_model = embed_model
+        self.text_field = text_field
+        self.vector_field = vector_field
+        self.alpha = alpha  # 0.0 = chỉ keyword, 1.0 = chỉ vector
+        self.top_k = top_k
+        self.num_candidates = max(num_candidates, top_k)
+        self.fusion = fusion
+        self.rrf_rank_constant = rrf_rank_constant
+
+    def build_search_body(self, query_str: str, query_embedding: List[float],
+                          es_filter: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        Search request combining knn and match for one query
+
+        es_filter (vd. term trên document id) được áp cho cả hai nhánh: kNN lọc trước
+        khi chọn ứng viên, match nằm trong bool.filter.
+        """
+        knn = {
+            "field": self.vector_field,
+            "query_vector": query_embedding,
+            "k": self.top_k,
+            "num_candidates": self.num_candidates,
+        }
+        match = {"match": {self.text_field: {"query": query_str}}}
+        query = match
+        if es_filter is not None:
+            knn["filter"] = es_filter
+            query = {"bool": {"must": [match], "filter": [es_filter]}}
+        body = {"knn": knn, "query": query, "size": self.top_k}
+
+        if self.fusion == "rrf":
+            body["rank"] = {"rrf": {"window_size": self.num_candidates,
+                                    "rank_constant": self.rrf_rank_constant}}
+        else:
+            knn["boost"] = self.alpha
+            match["match"][self.text_field]["boost"] = 1 - self.alpha
+        return body
+
+    def _hit_score(self, hit: Dict[str, Any]) -> float:
+        score = hit.get("_score")
+        if score is None and hit.get("_rank") is not None:
+            # Một số phiên bản ES không trả _score khi dùng RRF, chỉ có _rank (bắt đầu từ 1)
+            score = 1.0 / (self.rrf_rank_constant + hit["_rank"])
+        return float(score or 0.0)
+
+    def _to_nodes(self, response: Dict[str, Any]) -> List[NodeWithScore]:
+        return [
+            NodeWithScore(node=convert_es_hit_to_node(hit, self.text_field), score=self._hit_score(hit))
+            for hit in response["hits"]["hits"]
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.search(query_bundle.query_str, query_bundle.embedding)
+
+    def search(self, query_str: str, query_embedding: List[float] = None,
+               es_filter: Dict[str, Any] = None) -> List[NodeWithScore]:
+        """One hybrid search request, optionally restricted by an ES filter clause"""
+        if query_embedding is None:
+            query_embedding = self.embed_model.get_query_embedding(query_str)
+        body = self.build_search_body(query_str, query_embedding, es_filter)
+        response = self.es_client.search(
+            index=self.index_name,
+            source_excludes=[self.vector_field],
+            **body,
+        )
+        return self._to_nodes(response)
+
+    def retrieve_many(self, queries: List[str]) -> List[List[NodeWithScore]]:
+        """Hybrid search for many queries: one batched embedding call, one _msearch"""
+        if hasattr(self.embed_model, "get_query_embedding_batch"):
+            embeddings = self.embed_model.get_query_embedding_batch(queries)
+        else:
+            embeddings = [self.embed_model.get_query_embedding(query) for query in queries]
+        bodies = [self.build_search_body(query, embedding) for query, embedding in zip(queries, embeddings)]
+        return [
+            self._to_nodes(response)
+            for response in msearch(self.es_client, self.index_name, bodies, self.vector_field)
+        ]
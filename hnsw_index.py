@@ -0,0 +1,434 @@
+"""
+HNSW Index Module
+Đồ thị HNSW (Hierarchical Navigable Small World) cho tìm kiếm gần đúng
+trên ma trận embedding đã chuẩn hóa (similarity = inner product)
+"""
+
+import os
+import math
+import pickle
+import logging
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib  # Optional: build/search graph bằng C++ đa luồng
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# Số node được mở rộng cùng lúc mỗi vòng beam search (gom neighbor để tính similarity theo batch)
+EXPAND_BATCH = 16
+
+
+class HNSWIndex:
+    """
+    Approximate nearest-neighbour graph over the rows of a vector matrix
+
+    Index không giữ bản sao vector: vector được đọc qua `get_vectors(rows)`
+    (thường là memmap của LocalVectorStore), graph chỉ lưu id các dòng.
+    Cài đặt numpy thuần: đủ cho corpus vài chục nghìn chunk, corpus lớn hơn nên
+    dùng HnswlibIndex (build nhanh hơn nhiều lần).
+    """
+
+    library = "numpy"
+
+    def __init__(self, get_vectors: Callable[[np.ndarray], np.ndarray],
+                 m: int = 16, ef_construction: int = 200, ef_search: int = 64,
+                 seed: int = 42):
+        self.get_vectors = get_vectors
+        self.m = m
+        self.m0 = 2 * m  # Số neighbor tối đa ở layer 0
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1.0 / math.log(max(m, 2))
+        self.rng = np.random.default_rng(seed)
+
+        self.levels = np.zeros(0, dtype=np.int8)
+        self.layer0 = np.full((0, self.m0), -1, dtype=np.int32)
+        # Layer >= 1: level -> {row: np.ndarray neighbor rows}
+        self.upper_layers: List[dict] = []
+        self.entry_point = -1
+        self.max_level = -1
+
+    @property
+    def size(self) -> int:
+        return len(self.levels)
+
+    def _similarities(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self.get_vectors(rows), dtype=np.float32) @ query
+
+    def _neighbors(self, row: int, level: int) -> np.ndarray:
+        if level == 0:
+            neighbors = self.layer0[row]
+            return neighbors[neighbors >= 0]
+        return self.upper_layers[level - 1].get(row, np.zeros(0, dtype=np.int32))
+
+    def _neighbor_rows(self, rows: np.ndarray, level: int) -> np.ndarray:
+        """Neighbours of many rows at once (flattened, padding removed)"""
+        if level == 0:
+            neighbors = self.layer0[rows].ravel()
+            return neighbors[neighbors >= 0]
+        layer = self.upper_layers[level - 1]
+        return np.concatenate([layer.get(row, np.zeros(0, dtype=np.int32)) for row in rows.tolist()])
+
+    def _set_neighbors(self, row: int, level: int, neighbors: np.ndarray):
+        if level == 0:
+            self.layer0[row] = -1
+            self.layer0[row, :len(neighbors)] = neighbors
+        else:
+            self.upper_layers[level - 1][row] = np.asarray(neighbors, dtype=np.int32)
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[Tuple[float, int]],
+                      ef: int, level: int) -> List[Tuple[float, int]]:
+        """
+        Beam search in one layer, returns up to ef (similarity, row) pairs
+
+        Mỗi vòng mở rộng cùng lúc tối đa EXPAND_BATCH kết quả tốt nhất chưa mở rộng:
+        neighbor của cả batch được gom lại, lọc visited và tính similarity bằng một
+        phép nhân ma trận thay vì duyệt từng node bằng heap.
+        """
+        result_rows = np.asarray([row for _, row in entry_points], dtype=np.int64)
+        result_sims = np.asarray([sim for sim, _ in entry_points], dtype=np.float32)
+        expanded = np.zeros(len(result_rows), dtype=bool)
+        visited = np.zeros(self.size, dtype=bool)
+        visited[result_rows] = True
+
+        while not expanded.all():
+            # Kết quả luôn >= kết quả kém nhất nên mọi node chưa mở rộng đều là candidate hợp lệ
+            frontier = np.flatnonzero(~expanded)
+            if len(frontier) > EXPAND_BATCH:
+                frontier = frontier[np.argpartition(-result_sims[frontier], EXPAND_BATCH - 1)[:EXPAND_BATCH]]
+            expanded[frontier] = True
+
+            neighbors = np.unique(self._neighbor_rows(result_rows[frontier], level))
+            neighbors = neighbors[~visited[neighbors]]
+            if len(neighbors) == 0:
+                continue
+            visited[neighbors] = True
+
+            sims = self._similarities(query, neighbors)
+            if len(result_rows) >= ef:
+                keep = sims > result_sims.min()
+                neighbors, sims = neighbors[keep], sims[keep]
+                if len(neighbors) == 0:
+                    continue
+
+            result_rows = np.concatenate([result_rows, neighbors])
+            result_sims = np.concatenate([result_sims, sims])
+            expanded = np.concatenate([expanded, np.zeros(len(neighbors), dtype=bool)])
+            if len(result_rows) > ef:
+                top = np.argpartition(-result_sims, ef - 1)[:ef]
+                result_rows, result_sims, expanded = result_rows[top], result_sims[top], expanded[top]
+
+        order = np.argsort(-result_sims)
+        return list(zip(result_sims[order].tolist(), result_rows[order].tolist()))
+
+    def _select_neighbors(self, candidates: List[Tuple[float, int]], max_neighbors: int) -> List[int]:
+        """Neighbour selection heuristic (keeps diverse directions, HNSW paper alg. 4)"""
+        if len(candidates) <= max_neighbors:
+            return [row for _, row in candidates]
+
+        rows = np.asarray([row for _, row in candidates], dtype=np.int64)
+        sims = np.asarray([sim for sim, _ in candidates], dtype=np.float32)
+        vectors = np.asarray(self.get_vectors(rows), dtype=np.float32)
+
+        # Candidate chỉ được nhận nếu gần query hơn mọi neighbor đã chọn: mỗi lần nhận một
+        # neighbor thì đánh dấu luôn (vector hoá) mọi candidate gần neighbor đó hơn gần query
+        blocked = np.zeros(len(rows), dtype=bool)
+        selected: List[int] = []
+        for i in range(len(rows)):
+            if len(selected) >= max_neighbors:
+                break
+            if blocked[i]:
+                continue
+            selected.append(i)
+            blocked |= (vectors @ vectors[i]) > sims
+
+        # Bù thêm candidate gần nhất nếu heuristic chọn quá ít
+        if len(selected) < max_neighbors:
+            chosen = set(selected)
+            selected += [i for i in range(len(candidates)) if i not in chosen][:max_neighbors - len(selected)]
+        return [int(rows[i]) for i in selected]
+
+    def add(self, rows: np.ndarray):
+        """Insert rows (must be the next consecutive row ids) into the graph"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        if rows[0] != self.size or np.any(np.diff(rows) != 1):
+            raise ValueError("HNSW rows must be appended in order")
+
+        new_levels = np.floor(-np.log(self.rng.random(len(rows))) * self.level_mult).astype(np.int8)
+        self.levels = np.concatenate([self.levels, new_levels])
+        self.layer0 = np.vstack([self.layer0, np.full((len(rows), self.m0), -1, dtype=np.int32)])
+
+        for row, level in zip(rows.tolist(), new_levels.tolist()):
+            self._insert(row, level)
+
+    def _insert(self, row: int, level: int):
+        while len(self.upper_layers) < level:
+            self.upper_layers.append({})
+
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = row, level
+            return
+
+        query = np.asarray(self.get_vectors(np.array([row])), dtype=np.float32)[0]
+        entry_sim = float(self._similarities(query, np.array([self.entry_point]))[0])
+        entry_points = [(entry_sim, self.entry_point)]
+
+        # Đi xuống greedy ở các layer cao hơn level của node mới
+        for layer in range(self.max_level, level, -1):
+            entry_points = self._search_layer(query, entry_points, 1, layer)
+
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(query, entry_points, self.ef_construction, layer)
+            max_neighbors = self.m0 if layer == 0 else self.m
+            neighbors = self._select_neighbors(candidates, self.m)
+            self._set_neighbors(row, layer, np.asarray(neighbors, dtype=np.int32))
+
+            # Nối 2 chiều
+            for neighbor in neighbors:
+                self._connect(neighbor, row, layer, max_neighbors)
+            entry_points = candidates
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = row, level
+
+    def _connect(self, row: int, new_neighbor: int, level: int, max_neighbors: int):
+        """Add an edge row -> new_neighbor, re-selecting neighbours if the list is full"""
+        neighbors = np.append(self._neighbors(row, level), new_neighbor).astype(np.int64)
+        if len(neighbors) <= max_neighbors:
+            self._set_neighbors(row, level, neighbors)
+            return
+        query = np.asarray(self.get_vectors(np.array([row])), dtype=np.float32)[0]
+        sims = self._similarities(query, neighbors)
+        candidates = sorted(zip(sims.tolist(), neighbors.tolist()), reverse=True)
+        self._set_neighbors(row, level, np.asarray(self._select_neighbors(candidates, max_neighbors)))
+
+    def search(self, query: np.ndarray, top_k: int, ef: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k search, returns (rows, similarities) sorted by similarity"""
+        if self.entry_point < 0 or top_k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        query = np.asarray(query, dtype=np.float32)
+        ef = max(ef or self.ef_search, top_k)
+        entry_sim = float(self._similarities(query, np.array([self.entry_point]))[0])
+        entry_points = [(entry_sim, self.entry_point)]
+        for layer in range(self.max_level, 0, -1):
+            entry_points = self._search_layer(query, entry_points, 1, layer)
+        results = self._search_layer(query, entry_points, ef, 0)[:top_k]
+
+        rows = np.asarray([row for _, row in results], dtype=np.int64)
+        sims = np.asarray([sim for sim, _ in results], dtype=np.float32)
+        return rows, sims
+
+    def remap(self, keep_rows: List[int]):
+        """
+        Drop deleted rows and renumber the rest after store compaction
+
+        Node bị xóa được gỡ khỏi neighbor list của các node còn lại (không nối lại
+        cạnh), nên khi xóa nhiều nên build lại graph để giữ recall.
+        """
+        keep_rows = np.asarray(keep_rows, dtype=np.int64)
+        mapping = np.full(self.size + 1, -1, dtype=np.int32)  # mapping[-1] = -1 cho ô padding
+        mapping[keep_rows] = np.arange(len(keep_rows), dtype=np.int32)
+
+        layer0 = mapping[self.layer0[keep_rows]]
+        # Dồn neighbor hợp lệ lên đầu mỗi dòng
+        order = np.argsort(layer0 < 0, axis=1, kind='stable')
+        self.layer0 = np.take_along_axis(layer0, order, axis=1)
+        self.levels = self.levels[keep_rows]
+
+        for level, layer in enumerate(self.upper_layers):
+            remapped = {}
+            for row, neighbors in layer.items():
+                if mapping[row] < 0:
+                    continue
+                new_neighbors = mapping[neighbors]
+                remapped[int(mapping[row])] = new_neighbors[new_neighbors >= 0]
+            self.upper_layers[level] = remapped
+
+        if len(keep_rows) == 0:
+            self.entry_point, self.max_level = -1, -1
+            self.upper_layers = []
+        elif mapping[self.entry_point] >= 0:
+            self.entry_point = int(mapping[self.entry_point])
+        else:
+            self.entry_point = int(np.argmax(self.levels))
+            self.max_level = int(self.levels[self.entry_point])
+            self.upper_layers = self.upper_layers[:self.max_level]
+
+    def save(self, path: str):
+        """Persist graph structure (vectors are not stored)"""
+        upper_rows, upper_levels, upper_neighbors = [], [], []
+        for level, layer in enumerate(self.upper_layers, start=1):
+            for row, neighbors in layer.items():
+                padded = np.full(self.m, -1, dtype=np.int32)
+                padded[:len(neighbors)] = neighbors[:self.m]
+                upper_rows.append(row)
+                upper_levels.append(level)
+                upper_neighbors.append(padded)
+
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            library=np.array(self.library),
+            params=np.array([self.m, self.ef_construction, self.ef_search, self.entry_point, self.max_level]),
+            levels=self.levels,
+            layer0=self.layer0,
+            upper_rows=np.asarray(upper_rows, dtype=np.int64),
+            upper_levels=np.asarray(upper_levels, dtype=np.int64),
+            upper_neighbors=np.asarray(upper_neighbors, dtype=np.int32).reshape(-1, self.m),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, get_vectors: Callable[[np.ndarray], np.ndarray],
+             ef_search: Optional[int] = None) -> 'HNSWIndex':
+        """Load a persisted graph"""
+        data = np.load(path)
+        m, ef_construction, saved_ef_search, entry_point, max_level = data["params"].tolist()
+        index = cls(get_vectors, m=m, ef_construction=ef_construction,
+                    ef_search=ef_search or saved_ef_search)
+        index.levels = data["levels"]
+        index.layer0 = data["layer0"]
+        index.entry_point, index.max_level = entry_point, max_level
+        index.upper_layers = [{} for _ in range(max(max_level, 0))]
+        for row, level, neighbors in zip(data["upper_rows"].tolist(), data["upper_levels"].tolist(),
+                                         data["upper_neighbors"]):
+            index.upper_layers[level - 1][row] = neighbors[neighbors >= 0]
+        return index
+
+
+class HnswlibIndex:
+    """
+    HNSW graph backed by hnswlib (optional dependency), same interface as HNSWIndex
+
+    hnswlib giữ bản sao float32 của vector trong RAM (và trong file lưu). Label của
+    hnswlib không đổi được nên giữ bảng label -> dòng: remap chỉ cập nhật bảng này và
+    đánh dấu xóa label của dòng bị bỏ.
+    """
+
+    library = "hnswlib"
+
+    def __init__(self, get_vectors: Callable[[np.ndarray], np.ndarray],
+                 m: int = 16, ef_construction: int = 200, ef_search: int = 64,
+                 seed: int = 42):
+        if hnswlib is None:
+            raise ImportError("hnswlib is not installed (pip install hnswlib)")
+        self.get_vectors = get_vectors
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.seed = seed
+        self.index = None  # Tạo khi biết số chiều (lần add đầu tiên)
+        self.label_rows = np.zeros(0, dtype=np.int64)  # label -> dòng hiện tại, -1 = đã xóa
+        self.size = 0
+
+    def _init_index(self, dim: int, max_elements: int):
+        self.index = hnswlib.Index(space='ip', dim=dim)
+        self.index.init_index(max_elements=max_elements, M=self.m,
+                              ef_construction=self.ef_construction, random_seed=self.seed)
+        self.index.set_ef(self.ef_search)
+
+    def add(self, rows: np.ndarray):
+        """Insert rows (must be the next consecutive row ids) into the graph"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        if rows[0] != self.size or np.any(np.diff(rows) != 1):
+            raise ValueError("HNSW rows must be appended in order")
+
+        vectors = np.asarray(self.get_vectors(rows), dtype=np.float32)
+        labels = np.arange(len(self.label_rows), len(self.label_rows) + len(rows), dtype=np.int64)
+        if self.index is None:
+            self._init_index(vectors.shape[1], len(rows))
+        elif len(self.label_rows) + len(rows) > self.index.get_max_elements():
+            # Tăng gấp đôi để các lần add nhỏ liên tiếp không resize liên tục
+            self.index.resize_index(max(len(self.label_rows) + len(rows), 2 * self.index.get_max_elements()))
+        self.index.add_items(vectors, labels)
+        self.label_rows = np.concatenate([self.label_rows, rows])
+        self.size += len(rows)
+
+    def search(self, query: np.ndarray, top_k: int, ef: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k search, returns (rows, similarities) sorted by similarity"""
+        top_k = min(top_k, self.size)
+        if self.index is None or top_k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        self.index.set_ef(max(ef or self.ef_search, top_k))
+        labels, distances = self.index.knn_query(np.asarray(query, dtype=np.float32).reshape(1, -1), k=top_k)
+        # space 'ip': distance = 1 - inner product
+        return self.label_rows[labels[0].astype(np.int64)], (1.0 - distances[0]).astype(np.float32)
+
+    def remap(self, keep_rows: List[int]):
+        """Drop deleted rows and renumber the rest after store compaction"""
+        keep_rows = np.asarray(keep_rows, dtype=np.int64)
+        mapping = np.full(self.size + 1, -1, dtype=np.int64)  # mapping[-1] = -1 cho label đã xóa
+        mapping[keep_rows] = np.arange(len(keep_rows), dtype=np.int64)
+
+        new_label_rows = mapping[self.label_rows]
+        for label in np.flatnonzero((new_label_rows < 0) & (self.label_rows >= 0)).tolist():
+            self.index.mark_deleted(label)
+        self.label_rows = new_label_rows
+        self.size = len(keep_rows)
+
+    def save(self, path: str):
+        """Persist the hnswlib index (including its vector copy) and the label table"""
+        tmp_path = path + ".tmp.npz"
+        blob = pickle.dumps(self.index) if self.index is not None else b''
+        np.savez(
+            tmp_path,
+            library=np.array(self.library),
+            params=np.array([self.m, self.ef_construction, self.ef_search, self.size]),
+            label_rows=self.label_rows,
+            index=np.frombuffer(blob, dtype=np.uint8),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, get_vectors: Callable[[np.ndarray], np.ndarray],
+             ef_search: Optional[int] = None) -> 'HnswlibIndex':
+        """Load a persisted index"""
+        data = np.load(path)
+        m, ef_construction, saved_ef_search, size = data["params"].tolist()
+        index = cls(get_vectors, m=m, ef_construction=ef_construction,
+                    ef_search=ef_search or saved_ef_search)
+        index.label_rows = data["label_rows"]
+        index.size = size
+        if data["index"].size:
+            index.index = pickle.loads(data["index"].tobytes())
+            index.index.set_ef(index.ef_search)
+        return index
+
+
+HNSW_LIBRARIES = {HNSWIndex.library: HNSWIndex, HnswlibIndex.library: HnswlibIndex}
+
+
+def resolve_hnsw_library(library: str) -> str:
+    """Map "auto" to hnswlib when it is installed, numpy otherwise"""
+    if library == "auto":
+        return HnswlibIndex.library if hnswlib is not None else HNSWIndex.library
+    if library not in HNSW_LIBRARIES:
+        raise ValueError(f"Unknown HNSW library: {library}")
+    return library
+
+
+def create_hnsw_index(get_vectors: Callable[[np.ndarray], np.ndarray], library: str = "auto", **kwargs):
+    """Create an empty HNSW index with the given implementation ("auto", "numpy", "hnswlib")"""
+    return HNSW_LIBRARIES[resolve_hnsw_library(library)](get_vectors, **kwargs)
+
+
+def load_hnsw_index(path: str, get_vectors: Callable[[np.ndarray], np.ndarray],
+                    ef_search: Optional[int] = None):
+    """Load a graph saved by HNSWIndex.save or HnswlibIndex.save"""
+    with np.load(path) as data:
+        # File cũ (trước khi có hnswlib) không có trường library
+        library = str(data["library"]) if "library" in data.files else HNSWIndex.library
+    if library == HnswlibIndex.library and hnswlib is None:
+        raise ImportError("HNSW index was built with hnswlib, which is not installed")
+    return HNSW_LIBRARIES[library].load(path, get_vectors, ef_search=ef_search)
@@ -0,0 +1,128 @@
+"""
+Index Manifest Module
+Lưu hash nội dung từng file + tham số build để cập nhật index theo từng file
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+
+MANIFEST_VERSION = 1
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """Compute SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """Per-file manifest (content hash, chunk count) plus build parameters of an index"""
+
+    def __init__(self, index_name: str, build_params: Dict, files: Dict[str, Dict] = None):
+        self.index_name = index_name
+        # Tham số ảnh hưởng tới chunk/embedding (model, chunk size, overlap, ...)
+        self.build_params = dict(build_params)
+        # file_name -> {"sha256": ..., "size": ..., "num_chunks": ..., "duplicate_sources": [...]}
+        self.files = files or {}
+
+    @classmethod
+    def from_directory(cls, index_name: str, build_params: Dict, document_path: str,
+                       extension: str = '.md') -> 'IndexManifest':
+        """Scan a document directory and hash every matching file"""
+        files = {}
+        for file_name in sorted(os.listdir(document_path)):
+            if not file_name.endswith(extension):
+                continue
+            file_path = os.path.join(document_path, file_name)
+            files[file_name] = {
+                "sha256": hash_file(file_path),
+                "size": os.path.getsize(file_path),
+            }
+        return cls(index_name, build_params, files)
+
+    @classmethod
+    def load(cls, manifest_path: str) -> 'IndexManifest':
+        """Load manifest from JSON file, return None if missing or unreadable"""
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(data["index_name"], data["build_params"], data.get("files", {}))
+
+    def save(self, manifest_path: str):
+        """Write manifest atomically (write temp file then rename)"""
+        directory = os.path.dirname(manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        data = {
+            "version": MANIFEST_VERSION,
+            "index_name": self.index_name,
+            "updated_at": datetime.now().isoformat(),
+            "build_params": self.build_params,
+            "files": self.files,
+        }
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    def is_compatible(self, other: 'IndexManifest') -> bool:
+        """Check whether two manifests were built with the same parameters"""
+        return self.index_name == other.index_name and self.build_params == other.build_params
+
+    def diff(self, current: 'IndexManifest') -> Tuple[List[str], List[str], List[str]]:
+        """
+        So sánh manifest đã lưu với trạng thái hiện tại của thư mục
+
+        Returns:
+            (added, changed, removed) - danh sách tên file
+        """
+        added = [name for name in current.files if name not in self.files]
+        changed = [
+            name for name, entry in current.files.items()
+            if name in self.files and self.files[name].get("sha256") != entry["sha256"]
+        ]
+        removed = [name for name in self.files if name not in current.files]
+        return added, changed, removed
+
+    def set_chunk_counts(self, chunk_counts: Dict[str, int]):
+        """Record number of stored chunks per file"""
+        for file_name, count in chunk_counts.items():
+            if file_name in self.files:
+                self.files[file_name]["num_chunks"] = count
+
+    def set_duplicate_sources(self, duplicate_sources: Dict[str, List[str]]):
+        """Record, per file, the other files whose near-duplicate chunks were collapsed into its chunks"""
+        for file_name, sources in duplicate_sources.items():
+            if file_name in self.files:
+                merged = set(self.files[file_name].get("duplicate_sources", [])) | set(sources)
+                self.files[file_name]["duplicate_sources"] = sorted(merged)
+
+    def dependent_files(self, file_names: List[str]) -> List[str]:
+        """
+        Files that lose chunks when the chunks of `file_names` are deleted
+
+        Chunk trùng của một file chỉ được lưu ở file giữ chunk đại diện, nên xóa chunk
+        của file đó thì các file kia cũng phải index lại (lan truyền tới khi đủ).
+        """
+        dependents, queue = set(), list(file_names)
+        while queue:
+            entry = self.files.get(queue.pop(), {})
+            for source in entry.get("duplicate_sources", []):
+                if source not in dependents and source not in file_names:
+                    dependents.add(source)
+                    queue.append(source)
+        return sorted(dependents)
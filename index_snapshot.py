@@ -0,0 +1,131 @@
+"""
+Index Snapshot Module
+Snapshot nhị phân của index (text + metadata + vector của từng chunk) để chuyển index sang
+máy khác / khôi phục vào Elasticsearch hoặc local vector store mà không cần embed lại
+"""
+
+import os
+import json
+import zlib
+import struct
+import logging
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from llama_index.core.schema import BaseNode, MetadataMode, TextNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"MCQSNAP\0"
+SNAPSHOT_VERSION = 1
+VECTOR_DTYPES = ("float32", "float16")
+# Header của file: độ dài header JSON; header của block: số chunk, số byte record (zlib), số byte vector
+HEADER_LENGTH = struct.Struct("<I")
+BLOCK_HEADER = struct.Struct("<IQQ")
+
+
+class SnapshotWriter:
+    """
+    Write a snapshot block by block (one block per write call)
+
+    Layout: magic, header JSON, rồi các block gồm record JSON nén zlib
+    ([id, text, metadata] mỗi chunk) và ma trận vector thô (n x dim); block rỗng đánh dấu hết
+    file. Ghi vào file tạm, chỉ đổi tên khi close thành công.
+    """
+
+    def __init__(self, path: str, header: Dict, vector_dtype: str = "float32"):
+        if vector_dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unsupported snapshot vector dtype: {vector_dtype}")
+        self.path = path
+        self.vector_dtype = vector_dtype
+        self.num_chunks = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, 'wb')
+
+        header = dict(header, version=SNAPSHOT_VERSION, vector_dtype=vector_dtype)
+        data = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        self._file.write(SNAPSHOT_MAGIC)
+        self._file.write(HEADER_LENGTH.pack(len(data)))
+        self._file.write(data)
+
+    def __enter__(self) -> 'SnapshotWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+    def write(self, nodes: List[BaseNode], embeddings: np.ndarray):
+        """Append one block of chunks with their embeddings (row i = nodes[i])"""
+        if not nodes:
+            return
+        records = [
+            [node.node_id, node.get_content(metadata_mode=MetadataMode.NONE),
+             node_to_metadata_dict(node, remove_text=True)]
+            for node in nodes
+        ]
+        payload = zlib.compress(json.dumps(records, ensure_ascii=False).encode('utf-8'))
+        vectors = np.ascontiguousarray(embeddings, dtype=self.vector_dtype).tobytes()
+        self._file.write(BLOCK_HEADER.pack(len(nodes), len(payload), len(vectors)))
+        self._file.write(payload)
+        self._file.write(vectors)
+        self.num_chunks += len(nodes)
+
+    def close(self):
+        self._file.write(BLOCK_HEADER.pack(0, 0, 0))
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+
+class SnapshotReader:
+    """Read the header and stream the blocks of a snapshot file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not an index snapshot")
+            (length,) = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+            self.header: Dict = json.loads(f.read(length))
+            self._data_offset = f.tell()
+        if self.header.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {self.header.get('version')}")
+        self.vector_dtype = self.header["vector_dtype"]
+
+    @staticmethod
+    def _node(record: List) -> BaseNode:
+        node_id, text, metadata = record
+        try:
+            return metadata_dict_to_node(metadata, text=text)
+        except ValueError:
+            return TextNode(text=text, id_=node_id, metadata=metadata)
+
+    def iter_blocks(self, with_vectors: bool = True) -> Iterator[Tuple[List[BaseNode], np.ndarray]]:
+        """Yield (nodes, float32 embeddings) per block; embeddings are None when with_vectors=False"""
+        with open(self.path, 'rb') as f:
+            f.seek(self._data_offset)
+            while True:
+                num_chunks, payload_size, vectors_size = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+                if num_chunks == 0:
+                    return
+                records = json.loads(zlib.decompress(f.read(payload_size)))
+                nodes = [self._node(record) for record in records]
+                if not with_vectors:
+                    f.seek(vectors_size, os.SEEK_CUR)
+                    yield nodes, None
+                    continue
+                vectors = np.frombuffer(f.read(vectors_size), dtype=self.vector_dtype)
+                yield nodes, vectors.reshape(num_chunks, -1).astype(np.float32)
+
+    def iter_nodes(self) -> Iterator[BaseNode]:
+        """Stream the chunks without reading their vectors"""
+        for nodes, _ in self.iter_blocks(with_vectors=False):
+            yield from nodes
@@ -0,0 +1,730 @@
+"""
+Local Vector Store Module
+Vector store chạy trong process (không cần Elasticsearch):
+embedding lưu dạng ma trận memmap, metadata lưu trong file sidecar
+"""
+
+import os
+import json
+import time
+import hashlib
+import shutil
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+from pydantic import PrivateAttr
+
+from llama_index.core.schema import BaseNode, TextNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import (
+    metadata_dict_to_node,
+    node_to_metadata_dict,
+)
+
+from hnsw_index import HNSWIndex, HnswlibIndex, create_hnsw_index, load_hnsw_index, resolve_hnsw_library
+from quantization import (
+    Quantizer,
+    create_quantizer,
+    evaluate_quantizer,
+    load_quantizer,
+    save_quantizer,
+)
+
+logger = logging.getLogger(__name__)
+
+HEADER_FILE = "store.json"
+VECTORS_FILE = "vectors.bin"
+SIDECAR_FILE = "chunks.jsonl"
+HNSW_FILE = "hnsw.npz"
+QUANTIZED_FILE = "quantized.npz"
+
+# Số vector tối đa dùng để train quantizer
+QUANTIZER_TRAIN_SIZE = 100000
+
+# Xóa quá tỷ lệ này số node của graph thì build lại HNSW thay vì gỡ node
+HNSW_REBUILD_DELETE_RATIO = 0.3
+
+
+def _id_hash(node_id: str) -> int:
+    """64-bit hash of a node id (key of the id -> row lookup)"""
+    return int.from_bytes(hashlib.blake2b(node_id.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+def _encode_record(node_id: str, text: str, metadata: Dict) -> bytes:
+    """One sidecar line"""
+    record = {"id": node_id, "text": text, "metadata": metadata}
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8')
+
+
+def _record_prefix(node_id: str) -> bytes:
+    """Bytes every sidecar line of this node id starts with (id is the first key)"""
+    return ('{"id": ' + json.dumps(node_id, ensure_ascii=False) + ',').encode('utf-8')
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """
+    In-process vector store with exact (flat) or approximate (HNSW) top-k search
+
+    Layout trong persist_dir:
+        store.json   - số chiều và dtype của ma trận
+        vectors.bin  - ma trận embedding (n_rows x dim), dòng i ứng với dòng i của sidecar
+        chunks.jsonl - mỗi dòng một chunk: id, text, metadata (dạng node_to_metadata_dict)
+        hnsw.npz     - graph HNSW (chỉ khi index_type="hnsw")
+        quantized.npz - tham số quantizer + mã nén của từng dòng (chỉ khi quantization != "none")
+
+    vectors.bin / chunks.jsonl được append ở mỗi add; graph HNSW và mã nén chỉ cập nhật
+    trong RAM và được ghi khi gọi persist() (cuối build), nên mỗi window không phải ghi lại
+    toàn bộ file. Nếu process dừng trước persist, lần load sau chèn/encode nốt các dòng thiếu.
+
+    Text / metadata không được nạp vào RAM: chunks.jsonl được memory-map, process chỉ giữ
+    offset byte của từng dòng và hash 64-bit của id (sắp xếp sẵn để tra id -> dòng), record
+    chỉ được parse khi cần (kết quả query, filter theo metadata).
+    """
+
+    stores_text: bool = True
+    persist_dir: str
+    dtype: str = "float32"
+    search_block_size: int = 65536
+    index_type: str = "flat"
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+    hnsw_library: str = "auto"
+    quantization: str = "none"
+    rescore_factor: int = 4
+    pq_subvector_dim: int = 8
+
+    _dim: Optional[int] = PrivateAttr(default=None)
+    _vectors: Optional[np.memmap] = PrivateAttr(default=None)
+    _sidecar: Optional[np.memmap] = PrivateAttr(default=None)
+    # _offsets[i]:_offsets[i + 1] = byte range của dòng i trong chunks.jsonl
+    _offsets: np.ndarray = PrivateAttr(default_factory=lambda: np.zeros(1, dtype=np.int64))
+    _id_hashes: np.ndarray = PrivateAttr(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    # Hash đã sắp xếp và dòng tương ứng: tra id -> dòng bằng binary search
+    _sorted_hashes: np.ndarray = PrivateAttr(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    _hash_order: np.ndarray = PrivateAttr(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    _hnsw: Optional[Union[HNSWIndex, HnswlibIndex]] = PrivateAttr(default=None)
+    _quantizer: Optional[Quantizer] = PrivateAttr(default=None)
+    _codes: Optional[np.ndarray] = PrivateAttr(default=None)
+    _unsaved: Set[str] = PrivateAttr(default_factory=set)  # HNSW_FILE / QUANTIZED_FILE chưa ghi
+
+    def __init__(self, persist_dir: str, dtype: str = "float32",
+                 search_block_size: int = 65536, index_type: str = "flat",
+                 hnsw_m: int = 16, hnsw_ef_construction: int = 200,
+                 hnsw_ef_search: int = 64, hnsw_library: str = "auto", quantization: str = "none",
+                 rescore_factor: int = 4, pq_subvector_dim: int = 8, **kwargs: Any) -> None:
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported dtype: {dtype}")
+        if index_type not in ("flat", "hnsw"):
+            raise ValueError(f"Unsupported index type: {index_type}")
+        if quantization not in ("none", "int8", "binary", "pq"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        if index_type == "hnsw" and quantization != "none":
+            # Search HNSW đọc vector float, mã nén sẽ không bao giờ được dùng
+            logger.warning(f"Quantization '{quantization}' is not used with index_type='hnsw', ignoring it")
+            quantization = "none"
+        super().__init__(persist_dir=persist_dir, dtype=dtype,
+                         search_block_size=search_block_size, index_type=index_type,
+                         hnsw_m=hnsw_m, hnsw_ef_construction=hnsw_ef_construction,
+                         hnsw_ef_search=hnsw_ef_search, hnsw_library=resolve_hnsw_library(hnsw_library),
+                         quantization=quantization,
+                         rescore_factor=rescore_factor, pq_subvector_dim=pq_subvector_dim, **kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._load()
+        self._sync_hnsw()
+        self._sync_codes()
+        self.persist()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @staticmethod
+    def exists(persist_dir: str) -> bool:
+        """Check whether a store has been written to persist_dir"""
+        return os.path.exists(os.path.join(persist_dir, HEADER_FILE))
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.persist_dir, file_name)
+
+    def _load(self):
+        """Load sidecar metadata and memory-map the vector matrix"""
+        header_path = self._path(HEADER_FILE)
+        if not os.path.exists(header_path):
+            return
+
+        with open(header_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        self._dim = header["dim"]
+        if header["dtype"] != self.dtype:
+            logger.warning(f"Store was written as {header['dtype']}, ignoring configured dtype {self.dtype}")
+            self.dtype = header["dtype"]
+
+        # Quét sidecar một lần để lấy offset + hash id của từng dòng (record không được giữ lại)
+        node_ids, lengths, pending = [], [], 0
+        with open(self._path(SIDECAR_FILE), 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    pending += len(line)  # Dòng trống gộp vào record kế tiếp (json bỏ qua khoảng trắng)
+                    continue
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError
+                    node_ids.append(json.loads(line)["id"])
+                except ValueError:
+                    break  # Dòng cuối ghi dở
+                lengths.append(pending + len(line))
+                pending = 0
+                if len(node_ids) >= self.search_block_size:
+                    self._index_rows(node_ids, lengths)
+                    node_ids, lengths = [], []
+        self._index_rows(node_ids, lengths)
+        self._open_sidecar()
+
+        # Chỉ giữ các dòng có đủ cả vector và metadata
+        row_bytes = self._dim * np.dtype(self.dtype).itemsize
+        vector_rows = os.path.getsize(self._path(VECTORS_FILE)) // row_bytes
+        sidecar_complete = int(self._offsets[-1]) + pending == os.path.getsize(self._path(SIDECAR_FILE))
+        if vector_rows != self.count() or not sidecar_complete:
+            n_rows = min(vector_rows, self.count())
+            logger.warning(f"Local vector store is inconsistent, keeping first {n_rows} rows")
+            self._rewrite(list(range(n_rows)))
+        else:
+            self._open_vectors()
+
+    def _index_rows(self, node_ids: List[str], lengths: List[int]):
+        """Register rows appended to the sidecar: byte offsets and id hashes"""
+        if not node_ids:
+            return
+        first_row = self.count()
+        self._offsets = np.concatenate([
+            self._offsets, self._offsets[-1] + np.cumsum(np.asarray(lengths, dtype=np.int64))])
+        hashes = np.fromiter(map(_id_hash, node_ids), dtype=np.int64, count=len(node_ids))
+        rows = np.arange(first_row, first_row + len(node_ids), dtype=np.int64)
+        self._id_hashes = np.concatenate([self._id_hashes, hashes])
+
+        # Chèn vào mảng đã sắp xếp (O(n) mỗi lần add thay vì sắp xếp lại cả mảng)
+        order = np.argsort(hashes, kind='stable')
+        positions = np.searchsorted(self._sorted_hashes, hashes[order], side='right')
+        self._sorted_hashes = np.insert(self._sorted_hashes, positions, hashes[order])
+        self._hash_order = np.insert(self._hash_order, positions, rows[order])
+
+    def _reset_rows(self, id_hashes: np.ndarray, lengths: np.ndarray):
+        """Replace the row index after the sidecar has been rewritten"""
+        self._offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self._id_hashes = np.asarray(id_hashes, dtype=np.int64)
+        self._hash_order = np.argsort(self._id_hashes, kind='stable')
+        self._sorted_hashes = self._id_hashes[self._hash_order]
+
+    def _open_sidecar(self):
+        """(Re)open the memmap over the indexed part of the sidecar"""
+        self._sidecar = None
+        if self.count():
+            self._sidecar = np.memmap(self._path(SIDECAR_FILE), dtype=np.uint8, mode='r',
+                                      shape=(int(self._offsets[-1]),))
+
+    def _record_bytes(self, row: int) -> bytes:
+        return self._sidecar[int(self._offsets[row]):int(self._offsets[row + 1])].tobytes()
+
+    def _record(self, row: int) -> Dict:
+        """Parse the sidecar record (id, text, metadata) of a row"""
+        return json.loads(self._record_bytes(row))
+
+    def _find_rows(self, node_ids: List[str]) -> List[Optional[int]]:
+        """Rows of node ids (None if not stored): binary search on the hash, then check the record's id"""
+        if not node_ids or not self.count():
+            return [None] * len(node_ids)
+        hashes = np.fromiter(map(_id_hash, node_ids), dtype=np.int64, count=len(node_ids))
+        starts = np.searchsorted(self._sorted_hashes, hashes, side='left')
+        ends = np.searchsorted(self._sorted_hashes, hashes, side='right')
+        rows = []
+        for node_id, start, end in zip(node_ids, starts.tolist(), ends.tolist()):
+            prefix = _record_prefix(node_id)
+            rows.append(next((int(row) for row in self._hash_order[start:end]
+                              if self._record_bytes(int(row)).lstrip().startswith(prefix)), None))
+        return rows
+
+    def _open_vectors(self):
+        """(Re)open the memmap over the current number of rows"""
+        if not self.count():
+            self._vectors = None
+            return
+        self._vectors = np.memmap(self._path(VECTORS_FILE), dtype=self.dtype, mode='r',
+                                  shape=(self.count(), self._dim))
+
+    def _vector_rows(self, rows: np.ndarray) -> np.ndarray:
+        return self._vectors[rows]
+
+    def _sync_hnsw(self):
+        """Load the persisted HNSW graph and insert any rows it does not cover yet"""
+        if self.index_type != "hnsw":
+            return
+
+        if self._hnsw is None:
+            hnsw_path = self._path(HNSW_FILE)
+            if os.path.exists(hnsw_path):
+                try:
+                    hnsw = load_hnsw_index(hnsw_path, self._vector_rows, ef_search=self.hnsw_ef_search)
+                except ImportError as e:
+                    logger.warning(f"{e}, rebuilding HNSW graph")
+                    hnsw = None
+                # Graph build với tham số / thư viện khác hoặc lệch với store thì build lại
+                if hnsw is not None and hnsw.library == self.hnsw_library \
+                        and (hnsw.m, hnsw.ef_construction) == (self.hnsw_m, self.hnsw_ef_construction) \
+                        and hnsw.size <= self.count():
+                    self._hnsw = hnsw
+            if self._hnsw is None:
+                self._hnsw = create_hnsw_index(self._vector_rows, library=self.hnsw_library,
+                                               m=self.hnsw_m, ef_construction=self.hnsw_ef_construction,
+                                               ef_search=self.hnsw_ef_search)
+
+        n_missing = self.count() - self._hnsw.size
+        if n_missing <= 0:
+            return
+        start_time = time.time()
+        self._hnsw.add(np.arange(self._hnsw.size, self.count()))
+        self._unsaved.add(HNSW_FILE)
+        logger.info(f"HNSW: inserted {n_missing} vectors in {time.time() - start_time:.2f}s "
+                    f"(graph size {self._hnsw.size})")
+
+    def _sync_codes(self):
+        """Load persisted codes, training the quantizer if needed, and encode rows without codes"""
+        if self.quantization == "none" or not self.count():
+            return
+
+        if self._quantizer is None:
+            quantized_path = self._path(QUANTIZED_FILE)
+            if os.path.exists(quantized_path):
+                quantizer, codes = load_quantizer(quantized_path)
+                if quantizer.kind == self.quantization and len(codes) <= self.count() \
+                        and getattr(quantizer, "subvector_dim", self.pq_subvector_dim) == self.pq_subvector_dim:
+                    self._quantizer, self._codes = quantizer, codes
+            if self._quantizer is None:
+                self.train_quantizer()
+                return
+
+        n_missing = self.count() - len(self._codes)
+        if n_missing <= 0:
+            return
+        new_codes = [
+            self._quantizer.encode(np.asarray(self._vectors[start:start + self.search_block_size], dtype=np.float32))
+            for start in range(len(self._codes), self.count(), self.search_block_size)
+        ]
+        self._codes = np.concatenate([self._codes] + new_codes)
+        self._unsaved.add(QUANTIZED_FILE)
+
+    def train_quantizer(self):
+        """(Re)train the quantizer on the stored vectors and re-encode every row"""
+        if self.quantization == "none" or not self.count():
+            return
+
+        start_time = time.time()
+        n_rows = self.count()
+        if n_rows > QUANTIZER_TRAIN_SIZE:
+            sample_rows = np.sort(np.random.default_rng(0).choice(n_rows, QUANTIZER_TRAIN_SIZE, replace=False))
+            sample = np.asarray(self._vectors[sample_rows], dtype=np.float32)
+        else:
+            sample = np.asarray(self._vectors, dtype=np.float32)
+
+        self._quantizer = create_quantizer(self.quantization, **(
+            {"subvector_dim": self.pq_subvector_dim} if self.quantization == "pq" else {}))
+        self._quantizer.train(sample)
+        self._codes = np.zeros((0, self._quantizer.bytes_per_vector(self._dim)), dtype=np.uint8)
+        self._sync_codes()
+        self.persist()
+        logger.info(f"Quantizer '{self.quantization}' trained and {n_rows} vectors encoded "
+                    f"in {time.time() - start_time:.2f}s")
+
+    def quantization_report(self, num_queries: int = 100, top_k: int = 10) -> Optional[Dict]:
+        """Index size and recall@k of the quantized first pass, before and after rescoring"""
+        if self._codes is None:
+            return None
+        # Truyền memmap nguyên dtype lưu trữ: size đúng với float16 và không chép cả ma trận
+        return evaluate_quantizer(self._vectors, self._quantizer, self._codes,
+                                  num_queries=num_queries, top_k=top_k,
+                                  rescore_factor=self.rescore_factor,
+                                  block_size=self.search_block_size)
+
+    def count(self) -> int:
+        """Number of stored chunks"""
+        return len(self._offsets) - 1
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """Append nodes (with embeddings) to the store files"""
+        if not nodes:
+            return []
+
+        matrix = np.asarray([node.get_embedding() for node in nodes], dtype=self.dtype)
+        if self._dim is None:
+            self._dim = matrix.shape[1]
+            with open(self._path(HEADER_FILE), 'w', encoding='utf-8') as f:
+                json.dump({"dim": self._dim, "dtype": self.dtype}, f)
+        elif matrix.shape[1] != self._dim:
+            raise ValueError(f"Embedding dim {matrix.shape[1]} does not match store dim {self._dim}")
+
+        # Node id đã tồn tại thì xóa bản cũ trước (upsert)
+        existing = [node.node_id for node, row in zip(nodes, self._find_rows([node.node_id for node in nodes]))
+                    if row is not None]
+        if existing:
+            self.delete_nodes(node_ids=existing)
+
+        node_ids = [node.node_id for node in nodes]
+        lines = [
+            _encode_record(node.node_id, node.get_content(), node_to_metadata_dict(node, remove_text=True))
+            for node in nodes
+        ]
+
+        # Ghi vector trước, metadata sau
+        with open(self._path(VECTORS_FILE), 'ab') as f:
+            f.write(matrix.tobytes())
+        with open(self._path(SIDECAR_FILE), 'ab') as f:
+            f.write(b''.join(lines))
+
+        self._index_rows(node_ids, [len(line) for line in lines])
+        self._open_sidecar()
+        self._open_vectors()
+        self._sync_hnsw()
+        self._sync_codes()
+        return node_ids
+
+    def _rewrite(self, keep_rows: List[int]):
+        """Compact store files, keeping only the given rows"""
+        old_vectors = None
+        if keep_rows:
+            old_vectors = np.array(
+                np.memmap(self._path(VECTORS_FILE), dtype=self.dtype, mode='r',
+                          shape=(max(keep_rows) + 1, self._dim))[keep_rows]
+            )
+        tmp_vectors = self._path(VECTORS_FILE + ".tmp")
+        tmp_sidecar = self._path(SIDECAR_FILE + ".tmp")
+        with open(tmp_vectors, 'wb') as f:
+            if old_vectors is not None:
+                f.write(old_vectors.tobytes())
+        # Chép nguyên byte các record được giữ, không parse lại
+        with open(tmp_sidecar, 'wb') as f:
+            for row in keep_rows:
+                f.write(self._record_bytes(row))
+        keep = np.asarray(keep_rows, dtype=np.int64)
+        lengths = self._offsets[keep + 1] - self._offsets[keep]
+        id_hashes = self._id_hashes[keep]
+
+        # Bỏ memmap cũ trước khi ghi đè file
+        self._vectors, self._sidecar = None, None
+        os.replace(tmp_vectors, self._path(VECTORS_FILE))
+        os.replace(tmp_sidecar, self._path(SIDECAR_FILE))
+
+        n_before = self.count()
+        self._reset_rows(id_hashes, lengths)
+        self._open_sidecar()
+        self._open_vectors()
+
+        if self._hnsw is not None:
+            covered_rows = [row for row in keep_rows if row < self._hnsw.size]
+            if self._hnsw.size - len(covered_rows) > HNSW_REBUILD_DELETE_RATIO * max(n_before, 1):
+                self._hnsw = None
+                if os.path.exists(self._path(HNSW_FILE)):
+                    os.remove(self._path(HNSW_FILE))
+            else:
+                self._hnsw.remap(covered_rows)
+                self._unsaved.add(HNSW_FILE)
+            self._sync_hnsw()
+
+        if self._codes is not None:
+            self._codes = self._codes[[row for row in keep_rows if row < len(self._codes)]]
+            if self.count():
+                self._unsaved.add(QUANTIZED_FILE)
+                self._sync_codes()
+            else:
+                self._quantizer, self._codes = None, None
+                self._unsaved.discard(QUANTIZED_FILE)
+
+        # Số dòng đã đổi: graph / mã nén trên đĩa phải khớp ngay với file đã compact
+        self.persist()
+
+    def update_metadata(self, nodes: List[BaseNode]) -> None:
+        """Replace the stored metadata of existing nodes (vectors untouched)"""
+        updated = {}
+        for node, row in zip(nodes, self._find_rows([node.node_id for node in nodes])):
+            if row is not None:
+                record = self._record(row)
+                updated[row] = _encode_record(record["id"], record["text"],
+                                              node_to_metadata_dict(node, remove_text=True))
+        if not updated:
+            return
+
+        # Chỉ ghi lại sidecar (chép nguyên byte các dòng không đổi), vectors.bin giữ nguyên
+        tmp_sidecar = self._path(SIDECAR_FILE + ".tmp")
+        lengths = np.diff(self._offsets)
+        with open(tmp_sidecar, 'wb') as f:
+            for row in range(self.count()):
+                line = updated.get(row)
+                if line is None:
+                    line = self._record_bytes(row)
+                else:
+                    lengths[row] = len(line)
+                f.write(line)
+        self._sidecar = None
+        os.replace(tmp_sidecar, self._path(SIDECAR_FILE))
+        self._reset_rows(self._id_hashes, lengths)
+        self._open_sidecar()
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """Delete all nodes that come from the given source document"""
+        keep_rows = [
+            row for row in range(self.count())
+            if self._record(row)["metadata"].get("ref_doc_id") != ref_doc_id
+        ]
+        if len(keep_rows) != self.count():
+            self._rewrite(keep_rows)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None,
+                     filters: Optional[MetadataFilters] = None, **delete_kwargs: Any) -> None:
+        """Delete nodes by id and/or metadata filters"""
+        if not node_ids and not filters:
+            return
+        mask = self._build_mask(node_ids, filters)
+        keep_rows = np.flatnonzero(~mask).tolist()
+        if len(keep_rows) != self.count():
+            self._rewrite(keep_rows)
+
+    def clear(self) -> None:
+        """Remove every stored node"""
+        self._vectors, self._sidecar = None, None
+        shutil.rmtree(self.persist_dir, ignore_errors=True)
+        os.makedirs(self.persist_dir, exist_ok=True)
+        self._dim = None
+        self._hnsw = None
+        self._quantizer, self._codes = None, None
+        self._reset_rows(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        self._unsaved = set()
+
+    def persist(self, persist_path: str = None, fs: Any = None) -> None:
+        """Write the HNSW graph / codes updated since the last persist (vectors and metadata are already on disk)"""
+        if HNSW_FILE in self._unsaved and self._hnsw is not None:
+            self._hnsw.save(self._path(HNSW_FILE))
+        if QUANTIZED_FILE in self._unsaved and self._codes is not None:
+            save_quantizer(self._path(QUANTIZED_FILE), self._quantizer, self._codes)
+        self._unsaved = set()
+
+    def _match_filter(self, metadata: Dict, key: str, operator: FilterOperator, value: Any) -> bool:
+        actual = metadata.get(key)
+        if operator == FilterOperator.EQ:
+            return actual == value
+        if operator == FilterOperator.NE:
+            return actual != value
+        if operator == FilterOperator.IN:
+            return actual in value
+        if operator == FilterOperator.NIN:
+            return actual not in value
+        raise ValueError(f"Unsupported filter operator for local store: {operator}")
+
+    def _build_mask(self, node_ids: Optional[List[str]] = None,
+                    filters: Optional[MetadataFilters] = None) -> np.ndarray:
+        """Boolean mask of rows matching node ids AND metadata filters"""
+        n_rows = self.count()
+        mask = np.ones(n_rows, dtype=bool)
+
+        if node_ids:
+            id_mask = np.zeros(n_rows, dtype=bool)
+            rows = [row for row in self._find_rows(node_ids) if row is not None]
+            id_mask[rows] = True
+            mask &= id_mask
+
+        if filters is not None and filters.filters:
+            condition = str(getattr(filters.condition, "value", filters.condition) or "and").lower()
+            for row in range(n_rows):
+                if not mask[row]:
+                    continue
+                metadata = self._record(row)["metadata"]
+                results = [
+                    self._match_filter(metadata, f.key, f.operator, f.value)
+                    for f in filters.filters
+                ]
+                mask[row] = any(results) if condition == "or" else all(results)
+
+        return mask
+
+    def search(self, query_embedding: List[float], top_k: int,
+               mask: Optional[np.ndarray] = None, exact: bool = False):
+        """
+        Top-k cosine search
+
+        Dùng HNSW khi có graph và không có filter; nếu có mã nén thì quét mã nén
+        rồi rescore top ứng viên bằng vector float; ngược lại quét toàn bộ (exact)
+        bằng nhân ma trận theo block.
+        """
+        if self._vectors is None or top_k <= 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= (np.linalg.norm(query) or 1.0)
+
+        if self._hnsw is not None and mask is None and not exact:
+            return self._hnsw.search(query, top_k)
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            if len(rows) <= self.search_block_size:
+                # Filter chọn ít dòng (vd. chunk của một tài liệu): chỉ đọc và chấm các dòng đó
+                scores = np.asarray(self._vectors[rows], dtype=np.float32) @ query
+                order = np.argsort(-scores, kind='stable')[:top_k]
+                return rows[order], scores[order]
+        if self._codes is not None and not exact:
+            return self._search_quantized(query, top_k, mask)
+
+        best_rows = np.array([], dtype=np.int64)
+        best_scores = np.array([], dtype=np.float32)
+        n_rows = self.count()
+        for start in range(0, n_rows, self.search_block_size):
+            end = min(start + self.search_block_size, n_rows)
+            block = np.asarray(self._vectors[start:end], dtype=np.float32)
+            scores = block @ query
+            if mask is not None:
+                scores[~mask[start:end]] = -np.inf
+
+            # Giữ top-k của block rồi gộp với top-k hiện tại
+            k = min(top_k, end - start)
+            block_top = np.argpartition(-scores, k - 1)[:k]
+            best_rows = np.concatenate([best_rows, block_top + start])
+            best_scores = np.concatenate([best_scores, scores[block_top]])
+            if len(best_rows) > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores, kind='stable')
+        best_rows, best_scores = best_rows[order], best_scores[order]
+        valid = np.isfinite(best_scores)
+        return best_rows[valid], best_scores[valid]
+
+    def search_many(self, query_embeddings: List[List[float]], top_k: int):
+        """
+        Top-k cosine search for many queries
+
+        Quét exact (không HNSW / mã nén) được gộp thành một phép nhân ma trận
+        (num_queries x block) cho mỗi block thay vì quét lại store cho từng query.
+        """
+        if self._vectors is None or top_k <= 0 or self._hnsw is not None or self._codes is not None:
+            return [self.search(query, top_k) for query in query_embeddings]
+        if not query_embeddings:
+            return []
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        num_queries = len(queries)
+        best_rows = np.empty((num_queries, 0), dtype=np.int64)
+        best_scores = np.empty((num_queries, 0), dtype=np.float32)
+        n_rows = self.count()
+        for start in range(0, n_rows, self.search_block_size):
+            end = min(start + self.search_block_size, n_rows)
+            scores = queries @ np.asarray(self._vectors[start:end], dtype=np.float32).T
+
+            k = min(top_k, end - start)
+            block_top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_rows = np.concatenate([best_rows, block_top + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, block_top, axis=1)], axis=1)
+            if best_rows.shape[1] > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1, axis=1)[:, :top_k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        return list(zip(best_rows, best_scores))
+
+    def _search_quantized(self, query: np.ndarray, top_k: int, mask: Optional[np.ndarray] = None):
+        """Two-pass search: approximate scores on codes, exact rescoring of the shortlist"""
+        scores = np.concatenate([
+            self._quantizer.score(self._codes[start:start + self.search_block_size], query)
+            for start in range(0, len(self._codes), self.search_block_size)
+        ])
+        if mask is not None:
+            scores[~mask] = -np.inf
+
+        num_candidates = min(top_k * self.rescore_factor, len(scores))
+        candidates = np.argpartition(-scores, num_candidates - 1)[:num_candidates]
+        candidates = np.sort(candidates[np.isfinite(scores[candidates])])
+        if len(candidates) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        # Chỉ đọc vector float của các ứng viên (memmap, phần còn lại không cần nạp vào RAM)
+        exact_scores = np.asarray(self._vectors[candidates], dtype=np.float32) @ query
+        order = np.argsort(-exact_scores, kind='stable')[:top_k]
+        return candidates[order], exact_scores[order]
+
+    def get_node(self, row: int) -> BaseNode:
+        """Rebuild the node stored at a row"""
+        record = self._record(row)
+        try:
+            node = metadata_dict_to_node(record["metadata"], text=record["text"])
+        except ValueError:
+            node = TextNode(text=record["text"], id_=record["id"], metadata=record["metadata"])
+        return node
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Query index for top k most similar nodes"""
+        if query.query_embedding is None:
+            raise ValueError("LocalVectorStore requires a query embedding")
+
+        mask = None
+        if query.node_ids or (query.filters is not None and query.filters.filters):
+            mask = self._build_mask(query.node_ids, query.filters)
+
+        rows, scores = self.search(query.query_embedding, query.similarity_top_k, mask)
+        return self._to_query_result(rows, scores)
+
+    def query_many(self, queries: List[VectorStoreQuery], **kwargs: Any) -> List[VectorStoreQueryResult]:
+        """Query many embeddings at once; queries with filters fall back to query()"""
+        if any(query.node_ids or (query.filters is not None and query.filters.filters) for query in queries) \
+                or len({query.similarity_top_k for query in queries}) > 1:
+            return [self.query(query, **kwargs) for query in queries]
+        if any(query.query_embedding is None for query in queries):
+            raise ValueError("LocalVectorStore requires a query embedding")
+        if not queries:
+            return []
+
+        results = self.search_many([query.query_embedding for query in queries], queries[0].similarity_top_k)
+        return [self._to_query_result(rows, scores) for rows, scores in results]
+
+    def _to_query_result(self, rows: np.ndarray, scores: np.ndarray) -> VectorStoreQueryResult:
+        nodes = [self.get_node(int(row)) for row in rows]
+        return VectorStoreQueryResult(
+            nodes=nodes,
+            similarities=[float(score) for score in scores],
+            ids=[node.node_id for node in nodes],
+        )
+
+    def get_nodes(self, node_ids: Optional[List[str]] = None,
+                  filters: Optional[MetadataFilters] = None) -> List[BaseNode]:
+        """Get stored nodes, optionally restricted by ids and/or filters"""
+        if not node_ids and not filters:
+            return [self.get_node(row) for row in range(self.count())]
+        mask = self._build_mask(node_ids, filters)
+        return [self.get_node(int(row)) for row in np.flatnonzero(mask)]
+
+    def get_embeddings(self, node_ids: List[str]) -> np.ndarray:
+        """Stored (float) embedding rows of the given node ids"""
+        rows = self._find_rows(node_ids)
+        missing = [node_id for node_id, row in zip(node_ids, rows) if row is None]
+        if missing:
+            raise KeyError(missing[0])
+        rows = np.asarray(rows, dtype=np.int64)
+        return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def iter_batches(self, batch_size: int = 512) -> Iterator[Tuple[List[BaseNode], np.ndarray]]:
+        """Stored nodes with their (float) embeddings, batch by batch in row order"""
+        for start in range(0, self.count(), batch_size):
+            stop = min(start + batch_size, self.count())
+            yield [self.get_node(row) for row in range(start, stop)], \
+                np.asarray(self._vectors[start:stop], dtype=np.float32)
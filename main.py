@@ -55,6 +55,7 @@ def print_system_info():
     print(f"   Generation Model: {RAGConfig.GENERATION_MODEL}")
     print(f"   Top-K Retrieval: {RAGConfig.TOP_K}")
     print(f"   Chunk Size: {RAGConfig.CHUNK_SIZE}")
+    print(f"   Vector Backend: {RAGConfig.VECTOR_BACKEND}")
     print()
 
 
@@ -74,6 +75,8 @@ def run_debug(args):
         config.QUESTIONS_PATH = args.questions
     if args.ground_truth:
         config.TRUE_RESULTS_PATH = args.ground_truth
+    if args.backend:
+        config.VECTOR_BACKEND = args.backend
     
     try:
         print("🚀 Initializing RAG system...")
@@ -148,6 +151,8 @@ def run_evaluation(args):
         config.TRUE_RESULTS_PATH = args.ground_truth
     if args.top_k:
         config.TOP_K = args.top_k
+    if args.backend:
+        config.VECTOR_BACKEND = args.backend
     
     # Set performance mode
     if args.quick:
@@ -238,6 +243,47 @@ def run_evaluation(args):
         print("Check the log file for detailed error information.")
         return 1
 
+
+def run_export_index(args):
+    """Dump the vector index into a snapshot file (no embedding model needed)"""
+    
+    config = RAGConfig()
+    if args.backend:
+        config.VECTOR_BACKEND = args.backend
+    
+    try:
+        rag_system = VietnameseMCQRAG(config)
+        start_time = datetime.now()
+        num_chunks = rag_system.export_index_snapshot(args.snapshot, 'float16' if args.float16 else None)
+        total_time = (datetime.now() - start_time).total_seconds()
+        print(f"✅ Exported {num_chunks} chunks to {args.snapshot} in {total_time:.2f}s")
+        return 0
+        
+    except Exception as e:
+        print(f"\n❌ Error during index export: {str(e)}")
+        return 1
+
+
+def run_import_index(args):
+    """Bulk-load a snapshot file into a fresh index (no re-embedding)"""
+    
+    config = RAGConfig()
+    if args.backend:
+        config.VECTOR_BACKEND = args.backend
+    
+    try:
+        rag_system = VietnameseMCQRAG(config)
+        start_time = datetime.now()
+        num_chunks = rag_system.import_index_snapshot(args.snapshot, force=args.force)
+        total_time = (datetime.now() - start_time).total_seconds()
+        print(f"✅ Imported {num_chunks} chunks from {args.snapshot} in {total_time:.2f}s")
+        return 0
+        
+    except Exception as e:
+        print(f"\n❌ Error during index import: {str(e)}")
+        return 1
+
+
 def main():
     """Main entry point"""
     
@@ -255,9 +301,16 @@ def main():
     # Rebuild index and run evaluation
     python main.py evaluate --rebuild-index
 
+    # Run without Elasticsearch (embedded vector store)
+    python main.py evaluate --backend local
+
     # Debug specific question
     python main.py debug 3
     # Then interactively debug more questions: 5, 10, q
+
+    # Move the index to another machine without re-embedding
+    python main.py export-index index.snap
+    python main.py import-index index.snap --backend local
     """
     )
     
@@ -279,6 +332,8 @@ def main():
                            help='Force rebuild vector index')
     eval_parser.add_argument('--top-k', type=int,
                            help='Number of top documents to retrieve')
+    eval_parser.add_argument('--backend', choices=['elasticsearch', 'local'],
+                           help='Vector backend (local = in-process store, no Elasticsearch)')
     eval_parser.add_argument('--workers', type=int, default=1,
                            help='Number of parallel workers for processing')
     
@@ -306,6 +361,23 @@ def main():
                             help='Path to questions CSV file')
     debug_parser.add_argument('--ground-truth', '-g',
                             help='Path to ground truth file')
+    debug_parser.add_argument('--backend', choices=['elasticsearch', 'local'],
+                            help='Vector backend (local = in-process store, no Elasticsearch)')
+    
+    # Index snapshot commands
+    export_parser = subparsers.add_parser('export-index', help='Export the vector index to a snapshot file')
+    export_parser.add_argument('snapshot', help='Snapshot file to write')
+    export_parser.add_argument('--backend', choices=['elasticsearch', 'local'],
+                             help='Vector backend to export from')
+    export_parser.add_argument('--float16', action='store_true',
+                             help='Store vectors as float16 (half the size)')
+    
+    import_parser = subparsers.add_parser('import-index', help='Load a snapshot file into a fresh vector index')
+    import_parser.add_argument('snapshot', help='Snapshot file to read')
+    import_parser.add_argument('--backend', choices=['elasticsearch', 'local'],
+                             help='Vector backend to import into')
+    import_parser.add_argument('--force', action='store_true',
+                             help='Replace the index if it already exists')
     
     args = parser.parse_args()
     
@@ -317,6 +389,10 @@ def main():
         return run_evaluation(args)
     elif args.command == 'debug':
         return run_debug(args)
+    elif args.command == 'export-index':
+        return run_export_index(args)
+    elif args.command == 'import-index':
+        return run_import_index(args)
     else:
         parser.print_help()
         return 1
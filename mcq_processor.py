@@ -309,8 +309,22 @@ class MCQProcessor:
         # Process questions (sequential for GPU optimization)
         self.logger.log_info("Processing questions sequentially for GPU optimization")
         
+        # Retrieval theo batch: embed + search cả batch câu hỏi một lần trước khi trả lời từng câu
+        retrieval_batch_size = self.rag_system.config.RETRIEVAL_BATCH_SIZE
+        
         start_time = time.time()
-        for idx, row in questions_df.iterrows():
+        for position, (idx, row) in enumerate(questions_df.iterrows()):
+            if retrieval_batch_size and position % retrieval_batch_size == 0:
+                batch_df = questions_df.iloc[position:position + retrieval_batch_size]
+                try:
+                    self.rag_system.prepare_batch([
+                        (batch_row['Question'], {key: batch_row[key] for key in ('A', 'B', 'C', 'D')})
+                        for _, batch_row in batch_df.iterrows()
+                    ])
+                except Exception as e:
+                    # Lỗi batch không chặn evaluation: từng câu hỏi tự retrieve như bình thường
+                    self.logger.log_error(f"Batch retrieval failed, falling back to per-question retrieval: {str(e)}")
+            
             result = self.process_single_question((idx, row))
             results.append(result)
             
@@ -517,6 +531,28 @@ class MCQProcessor:
             self.logger.log_info(f"Total processing time: {processing_time:.2f}s")
             self.logger.log_info(f"Average time per question: {processing_time/len(predictions):.2f}s")
             
+            # Log query embedding cache usage
+            embed_model = self.rag_system.embed_model
+            if hasattr(embed_model, 'get_query_cache_stats'):
+                cache_stats = embed_model.get_query_cache_stats()
+                if cache_stats:
+                    self.logger.log_info(
+                        f"Query embedding cache: {cache_stats['hits']} hits, "
+                        f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.1%} hit rate)"
+                    )
+            
+            # Log per-leg hybrid retrieval latency
+            retriever = getattr(self.rag_system, 'retriever', None)
+            if hasattr(retriever, 'get_timing_stats'):
+                timing_stats = retriever.get_timing_stats()
+                if timing_stats['queries']:
+                    self.logger.log_info(
+                        f"Hybrid retrieval ({timing_stats['queries']} queries): "
+                        f"vector {timing_stats['avg_vector'] * 1000:.1f}ms, "
+                        f"keyword {timing_stats['avg_keyword'] * 1000:.1f}ms, "
+                        f"total {timing_stats['avg_total'] * 1000:.1f}ms avg"
+                    )
+            
             # Log GPU utilization summary
             if torch.cuda.is_available():
                 max_memory = torch.cuda.max_memory_allocated() / 1024**3
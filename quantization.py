@@ -0,0 +1,261 @@
+"""
+Quantization Module
+Nén embedding thành mã gọn (int8 / binary / product quantization) để quét nhanh,
+sau đó rescore top ứng viên bằng vector float gốc
+"""
+
+import os
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Số bit 1 của mỗi giá trị byte (popcount), dùng tính Hamming distance
+POPCOUNT_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+class Quantizer(ABC):
+    """Base class: train on float vectors, encode to compact codes, score codes against a query"""
+
+    kind = "none"
+
+    @abstractmethod
+    def train(self, vectors: np.ndarray):
+        """Fit the quantizer parameters on float vectors"""
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Compact codes of float vectors (one row per vector)"""
+
+    @abstractmethod
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Approximate similarity (higher = closer) of every code row to the query"""
+
+    @abstractmethod
+    def bytes_per_vector(self, dim: int) -> int:
+        """Size of one code for a vector of the given dimension"""
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """Arrays needed to restore the trained quantizer"""
+        return {}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        pass
+
+
+class ScalarQuantizer(Quantizer):
+    """Per-dimension int8 (uint8) scalar quantization, 4x smaller than float32"""
+
+    kind = "int8"
+
+    def __init__(self):
+        self.lower: Optional[np.ndarray] = None
+        self.scale: Optional[np.ndarray] = None
+
+    def train(self, vectors: np.ndarray):
+        self.lower = vectors.min(axis=0).astype(np.float32)
+        upper = vectors.max(axis=0).astype(np.float32)
+        self.scale = np.maximum(upper - self.lower, 1e-12) / 255.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((vectors - self.lower) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # v ≈ lower + code * scale  =>  v·q ≈ code·(scale*q) + lower·q
+        return codes.astype(np.float32) @ (self.scale * query) + float(self.lower @ query)
+
+    def bytes_per_vector(self, dim: int) -> int:
+        return dim
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"lower": self.lower, "scale": self.scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.lower, self.scale = state["lower"], state["scale"]
+
+
+class BinaryQuantizer(Quantizer):
+    """Sign-bit quantization (1 bit per dimension, 32x smaller), scored by Hamming distance"""
+
+    kind = "binary"
+
+    def train(self, vectors: np.ndarray):
+        pass
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.packbits(vectors > 0, axis=1)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        query_bits = np.packbits(query > 0)
+        hamming = POPCOUNT_TABLE[codes ^ query_bits].sum(axis=1, dtype=np.int32)
+        return -hamming.astype(np.float32)
+
+    def bytes_per_vector(self, dim: int) -> int:
+        return (dim + 7) // 8
+
+
+class ProductQuantizer(Quantizer):
+    """
+    Product quantization: chia vector thành các sub-vector `subvector_dim` chiều,
+    mỗi sub-vector mã hóa bằng id (1 byte) của centroid gần nhất (k-means, 256 centroid)
+    """
+
+    kind = "pq"
+
+    def __init__(self, subvector_dim: int = 8, num_centroids: int = 256,
+                 iterations: int = 20, max_train_size: int = 20000, seed: int = 42):
+        self.subvector_dim = subvector_dim
+        self.num_centroids = num_centroids
+        self.iterations = iterations
+        self.max_train_size = max_train_size
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None  # (num_subspaces, num_centroids, subvector_dim)
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dim) -> (num_subspaces, n, subvector_dim)"""
+        n, dim = vectors.shape
+        if dim % self.subvector_dim:
+            raise ValueError(f"Embedding dim {dim} is not divisible by PQ subvector dim {self.subvector_dim}")
+        return vectors.reshape(n, dim // self.subvector_dim, self.subvector_dim).transpose(1, 0, 2)
+
+    def _nearest(self, subvectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # ||x - c||^2 = ||x||^2 - 2x·c + ||c||^2, bỏ ||x||^2 vì không đổi theo c
+        distances = (centroids ** 2).sum(axis=1) - 2 * subvectors @ centroids.T
+        return distances.argmin(axis=1)
+
+    def train(self, vectors: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.max_train_size:
+            vectors = vectors[rng.choice(len(vectors), self.max_train_size, replace=False)]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        num_centroids = min(self.num_centroids, len(vectors))
+
+        centroids = []
+        for subvectors in self._split(vectors):
+            center = subvectors[rng.choice(len(subvectors), num_centroids, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(subvectors, center)
+                counts = np.bincount(assignment, minlength=num_centroids)
+                sums = np.zeros_like(center)
+                np.add.at(sums, assignment, subvectors)
+                filled = counts > 0
+                center[filled] = sums[filled] / counts[filled, None]
+            centroids.append(center)
+        self.centroids = np.stack(centroids).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        subspaces = self._split(np.asarray(vectors, dtype=np.float32))
+        codes = [self._nearest(subvectors, center) for subvectors, center in zip(subspaces, self.centroids)]
+        return np.stack(codes, axis=1).astype(np.uint8)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # Asymmetric distance: bảng tích vô hướng query_j · centroid_jc, rồi cộng theo mã
+        query_parts = query.reshape(-1, self.subvector_dim)
+        table = np.einsum('jcd,jd->jc', self.centroids, query_parts)
+        return table[np.arange(codes.shape[1]), codes].sum(axis=1)
+
+    def bytes_per_vector(self, dim: int) -> int:
+        return dim // self.subvector_dim
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"centroids": self.centroids}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.centroids = state["centroids"]
+        self.subvector_dim = self.centroids.shape[2]
+
+
+QUANTIZERS = {
+    ScalarQuantizer.kind: ScalarQuantizer,
+    BinaryQuantizer.kind: BinaryQuantizer,
+    ProductQuantizer.kind: ProductQuantizer,
+}
+
+
+def create_quantizer(kind: str, **kwargs) -> Quantizer:
+    """Create an untrained quantizer by kind ("int8", "binary", "pq")"""
+    if kind not in QUANTIZERS:
+        raise ValueError(f"Unknown quantization: {kind}")
+    if kind == ProductQuantizer.kind:
+        return ProductQuantizer(**kwargs)
+    return QUANTIZERS[kind]()
+
+
+def save_quantizer(path: str, quantizer: Quantizer, codes: np.ndarray):
+    """Persist quantizer state and codes in one .npz file (atomic rename)"""
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, kind=np.array(quantizer.kind), codes=codes, **quantizer.state())
+    os.replace(tmp_path, path)
+
+
+def load_quantizer(path: str):
+    """Load (quantizer, codes) saved by save_quantizer"""
+    data = np.load(path)
+    quantizer = create_quantizer(str(data["kind"]))
+    quantizer.load_state({key: data[key] for key in data.files if key not in ("kind", "codes")})
+    return quantizer, data["codes"]
+
+
+def evaluate_quantizer(vectors: np.ndarray, quantizer: Quantizer, codes: np.ndarray,
+                       num_queries: int = 100, top_k: int = 10, rescore_factor: int = 4,
+                       seed: int = 0, block_size: int = 65536) -> Dict:
+    """
+    Đo size và recall@k của quantizer so với exact search
+
+    Query lấy từ chính các vector đã lưu (thêm nhiễu nhỏ) nên không cần model embedding.
+    `vectors` có thể là memmap ở dtype lưu trữ (float16/float32): size tính theo dtype đó và
+    exact search quét theo block, không chép cả ma trận sang float32.
+    """
+    n, dim = vectors.shape
+    rng = np.random.default_rng(seed)
+    query_rows = np.sort(rng.choice(n, size=min(num_queries, n), replace=False))
+    queries = np.asarray(vectors[query_rows], dtype=np.float32)
+    queries += rng.normal(scale=0.05, size=queries.shape)
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+    k = min(top_k, n)
+    num_candidates = min(k * rescore_factor, n)
+
+    # Exact top-k của mọi query, quét store theo block (num_queries x block mỗi lần)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, n, block_size):
+        block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+        scores = queries @ block.T
+        block_k = min(k, scores.shape[1])
+        block_top = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+        best_rows = np.concatenate([best_rows, block_top + start], axis=1)
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, block_top, axis=1)], axis=1)
+        keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+        best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+    codes_hits, rescored_hits = 0, 0
+    for query, truth_rows in zip(queries, best_rows):
+        truth = set(truth_rows.tolist())
+
+        approx_scores = quantizer.score(codes, query)
+        candidates = np.sort(np.argpartition(-approx_scores, num_candidates - 1)[:num_candidates])
+        codes_top = candidates[np.argsort(-approx_scores[candidates])[:k]]
+        exact_candidate_scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+        rescored_top = candidates[np.argsort(-exact_candidate_scores)[:k]]
+        codes_hits += len(truth & set(codes_top.tolist()))
+        rescored_hits += len(truth & set(rescored_top.tolist()))
+
+    total = len(queries) * k
+    float_bytes = n * dim * vectors.dtype.itemsize
+    code_bytes = n * quantizer.bytes_per_vector(dim)
+    return {
+        "quantization": quantizer.kind,
+        "vectors": n,
+        "vector_dtype": str(vectors.dtype),
+        "float_mb": float_bytes / 1024**2,
+        "codes_mb": code_bytes / 1024**2,
+        "compression": float_bytes / max(code_bytes, 1),
+        f"recall@{k}_codes": codes_hits / total,
+        f"recall@{k}_rescored": rescored_hits / total,
+    }
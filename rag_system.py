@@ -1,12 +1,22 @@
 import os
 import re
+import time
+import asyncio
 import logging
-from typing import List, Dict, Tuple, Optional, Union
+import threading
+import shutil
+import itertools
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Iterable, Iterator, List, Dict, Set, Tuple, Optional, Union
 from datetime import datetime
 import torch
 import torch.nn.functional as F
 from torch import Tensor
 from transformers import AutoTokenizer, AutoModelForCausalLM, AutoModel
+import numpy as np
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -15,49 +25,169 @@ from llama_index.core import (
     VectorStoreIndex, 
     SimpleDirectoryReader, 
     Settings,
+    StorageContext,
     Document
 )
-from llama_index.core.node_parser import SentenceSplitter
 from llama_index.core.retrievers import VectorIndexRetriever, BaseRetriever
 from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores.types import MetadataFilters, MetadataFilter, FilterOperator
 from llama_index.vector_stores.elasticsearch import ElasticsearchStore
-from elasticsearch import Elasticsearch
-from llama_index.retrievers.bm25 import BM25Retriever
+from llama_index.vector_stores.elasticsearch.utils import convert_es_hit_to_node
+from elasticsearch import Elasticsearch, helpers
+
+# Import persistent BM25 engine
+from bm25_index import BM25Index, BM25IndexRetriever, build_bm25_index, nodes_fingerprint
+
+# Import server-side hybrid retriever (Elasticsearch)
+from es_hybrid_retriever import ElasticsearchHybridRetriever, msearch_knn
+
+# Import document id index
+from document_index import (
+    DOC_ID_KEY,
+    SOURCE_DOCS_KEY,
+    DocumentChunkIndex,
+    add_document_ids,
+    document_id,
+    node_document_ids,
+    question_document_id,
+)
+
+# Import precomputed chunk features
+from chunk_features import (
+    DEFINITION_KEYWORDS_KEY,
+    FEATURES,
+    NUMBERS_KEY,
+    TABLE_KEYWORDS_KEY,
+    chunk_feature,
+)
+
+# Import document router (index hai tầng: tài liệu -> chunk)
+from document_router import DocumentRouter
+
+# Import Elasticsearch bulk ingest (bulk song song khi build index)
+from es_bulk_ingest import ElasticsearchBulkWriter
+
+# Import near-duplicate compaction (MinHash + LSH lúc ingest)
+from chunk_dedup import NearDuplicateIndex, remove_source_documents
+
+# Import chunking pipeline (process pool, node id cố định)
+from chunking_pipeline import iter_document_chunks
+
+# Import columnar chunk store (text + metadata + đặc trưng chunk, memory-map)
+from chunk_store import ChunkStore, ChunkStoreWriter
+
+# Import index snapshot (export/import index không cần embed lại)
+from index_snapshot import SnapshotReader, SnapshotWriter
+
+# Import table store (bảng tách nguyên vẹn lúc ingest)
+from table_store import TableStore, question_table_labels, render_tsv
 
 # Import question classifier
 from question_classifier import QuestionClassifier
 
+# Import index manifest (incremental rebuild)
+from index_manifest import IndexManifest
+
+# Import embedding cache
+from embedding_cache import EmbeddingCache, QueryEmbeddingCache, normalize_query
+
+# Import embedded vector store backend
+from local_vector_store import LocalVectorStore
+
 # Import reranker
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), 'testing-features'))
 from qwen3_reranker_transformers import Qwen3Reranker
 
+logger = logging.getLogger(__name__)
+
+
 class RAGConfig:
     """Configuration for RAG system"""
     # Model configurations
     EMBEDDING_MODEL = "Qwen/Qwen3-Embedding-0.6B"
+    EMBEDDING_DIM = None            # Matryoshka: số chiều giữ lại (vd. 128, 256); None = đầy đủ (1024)
+    MATRYOSHKA_REFINE = True        # Rescore shortlist bằng vector đầy đủ khi EMBEDDING_DIM được đặt
+    MATRYOSHKA_REFINE_FACTOR = 4    # Kích thước shortlist = HYBRID_TOP_K * factor
     GENERATION_MODEL = "Qwen/Qwen3-0.6B"
     
     # RAG parameters
     TOP_K = 6
     CHUNK_SIZE = 400
     CHUNK_OVERLAP = 50
+    CHUNKING_WORKERS = min(4, os.cpu_count() or 1)  # Số process chunk song song (<= 1 = chunk trong process chính)
+    CHUNKING_QUEUE_SIZE = 16  # Số tài liệu tối đa đã gửi đi chunk nhưng chưa embed
+    INDEX_INSERT_BATCH_SIZE = 512  # Số chunk mỗi window ingest (embed + ghi vào vector store rồi giải phóng)
+    INGEST_MEMORY_REPORT = True  # Log peak memory (tracemalloc) của mỗi window ingest
+    CHUNK_DEDUP_ENABLED = True  # Gộp chunk gần trùng lúc ingest (MinHash + LSH)
+    CHUNK_DEDUP_THRESHOLD = 0.85  # Jaccard (word 5-gram) tối thiểu để coi là trùng
+    CHUNK_DEDUP_NUM_PERM = 64  # Số hàm hash của MinHash signature
+    CHUNK_DEDUP_BANDS = 16  # Số băng LSH (NUM_PERM phải chia hết cho BANDS)
     
     # File paths
     DOCUMENT_PATH = "documents"
     QUESTIONS_PATH = "Question-Bank-GD4.csv"
     TRUE_RESULTS_PATH = "Answer-for-question-bank-gd4.md"
     
+    # Vector backend: "elasticsearch" hoặc "local" (vector store trong process, không cần ES)
+    VECTOR_BACKEND = "elasticsearch"
+    LOCAL_VECTOR_STORE_DIR = "index_storage/local_vector_store"
+    LOCAL_VECTOR_DTYPE = "float32"  # "float32" (nhanh nhất) hoặc "float16" (tiết kiệm 1/2 bộ nhớ)
+    LOCAL_VECTOR_INDEX = "flat"     # "flat" (exact) hoặc "hnsw" (gần đúng, nhanh khi corpus lớn)
+    HNSW_M = 16                     # Số neighbor mỗi node (layer 0 dùng 2*M)
+    HNSW_EF_CONSTRUCTION = 200      # Beam width khi build graph (cao = recall tốt, build chậm)
+    HNSW_EF_SEARCH = 64             # Beam width khi query (cao = recall tốt, query chậm)
+    HNSW_LIBRARY = "auto"           # "auto" (hnswlib nếu đã cài), "hnswlib" hoặc "numpy" (chậm khi corpus lớn)
+    LOCAL_VECTOR_QUANTIZATION = "none"  # "none", "int8" (4x), "binary" (32x) hoặc "pq" (chỉ dùng với index "flat")
+    QUANTIZATION_RESCORE_FACTOR = 4     # Số ứng viên rescore bằng vector float = TOP_K * factor
+    PQ_SUBVECTOR_DIM = 8                # Số chiều mỗi sub-vector PQ (1 byte/sub-vector, 32x với float32)
+    
     # Elasticsearch configuration
     ELASTICSEARCH_URL = "http://localhost:9200"  # Hoặc Elastic Cloud URL
-    ELASTICSEARCH_INDEX = "vietnamese_mcq_rag"   # Index name
+    ELASTICSEARCH_INDEX = "vietnamese_mcq_rag"   # Index name (alias khi build blue/green)
     ELASTICSEARCH_USER = None  # Nếu có authentication
     ELASTICSEARCH_PASSWORD = None  # Nếu có authentication
+    ELASTICSEARCH_TEXT_FIELD = "content"  # Field lưu text của chunk
+    ELASTICSEARCH_VECTOR_FIELD = "embedding"  # Field lưu embedding vector
+    ELASTICSEARCH_SCROLL_SIZE = 1000  # Số chunk mỗi lần scroll khi warm start
+    ES_VECTOR_INDEX_TYPE = "int8_hnsw"  # "hnsw" (vector float) hoặc "int8_hnsw" (lượng tử int8, ~4x ít RAM cho kNN)
+    ES_HNSW_M = 16  # Số neighbor mỗi node của graph HNSW
+    ES_HNSW_EF_CONSTRUCTION = 100  # Beam width khi build graph (cao = recall tốt, build chậm)
+    ES_BLUE_GREEN_REBUILD = True  # Build lại vào index mới có version, đổi alias khi xong (truy vấn không gián đoạn)
+    ES_KEEP_INDEX_VERSIONS = 1  # Số version cũ giữ lại sau khi đổi alias (để rollback), các version cũ hơn bị xóa
+    ES_SOURCE_EXCLUDE_VECTORS = True  # Không lưu vector trong _source (giảm dung lượng đĩa, vector chỉ nằm trong index kNN)
+    ES_BULK_INGEST = True  # Ghi chunk bằng bulk request song song (tắt refresh/replica trong lúc build)
+    ES_BULK_SIZE = 500  # Số document mỗi bulk request
+    ES_BULK_THREADS = 4  # Số bulk request gửi song song
+    ES_BULK_MAX_RETRIES = 5  # Số lần retry khi ES trả về 429
+    ES_BULK_INITIAL_BACKOFF = 2  # Giây chờ trước lần retry đầu (gấp đôi sau mỗi lần)
+    SNAPSHOT_VECTOR_DTYPE = "float32"  # Vector trong snapshot: "float32" hoặc "float16" (file nhỏ 1/2)
+    
+    # Index storage (manifest lưu cạnh index)
+    INDEX_STORAGE_DIR = "index_storage"
+    INCREMENTAL_INDEX_UPDATE = True  # Chỉ chunk + embed lại các file thêm mới/thay đổi
+    
+    # Embedding cache (lưu embedding của chunk trên đĩa, theo hash nội dung)
+    EMBEDDING_CACHE_ENABLED = True
+    EMBEDDING_CACHE_DIR = "index_storage/embedding_cache"
+    QUERY_CACHE_SIZE = 4096  # Số query embedding giữ trong LRU cache (0 = tắt)
     
     # Hybrid retrieval parameters
     HYBRID_ALPHA = 0.5  # 0.0 = chỉ keyword, 1.0 = chỉ vector, 0.5 = balanced
     HYBRID_TOP_K = 10    # Số kết quả từ mỗi method trong hybrid search (10 vector + 10 keyword = 20)
+    BM25_DYNAMIC_PRUNING = True  # Top-k BM25 của truy vấn đơn bằng MaxScore/block-max (batch luôn chấm vectorized)
+    HYBRID_MODE = "python"       # "python" (kNN + BM25 trong process) hoặc "elasticsearch" (1 request kNN + match)
+    ES_HYBRID_FUSION = "linear"  # "linear" (boost theo HYBRID_ALPHA) hoặc "rrf" (reciprocal rank fusion, cần ES hỗ trợ)
+    ES_KNN_NUM_CANDIDATES = 100  # Số ứng viên kNN mỗi shard (cao = recall tốt hơn, chậm hơn)
+    ES_RRF_RANK_CONSTANT = 60
     HYBRID_COMBINED_TOP_K = 10  # Số kết quả sau khi combine (từ 20 → 10)
+    DOCUMENT_ROUTING = "comprehension"  # "off", "comprehension" (câu document_comprehension không nêu Public_XXX), "all" (mọi câu hỏi)
+    DOCUMENT_ROUTER_TOP_N = 3  # Số tài liệu chọn ở tầng 1, tầng 2 chỉ tìm chunk trong các tài liệu này
+    DOCUMENT_ROUTER_ALPHA = 0.5  # Trọng số embedding vs BM25 khi chọn tài liệu
+    TABLE_STORE_ENABLED = True  # Tách bảng lúc ingest, câu hỏi table_data nêu "Bảng X.Y" lấy bảng đó (dạng TSV)
+    TABLE_TSV_MAX_ROWS = 200  # Số dòng tối đa của bảng đưa vào context (dạng TSV)
+    RETRIEVAL_BATCH_SIZE = 32  # Số câu hỏi retrieve chung một lần khi chạy evaluation (embed batch + _msearch), 0 = tắt
     
     # Query reformulation parameters
     REFORMULATION_ENABLED = True  # Enable/disable query reformulation
@@ -81,6 +211,9 @@ class Qwen3EmbeddingLlamaIndex(BaseEmbedding):
                  use_cuda: bool = True,
                  max_length: int = 8192,
                  embed_batch_size: int = 32,
+                 cache_dir: str = None,
+                 query_cache_size: int = 0,
+                 output_dim: int = None,
                  **kwargs):
         
         # Initialize parent class first with only recognized parameters
@@ -94,6 +227,32 @@ class Qwen3EmbeddingLlamaIndex(BaseEmbedding):
         self.__dict__['qwen_instruction'] = instruction
         self.__dict__['qwen_max_length'] = max_length
         self.__dict__['qwen_device'] = "cuda:0" if use_cuda and torch.cuda.is_available() else "cpu"
+        # Matryoshka: chỉ giữ `output_dim` chiều đầu (None = giữ nguyên vector đầy đủ)
+        self.__dict__['qwen_output_dim'] = output_dim
+        
+        # Persistent cache cho embedding của document (None = không cache)
+        self.__dict__['qwen_cache'] = None
+        if cache_dir:
+            self.__dict__['qwen_cache'] = EmbeddingCache(
+                cache_dir,
+                model_name=model_name_or_path,
+                instruction=instruction,
+                max_length=max_length
+            )
+        
+        # LRU cache cho query embedding, dùng chung cho mọi retriever trong process;
+        # có cache_dir thì ghi thêm xuống đĩa (namespace riêng) để giữ qua các lần chạy
+        self.__dict__['qwen_query_cache'] = None
+        if query_cache_size > 0:
+            persistent_query_cache = None
+            if cache_dir:
+                persistent_query_cache = EmbeddingCache(
+                    os.path.join(cache_dir, "queries"),
+                    model_name=model_name_or_path,
+                    instruction=instruction,
+                    max_length=max_length
+                )
+            self.__dict__['qwen_query_cache'] = QueryEmbeddingCache(query_cache_size, persistent=persistent_query_cache)
         
         # Load model with optimizations
         qwen_model = AutoModel.from_pretrained(
@@ -157,17 +316,104 @@ class Qwen3EmbeddingLlamaIndex(BaseEmbedding):
         
         return embeddings.cpu().numpy().tolist()
     
+    def _embed_documents_cached(self, texts: List[str]) -> List[List[float]]:
+        """Embed document texts, only running the model on cache misses"""
+        cache = self.__dict__['qwen_cache']
+        if cache is None:
+            return self._embed_batch(texts, is_query=False)
+        
+        embeddings = cache.get_many(texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            new_embeddings = self._embed_batch([texts[i] for i in missing], is_query=False)
+            cache.put_many([texts[i] for i in missing], new_embeddings)
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+    
+    def truncate_embeddings(self, embeddings: List[List[float]]) -> List[List[float]]:
+        """Keep the leading `output_dim` dimensions and re-normalize (Matryoshka truncation)"""
+        output_dim = self.__dict__['qwen_output_dim']
+        if not output_dim or not embeddings or len(embeddings[0]) <= output_dim:
+            return embeddings
+        return self.truncate_matrix(np.asarray(embeddings, dtype=np.float32), output_dim).tolist()
+    
+    @staticmethod
+    def truncate_matrix(matrix: np.ndarray, output_dim: Optional[int]) -> np.ndarray:
+        """Matryoshka truncation of a (n x dim) float matrix, no-op when dim <= output_dim"""
+        if not output_dim or matrix.shape[-1] <= output_dim:
+            return matrix
+        matrix = np.array(matrix[..., :output_dim], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=-1, keepdims=True), 1e-12)
+        return matrix
+    
     def _get_query_embedding(self, query: str) -> List[float]:
-        """Get embedding for a single query"""
-        return self._embed_batch([query], is_query=True)[0]
+        """Get (possibly truncated) embedding for a single query"""
+        return self.truncate_embeddings([self.get_full_query_embedding(query)])[0]
+    
+    def get_full_query_embedding(self, query: str) -> List[float]:
+        """Get full-dimension embedding for a single query"""
+        query_cache = self.__dict__['qwen_query_cache']
+        if query_cache is None:
+            return self._embed_batch([query], is_query=True)[0]
+        
+        # Key là query đã gắn instruction, để đổi instruction không dùng nhầm cache
+        instructed_query = self.get_detailed_instruct(self.__dict__['qwen_instruction'], query)
+        embedding = query_cache.get(instructed_query)
+        if embedding is None:
+            embedding = self._embed_batch([query], is_query=True)[0]
+            query_cache.put(instructed_query, embedding)
+        return embedding
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """Get (possibly truncated) embeddings for many queries in batched forward passes"""
+        return self.truncate_embeddings(self.get_full_query_embeddings(queries))
+
+    def get_full_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        """Get full-dimension embeddings for many queries, only running the model on cache misses"""
+        query_cache = self.__dict__['qwen_query_cache']
+        # Khoá theo normalize_query như QueryEmbeddingCache, để dedupe trong batch khớp với cache
+        instructed = [
+            normalize_query(self.get_detailed_instruct(self.__dict__['qwen_instruction'], query))
+            for query in queries
+        ]
+        embeddings = {}
+        if query_cache is not None:
+            for key in instructed:
+                if key not in embeddings:
+                    embedding = query_cache.get(key)
+                    if embedding is not None:
+                        embeddings[key] = embedding
+
+        # Query trùng nhau (sau chuẩn hoá) trong batch chỉ embed một lần
+        missing = list(dict(
+            (key, query) for key, query in zip(instructed, queries) if key not in embeddings
+        ).items())
+        batch_size = self.embed_batch_size
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            for (key, _), embedding in zip(batch, self._embed_batch([query for _, query in batch], is_query=True)):
+                embeddings[key] = embedding
+                if query_cache is not None:
+                    query_cache.put(key, embedding)
+        return [embeddings[key] for key in instructed]
+
+    def get_query_cache_stats(self) -> Optional[Dict]:
+        """Hit/miss counters of the query embedding cache"""
+        query_cache = self.__dict__['qwen_query_cache']
+        return query_cache.stats() if query_cache is not None else None
     
     def _get_text_embedding(self, text: str) -> List[float]:
         """Get embedding for a single document text"""
-        return self._embed_batch([text], is_query=False)[0]
+        return self._get_text_embeddings([text])[0]
     
     def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings for multiple document texts"""
-        return self._embed_batch(texts, is_query=False)
+        """Get (possibly truncated) embeddings for multiple document texts"""
+        return self.truncate_embeddings(self._embed_documents_cached(texts))
+    
+    def get_full_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Get full-dimension embeddings for document texts (cache stores full vectors)"""
+        return self._embed_documents_cached(texts)
     
     async def _aget_query_embedding(self, query: str) -> List[float]:
         """Async version of get_query_embedding - fallback to sync"""
@@ -185,6 +431,238 @@ class Qwen3EmbeddingLlamaIndex(BaseEmbedding):
     def _model_name(self) -> str:
         return "Qwen3-Embedding-0.6B"
 
+
+class BatchVectorIndexRetriever(VectorIndexRetriever):
+    """
+    VectorIndexRetriever with a batched `retrieve_many`: embed every query in one
+    forward pass, then one _msearch (Elasticsearch) or one matrix product (local store)
+    """
+    
+    def __init__(self, *args, es_client: Elasticsearch = None, es_index_name: str = None,
+                 es_text_field: str = "content", es_vector_field: str = "embedding", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.es_client = es_client
+        self.es_index_name = es_index_name
+        self.es_text_field = es_text_field
+        self.es_vector_field = es_vector_field
+    
+    def retrieve_many(self, queries: List[str],
+                      query_embeddings: List[List[float]] = None) -> List[List[NodeWithScore]]:
+        if not queries:
+            return []
+        if query_embeddings is None:
+            if hasattr(self._embed_model, "get_query_embedding_batch"):
+                query_embeddings = self._embed_model.get_query_embedding_batch(queries)
+            else:
+                query_embeddings = [self._embed_model.get_query_embedding(query) for query in queries]
+        
+        if self.es_client is not None and self._filters is None and not self._node_ids:
+            return msearch_knn(self.es_client, self.es_index_name, query_embeddings,
+                               top_k=self._similarity_top_k, text_field=self.es_text_field,
+                               vector_field=self.es_vector_field)
+        
+        store_queries = [
+            self._build_vector_store_query(QueryBundle(query_str=query, embedding=embedding))
+            for query, embedding in zip(queries, query_embeddings)
+        ]
+        if hasattr(self._vector_store, "query_many"):
+            results = self._vector_store.query_many(store_queries, **self._kwargs)
+        else:
+            results = [self._vector_store.query(query, **self._kwargs) for query in store_queries]
+        return [self._convert_nodes_to_scored_nodes(result) for result in results]
+
+
+class MatryoshkaRefineRetriever(BaseRetriever):
+    """
+    Two-stage vector search for truncated embeddings: shortlist bằng vector ngắn
+    trong index, sau đó rescore shortlist bằng vector đầy đủ đọc từ cột vector của
+    chunk store (không chạy embedding model cho chunk lúc query)
+    """
+    
+    def __init__(self, vector_retriever: BaseRetriever, embed_model: Qwen3EmbeddingLlamaIndex,
+                 chunk_store: ChunkStore, top_k: int = 10):
+        super().__init__()
+        self.vector_retriever = vector_retriever  # similarity_top_k = shortlist size
+        self.embed_model = embed_model
+        self.chunk_store = chunk_store
+        self.top_k = top_k
+    
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._refine(query_bundle, self.vector_retriever.retrieve(query_bundle))
+    
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self._refine(query_bundle, await self.vector_retriever.aretrieve(query_bundle))
+    
+    def retrieve_many(self, queries: List[str]) -> List[List[NodeWithScore]]:
+        """Batched shortlist + refine; full query vectors are computed once and truncated for the shortlist"""
+        full_embeddings = self.embed_model.get_full_query_embeddings(queries)
+        shortlists = self.vector_retriever.retrieve_many(
+            queries, query_embeddings=self.embed_model.truncate_embeddings(full_embeddings))
+        return [
+            self._refine(QueryBundle(query_str=query), nodes, full_embedding)
+            for query, nodes, full_embedding in zip(queries, shortlists, full_embeddings)
+        ]
+    
+    def _refine(self, query_bundle: QueryBundle, nodes: List[NodeWithScore],
+                full_query_embedding: List[float] = None) -> List[NodeWithScore]:
+        if not nodes:
+            return nodes
+        
+        # Vector đầy đủ của chunk đọc từ chunk store (memmap); thiếu thì giữ thứ tự shortlist
+        node_embeddings = self.chunk_store.get_embeddings([n.node.node_id for n in nodes])
+        if node_embeddings is None:
+            return nodes[:self.top_k]
+        if full_query_embedding is None:
+            full_query_embedding = self.embed_model.get_full_query_embedding(query_bundle.query_str)
+        # Cột vector có thể ngắn hơn vector query (vd. khôi phục từ snapshot vector đã cắt)
+        query_embedding = Qwen3EmbeddingLlamaIndex.truncate_matrix(
+            np.asarray(full_query_embedding, dtype=np.float32), node_embeddings.shape[1])
+        scores = node_embeddings @ query_embedding
+        
+        for n, score in zip(nodes, scores.tolist()):
+            n.score = score
+        nodes.sort(key=lambda n: n.score, reverse=True)
+        return nodes[:self.top_k]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Hybrid retriever: weighted combination of vector search and keyword (BM25) search
+
+    Hai nhánh chạy song song (vector chờ I/O của Elasticsearch, BM25 chạy CPU),
+    nên latency ≈ max của hai nhánh thay vì tổng. Thread pool dùng chung cho mọi instance
+    (retriever được tạo lại mỗi lần build index), không để lại thread rảnh theo từng instance.
+    """
+    
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="hybrid-leg")
+    
+    def __init__(self, vector_retriever, bm25_retriever, alpha=0.5, top_k=10):
+        super().__init__()
+        self.vector_retriever = vector_retriever
+        self.bm25_retriever = bm25_retriever
+        self.alpha = alpha  # 0.5 = balanced, 0.0 = only keyword, 1.0 = only vector
+        self.top_k = top_k  # Truyền top_k vào
+        self._timing_lock = threading.Lock()
+        self._timings = {"vector": 0.0, "keyword": 0.0, "total": 0.0}
+        self._num_queries = 0
+    
+    @staticmethod
+    def _timed(retrieve_fn, query_bundle):
+        start_time = time.perf_counter()
+        nodes = retrieve_fn(query_bundle)
+        return nodes, time.perf_counter() - start_time
+    
+    def _record_timing(self, vector_time: float, keyword_time: float, total_time: float,
+                       num_queries: int = 1):
+        with self._timing_lock:
+            self._timings["vector"] += vector_time
+            self._timings["keyword"] += keyword_time
+            self._timings["total"] += total_time
+            self._num_queries += num_queries
+        logger.debug(f"Hybrid retrieval: vector {vector_time * 1000:.1f}ms, "
+                     f"keyword {keyword_time * 1000:.1f}ms, total {total_time * 1000:.1f}ms")
+    
+    def get_timing_stats(self) -> Dict:
+        """Average per-leg latency (seconds) over all queries so far"""
+        with self._timing_lock:
+            n = self._num_queries
+            stats = {f"avg_{leg}": (value / n if n else 0.0) for leg, value in self._timings.items()}
+            stats["queries"] = n
+        return stats
+    
+    def _retrieve(self, query_bundle):
+        start_time = time.perf_counter()
+        # BM25 chạy ở thread khác trong khi thread hiện tại chờ vector search
+        keyword_future = self._executor.submit(self._timed, self.bm25_retriever.retrieve, query_bundle)
+        vector_nodes, vector_time = self._timed(self.vector_retriever.retrieve, query_bundle)
+        keyword_nodes, keyword_time = keyword_future.result()
+        
+        self._record_timing(vector_time, keyword_time, time.perf_counter() - start_time)
+        return self._combine(vector_nodes, keyword_nodes)
+    
+    async def _aretrieve(self, query_bundle):
+        start_time = time.perf_counter()
+        
+        async def timed_vector():
+            leg_start = time.perf_counter()
+            nodes = await self.vector_retriever.aretrieve(query_bundle)
+            return nodes, time.perf_counter() - leg_start
+        
+        # Vector dùng API async của retriever, BM25 (CPU) chạy trong thread pool
+        loop = asyncio.get_running_loop()
+        (vector_nodes, vector_time), (keyword_nodes, keyword_time) = await asyncio.gather(
+            timed_vector(),
+            loop.run_in_executor(self._executor, self._timed, self.bm25_retriever.retrieve, query_bundle),
+        )
+        
+        self._record_timing(vector_time, keyword_time, time.perf_counter() - start_time)
+        return self._combine(vector_nodes, keyword_nodes)
+    
+    def retrieve_many(self, queries: List[str]) -> List[List[NodeWithScore]]:
+        """
+        Hybrid retrieval for a batch of queries
+
+        Nhánh vector embed cả batch một lần (+ một _msearch nếu dùng Elasticsearch),
+        nhánh BM25 chấm cả batch một lần; hai nhánh vẫn chạy song song.
+        """
+        if not queries:
+            return []
+        start_time = time.perf_counter()
+        keyword_future = self._executor.submit(self._timed, self.bm25_retriever.retrieve_batch, queries)
+        if hasattr(self.vector_retriever, "retrieve_many"):
+            vector_results, vector_time = self._timed(self.vector_retriever.retrieve_many, queries)
+        else:
+            vector_results, vector_time = self._timed(
+                lambda batch: [self.vector_retriever.retrieve(query) for query in batch], queries)
+        keyword_results, keyword_time = keyword_future.result()
+        
+        self._record_timing(vector_time, keyword_time, time.perf_counter() - start_time, len(queries))
+        return [self._combine(vector_nodes, keyword_nodes)
+                for vector_nodes, keyword_nodes in zip(vector_results, keyword_results)]
+    
+    def _combine(self, vector_nodes, keyword_nodes):
+        # Combine results với weighted scoring
+        combined_nodes = {}
+        
+        # Add vector results
+        for node in vector_nodes:
+            node_id = node.node_id
+            score = getattr(node, 'score', 0.0)
+            combined_nodes[node_id] = {
+                'node': node,
+                'vector_score': score * self.alpha,
+                'keyword_score': 0.0
+            }
+        
+        # Add keyword results
+        for node in keyword_nodes:
+            node_id = node.node_id
+            score = getattr(node, 'score', 0.0)
+            if node_id in combined_nodes:
+                combined_nodes[node_id]['keyword_score'] = score * (1 - self.alpha)
+            else:
+                combined_nodes[node_id] = {
+                    'node': node,
+                    'vector_score': 0.0,
+                    'keyword_score': score * (1 - self.alpha)
+                }
+        
+        # Calculate combined scores
+        for node_id, data in combined_nodes.items():
+            combined_score = data['vector_score'] + data['keyword_score']
+            data['node'].score = combined_score
+        
+        # Sort by combined score và return top K
+        sorted_nodes = sorted(
+            combined_nodes.values(),
+            key=lambda x: x['vector_score'] + x['keyword_score'],
+            reverse=True
+        )
+        
+        # Return top K nodes
+        return [item['node'] for item in sorted_nodes[:self.top_k]]
+
+
 class Logger:
     """Enhanced logging system for RAG performance tracking"""
     
@@ -270,12 +748,25 @@ class VietnameseMCQRAG:
         self.config = config or RAGConfig()
         self.logger = Logger()
         self.index = None
+        self.embed_model = None  # Qwen3 embedding model (set trong setup_embedding_model)
+        self.es_client = None  # Sync Elasticsearch client (chỉ dùng với backend elasticsearch)
+        self.es_index_version = None  # Index thật sau alias mà process đang build / cập nhật
+        self.vector_store = None  # LocalVectorStore (chỉ dùng với backend local)
+        self.nodes = []  # Chunk nodes export từ Elasticsearch (index cũ chưa có chunk store)
+        self.chunk_store = None  # Chunk dạng cột memory-map (ChunkStore)
+        self.document_index = None  # document id -> chunk ids (DocumentChunkIndex)
+        self.document_router = None  # Tầng tài liệu của index hai tầng (DocumentRouter)
+        self.table_store = None  # Bảng trích từ tài liệu (TableStore)
+        self.duplicate_sources = {}  # file giữ chunk đại diện -> các file có chunk trùng được gộp vào
+        self.updated_chunks = {}  # chunk id -> chunk đã lưu nhận thêm tài liệu nguồn trong lần ingest gần nhất
         self.retriever = None  # Add retriever attribute
         self.query_engine = None
         self.generation_model = None
         self.tokenizer = None
         self._classifier = None  # Lazy initialization of question classifier
         self.reranker = None  # Reranker model
+        self._prepared = {}  # (question, options) -> (q_type, reformulated_query), từ prepare_batch
+        self._prefetched = {}  # retrieval query -> [nodes, số câu hỏi còn dùng], từ prepare_batch
         
     def setup_embedding_model(self):
         """Setup custom Qwen3 embedding model with GPU optimization"""
@@ -299,10 +790,14 @@ class VietnameseMCQRAG:
             use_fp16=True,
             use_cuda=device_available,
             max_length=8192,
-            embed_batch_size=32 if device_available else 8
+            embed_batch_size=32 if device_available else 8,
+            cache_dir=self.config.EMBEDDING_CACHE_DIR if self.config.EMBEDDING_CACHE_ENABLED else None,
+            query_cache_size=self.config.QUERY_CACHE_SIZE,
+            output_dim=self.config.EMBEDDING_DIM
         )
         
         # Configure global settings
+        self.embed_model = embed_model
         Settings.embed_model = embed_model
         Settings.chunk_size = self.config.CHUNK_SIZE
         Settings.chunk_overlap = self.config.CHUNK_OVERLAP
@@ -385,49 +880,54 @@ class VietnameseMCQRAG:
     
     def setup_chunking(self):
         """Optimal chunking workflow"""
-        from llama_index.core.node_parser import MarkdownNodeParser, SentenceSplitter
-
-        # Step 1: Structure-aware parsing
-        markdown_parser = MarkdownNodeParser()
+        # Step 1: Structure-aware parsing (MarkdownNodeParser)
+        # Step 2: Sentence-level splitting (SentenceSplitter, Vietnamese support)
+        # Pipeline do chunking_pipeline.build_transformations tạo trong từng worker
+        # (iter_document_chunks), không đặt Settings.transformations toàn cục
 
-        # Step 2: Sentence-level splitting
-        sentence_splitter = SentenceSplitter(
-            chunk_size=self.config.CHUNK_SIZE,  # Smaller for MCQ context
-            chunk_overlap=self.config.CHUNK_OVERLAP,
-            paragraph_separator="\n\n",
-            secondary_chunking_regex="[.!?。！？]"  # Vietnamese support
+        self.logger.log_info(
+            f"Optimal chunking strategy configured ({self.config.CHUNKING_WORKERS} chunking workers)"
         )
 
-        # Set transformation pipeline
-        Settings.transformations = [
-            markdown_parser,
-            sentence_splitter
-        ]
-
-        self.logger.log_info("Optimal chunking strategy configured")
+    def _document_reader(self, file_names: List[str] = None) -> SimpleDirectoryReader:
+        """Reader over the documents directory (optionally only the given file names)"""
+        # Check if document exists
+        if not os.path.exists(self.config.DOCUMENT_PATH):
+            raise FileNotFoundError(f"Document not found: {self.config.DOCUMENT_PATH}")
+        
+        if file_names is not None:
+            # Chỉ load các file được chỉ định (incremental update). Đường dẫn tuyệt đối như khi
+            # đọc cả thư mục: file_path nằm trong metadata của chunk, khác độ dài thì chunk khác
+            return SimpleDirectoryReader(
+                input_files=[os.path.abspath(os.path.join(self.config.DOCUMENT_PATH, f)) for f in file_names],
+            )
+        # Load documents from directory
+        return SimpleDirectoryReader(
+            input_dir=self.config.DOCUMENT_PATH,
+            recursive=False,  # Don't search subdirectories,
+            required_exts=[".md"],  # Specify markdown reader
+        )
 
-    def load_documents(self) -> List:
-        """Load and process documents"""
+    def load_documents(self, file_names: List[str] = None) -> List:
+        """Load and process documents (optionally only the given file names)"""
         self.logger.log_info(f"Loading documents from: {self.config.DOCUMENT_PATH}")
         
         try:
-            # Check if document exists
-            if not os.path.exists(self.config.DOCUMENT_PATH):
-                raise FileNotFoundError(f"Document not found: {self.config.DOCUMENT_PATH}")
+            reader = self._document_reader(file_names)
             
             # Count files in directory
             md_files = [f for f in os.listdir(self.config.DOCUMENT_PATH) if f.endswith('.md')]
             self.logger.log_info(f"Found {len(md_files)} markdown files in document directory")
-
-            # Load documents from directory
-            documents = SimpleDirectoryReader(
-                input_dir=self.config.DOCUMENT_PATH,
-                recursive=False,  # Don't search subdirectories,
-                required_exts=[".md"],  # Specify markdown reader
-            ).load_data()
+            if file_names is not None:
+                md_files = file_names
+            
+            documents = reader.load_data()
             
             self.logger.log_info(f"Loaded {len(documents)} documents from {len(md_files)} files")
             
+            # Document id (public_XXX) trong metadata, chunk kế thừa khi split
+            add_document_ids(documents)
+            
             # Log file distribution
             file_counts = {}
             for doc in documents:
@@ -442,14 +942,40 @@ class VietnameseMCQRAG:
         except Exception as e:
             self.logger.log_error("Failed to load documents", e)
             raise
-    
-    def create_vector_index(self, documents: List, force_rebuild: bool = False):
-        """Create or load vector index with Elasticsearch"""
-        self.create_elasticsearch_index(documents, force_rebuild)
+
+    def iter_documents(self, file_names: List[str] = None) -> Iterator:
+        """
+        Lazily read documents one file at a time (streaming ingest)
+
+        Chỉ giữ trong bộ nhớ tài liệu đang được chunk, không load toàn bộ documents/.
+        """
+        reader = self._document_reader(file_names)
+        self.logger.log_info(
+            f"Streaming {len(reader.input_files)} files from: {self.config.DOCUMENT_PATH}"
+        )
+        for documents in reader.iter_data():
+            # Document id (public_XXX) trong metadata, chunk kế thừa khi split
+            add_document_ids(documents)
+            yield from documents
+
+    def create_vector_index(self, documents: List = None, force_rebuild: bool = False):
+        """Create or load vector index with the configured backend"""
+        if self.config.VECTOR_BACKEND == "local":
+            self.create_local_index(documents, force_rebuild)
+        elif self.config.VECTOR_BACKEND == "elasticsearch":
+            self.create_elasticsearch_index(documents, force_rebuild)
+        else:
+            raise ValueError(f"Unknown vector backend: {self.config.VECTOR_BACKEND}")
+        
+        # Map document id -> chunk ids cho câu hỏi về một tài liệu cụ thể
+        if self.chunk_store is not None:
+            self.document_index = self.chunk_store
+        else:
+            self.document_index = DocumentChunkIndex.build(self.nodes) if self.nodes else None
     
     def setup_query_engine(self):
         """Setup query engine with hybrid retrieval"""
-        self.logger.log_info("Setting up query engine with hybrid retrieval (Elasticsearch)...")
+        self.logger.log_info(f"Setting up query engine with hybrid retrieval ({self.config.VECTOR_BACKEND})...")
         
         try:
             # Set global LLM to None
@@ -458,6 +984,13 @@ class VietnameseMCQRAG:
             # Create hybrid retriever
             self.retriever = self.create_hybrid_retriever()
             
+            if self.config.DOCUMENT_ROUTING != "off":
+                self.document_router = self.load_or_build_document_router()
+            
+            if self.config.TABLE_STORE_ENABLED:
+                self.table_store = self.get_table_store()
+                self.logger.log_info(f"Table store: {len(self.table_store)} tables")
+            
             self.logger.log_info("Hybrid query engine setup completed")
             
         except Exception as e:
@@ -653,20 +1186,25 @@ class VietnameseMCQRAG:
             if q_type == 'calculation':
                 # Tăng TOP_K cho câu hỏi tính toán để tìm công thức
                 top_k = min(self.config.TOP_K * 2, 20)
-                nodes = self.retriever.retrieve(reformulated_query)
+                nodes = self._retrieve(reformulated_query)
                 # Sắp xếp lại theo mức độ chứa số liệu
-                nodes = sorted(nodes, key=lambda n: self._has_numbers(n.text), reverse=True)
+                nodes = sorted(nodes, key=lambda n: self.chunk_feature(n.node, NUMBERS_KEY), reverse=True)
                 nodes = nodes[:top_k]
                 # Rerank với reranker
                 nodes = self.rerank_nodes(nodes, reformulated_query)
                 return nodes
             
             elif q_type == 'table_data':
+                # Câu hỏi nêu nhãn bảng: lấy bảng đó (nguyên vẹn, dạng TSV), nhãn trùng thì rerank cùng chunk
+                nodes = self.retrieve_table(question, reformulated_query)
+                if nodes:
+                    return nodes
+                
                 # Tìm chunks chứa từ khóa "bảng", "table"
-                query = f"{reformulated_query} bảng table"
-                nodes = self.retriever.retrieve(query)
+                query = self.get_retrieval_query(q_type, reformulated_query)
+                nodes = self._retrieve(query)
                 # Ưu tiên chunks có từ "bảng"
-                nodes = sorted(nodes, key=lambda n: self._has_table_keywords(n.text), reverse=True)
+                nodes = sorted(nodes, key=lambda n: self.chunk_feature(n.node, TABLE_KEYWORDS_KEY), reverse=True)
                 nodes = nodes[:self.config.TOP_K * 2]  # Lấy nhiều hơn để rerank
                 # Rerank với reranker
                 nodes = self.rerank_nodes(nodes, reformulated_query)
@@ -674,9 +1212,8 @@ class VietnameseMCQRAG:
             
             elif q_type == 'document_comprehension':
                 # Tìm tên tài liệu cụ thể (Public_XXX)
-                doc_match = re.search(r'public_(\d+)', question.lower())
-                if doc_match:
-                    doc_id = doc_match.group(1)
+                doc_id = question_document_id(question)
+                if doc_id:
                     # Tìm chunks từ tài liệu cụ thể
                     nodes = self._retrieve_by_document(doc_id, reformulated_query)
                     if nodes:
@@ -684,9 +1221,16 @@ class VietnameseMCQRAG:
                         nodes = self.rerank_nodes(nodes, reformulated_query)
                         return nodes[:self.config.TOP_K]
                 
+                # Không nêu tài liệu: chọn tài liệu bằng document router rồi tìm chunk trong đó
+                if self.document_router is not None and self.config.DOCUMENT_ROUTING == "comprehension":
+                    nodes = self.retrieve_routed(reformulated_query)
+                    if nodes:
+                        nodes = self.rerank_nodes(nodes, reformulated_query)
+                        return nodes[:self.config.TOP_K]
+                
                 # Nếu không tìm thấy tài liệu cụ thể, dùng retrieval thông thường
                 top_k = min(self.config.TOP_K * 2, 20)
-                nodes = self.retriever.retrieve(reformulated_query)
+                nodes = self._retrieve(reformulated_query)
                 nodes = nodes[:top_k]
                 # Rerank với reranker
                 nodes = self.rerank_nodes(nodes, reformulated_query)
@@ -694,10 +1238,10 @@ class VietnameseMCQRAG:
             
             elif q_type == 'definition':
                 # Ưu tiên chunks ngắn, chứa định nghĩa
-                nodes = self.retriever.retrieve(reformulated_query)
+                nodes = self._retrieve(reformulated_query)
                 # Sắp xếp theo độ dài (định nghĩa thường ngắn) và có từ khóa định nghĩa
                 nodes = sorted(nodes, key=lambda n: (
-                    -self._has_definition_keywords(n.text),
+                    -self.chunk_feature(n.node, DEFINITION_KEYWORDS_KEY),
                     len(n.text)
                 ))
                 nodes = nodes[:self.config.TOP_K * 2]  # Lấy nhiều hơn để rerank
@@ -708,7 +1252,7 @@ class VietnameseMCQRAG:
             elif q_type == 'explanation':
                 # Tăng TOP_K cho câu hỏi giải thích để có đủ context
                 top_k = min(self.config.TOP_K * 2, 20)
-                nodes = self.retriever.retrieve(reformulated_query)
+                nodes = self._retrieve(reformulated_query)
                 nodes = nodes[:top_k]
                 # Rerank với reranker
                 nodes = self.rerank_nodes(nodes, reformulated_query)
@@ -716,7 +1260,7 @@ class VietnameseMCQRAG:
             
             else:
                 # Retrieval thông thường
-                nodes = self.retriever.retrieve(reformulated_query)
+                nodes = self._retrieve(reformulated_query)
                 nodes = nodes[:self.config.TOP_K * 2]  # Lấy nhiều hơn để rerank
                 # Rerank với reranker
                 nodes = self.rerank_nodes(nodes, reformulated_query)
@@ -725,71 +1269,238 @@ class VietnameseMCQRAG:
         except Exception as e:
             self.logger.log_error(f"Error in adaptive retrieval: {str(e)}")
             # Fallback to normal retrieval
-            nodes = self.retriever.retrieve(reformulated_query)
+            nodes = self._retrieve(reformulated_query)
             nodes = nodes[:self.config.TOP_K * 2]  # Lấy nhiều hơn để rerank
             # Rerank với reranker
             nodes = self.rerank_nodes(nodes, reformulated_query)
             return nodes[:self.config.TOP_K]
     
-    def _has_numbers(self, text: str) -> int:
-        """Đếm số lượng số trong text"""
-        numbers = re.findall(r'\d+\.?\d*', text)
-        return len(numbers)
-    
-    def _has_table_keywords(self, text: str) -> int:
-        """Đếm số lượng từ khóa liên quan đến bảng"""
-        keywords = ['bảng', 'table', 'bảng \d+', 'table \d+']
-        count = 0
-        text_lower = text.lower()
-        for keyword in keywords:
-            count += len(re.findall(keyword, text_lower))
-        return count
-    
-    def _has_definition_keywords(self, text: str) -> int:
-        """Đếm số lượng từ khóa định nghĩa"""
-        keywords = ['định nghĩa', 'là', 'được gọi', 'khái niệm', 'nghĩa là']
-        count = 0
-        text_lower = text.lower()
-        for keyword in keywords:
-            count += len(re.findall(keyword, text_lower))
-        return count
+    def retrieve_table(self, question: str, query: str) -> List:
+        """
+        Look up the tables labelled in the question ("Bảng 2.5", "Bảng 3.2 và Bảng 3.3") as TSV nodes
+        
+        Mỗi nhãn khớp đúng một bảng (trong Public_XXX nếu câu hỏi có nêu): trả thẳng các bảng đó.
+        Nhãn trùng ở nhiều tài liệu (hoặc không tìm thấy): bảng ứng viên được rerank cùng các chunk
+        của retrieval thông thường, chỉ giữ ứng viên thuộc tài liệu có chunk được retrieve (nếu có).
+        """
+        labels = question_table_labels(question)
+        if self.table_store is None or not labels:
+            return []
+        doc_id = question_document_id(question)
+        candidates = {label: self.table_store.lookup(label, doc_id) for label in labels}
+        if not any(candidates.values()):
+            return []
+        self.logger.log_info("Table lookup: " + ", ".join(
+            f"label {label} -> {len(tables)} candidates" for label, tables in candidates.items()))
+        
+        if all(len(tables) == 1 for tables in candidates.values()):
+            return [self.table_node(tables[0]) for tables in candidates.values()]
+        
+        nodes = self._retrieve(self.get_retrieval_query('table_data', query))
+        nodes = sorted(nodes, key=lambda n: self.chunk_feature(n.node, TABLE_KEYWORDS_KEY), reverse=True)
+        nodes = nodes[:self.config.TOP_K * 2]
+        
+        # Tài liệu có chunk được retrieve (điểm theo thứ hạng) dùng để chọn giữa các bảng cùng nhãn
+        support = {}
+        for rank, node in enumerate(nodes):
+            for node_doc_id in node_document_ids(node.node):
+                support[node_doc_id] = support.get(node_doc_id, 0.0) + 1.0 / (rank + 1)
+        
+        table_nodes = []
+        for tables in candidates.values():
+            if len(tables) > 1:
+                tables = [table for table in tables if table["doc_id"] in support] or tables
+                tables = sorted(tables, key=lambda table: support.get(table["doc_id"], 0.0), reverse=True)
+            table_nodes.extend(self.table_node(table) for table in tables)
+        
+        nodes = self.rerank_nodes(table_nodes + nodes, query)
+        return nodes[:self.config.TOP_K]
+    
+    def table_node(self, table: Dict) -> NodeWithScore:
+        """One stored table as a TSV node"""
+        node = TextNode(
+            id_=table["table_id"],
+            text=render_tsv(table, self.config.TABLE_TSV_MAX_ROWS),
+            metadata={"file_name": table["file_name"], DOC_ID_KEY: table["doc_id"], "table_label": table["label"]},
+        )
+        return NodeWithScore(node=node, score=1.0)
+    
+    def chunk_feature(self, node, key: str) -> int:
+        """Chunk feature from the chunk store column, falling back to the node's metadata"""
+        value = self.chunk_store.feature(node.node_id, key) if self.chunk_store is not None else None
+        return chunk_feature(node, key) if value is None else value
+    
+    def get_retrieval_query(self, q_type: str, reformulated_query: str) -> str:
+        """Query gửi tới retriever cho loại câu hỏi (table_data thêm từ khóa bảng)"""
+        if q_type == 'table_data':
+            return f"{reformulated_query} bảng table"
+        return reformulated_query
+    
+    def needs_retrieval(self, question: str, q_type: str) -> bool:
+        """Whether adaptive_retrieval goes through _retrieve (False: document filter / routing / table lookup)"""
+        if q_type == 'document_comprehension':
+            if question_document_id(question):
+                return False
+            if self.document_router is not None and self.config.DOCUMENT_ROUTING == "comprehension":
+                return False
+        if q_type == 'table_data' and self.table_store is not None:
+            # retrieve_table chỉ bỏ qua _retrieve khi mỗi nhãn khớp đúng một bảng
+            doc_id = question_document_id(question)
+            labels = question_table_labels(question)
+            if labels and all(len(self.table_store.lookup(label, doc_id)) == 1 for label in labels):
+                return False
+        return True
+    
+    def _retrieve(self, query: str) -> List:
+        """Retrieve nodes, dùng kết quả đã prefetch theo batch nếu có"""
+        prefetched = self._prefetched.get(query)
+        nodes = None
+        if prefetched is not None:
+            # Nhiều câu hỏi cùng query: mỗi câu nhận bản sao riêng (reranker ghi đè score)
+            nodes, uses = prefetched
+            if uses <= 1:
+                del self._prefetched[query]
+            else:
+                prefetched[1] = uses - 1
+            nodes = [NodeWithScore(node=n.node, score=n.score) for n in nodes]
+        if nodes is None:
+            if self.document_router is not None and self.config.DOCUMENT_ROUTING == "all":
+                nodes = self.retrieve_routed(query)
+            else:
+                nodes = self.retriever.retrieve(query)
+        return nodes
+    
+    def retrieve_many(self, queries: List[str]) -> List[List]:
+        """Retrieve nodes for many queries (batched embedding + _msearch + BM25 batch when supported)"""
+        if self.document_router is not None and self.config.DOCUMENT_ROUTING == "all":
+            return [self.retrieve_routed(query) for query in queries]
+        if hasattr(self.retriever, "retrieve_many"):
+            return self.retriever.retrieve_many(queries)
+        return [self.retriever.retrieve(query) for query in queries]
+    
+    @staticmethod
+    def question_key(question: str, options: Dict[str, str]) -> Tuple:
+        """Key of a prepared question (same text with different options = different question)"""
+        return question, tuple(sorted((options or {}).items()))
+    
+    def prepare_batch(self, questions: List[Tuple[str, Dict[str, str]]]):
+        """
+        Classify + reformulate a batch of questions and retrieve them at once
+        
+        Câu hỏi đi đường riêng (lọc theo Public_XXX, document router, tra bảng theo nhãn)
+        không prefetch.
+
+        Kết quả được giữ lại cho answer_mcq / adaptive_retrieval của từng câu hỏi, theo
+        (câu hỏi, đáp án) vì reformulate dùng cả đáp án; mỗi kết quả dùng đúng số câu hỏi
+        cần nó, kết quả của batch trước chưa dùng sẽ bị bỏ.
+        """
+        self._prepared.clear()
+        self._prefetched.clear()
+        
+        queries = []
+        for question, options in questions:
+            q_type = self.classify_question(question)
+            reformulated_query = self.reformulate_query(question, options)
+            self._prepared[self.question_key(question, options)] = (q_type, reformulated_query)
+            if self.needs_retrieval(question, q_type):
+                queries.append(self.get_retrieval_query(q_type, reformulated_query))
+        
+        uses = Counter(queries)
+        unique_queries = list(uses)
+        if not unique_queries:
+            return
+        start_time = time.time()
+        for query, nodes in zip(unique_queries, self.retrieve_many(unique_queries)):
+            self._prefetched[query] = [nodes, uses[query]]
+        self.logger.log_info(f"Batch retrieval: {len(unique_queries)} queries in {time.time() - start_time:.2f}s")
+    
+    def get_all_nodes(self) -> List:
+        """Get all chunk nodes (from ingest, chunk store, fallback to Elasticsearch export or docstore)"""
+        if self.nodes:
+            return self.nodes
+        
+        # Dựng lại node từ chunk store khi cần (build BM25 / router), không giữ trong process
+        if self.chunk_store is not None:
+            return list(self.chunk_store.iter_nodes())
+        
+        # Hybrid phía server không export node lúc warm start, chỉ export khi thật sự cần
+        if self.config.VECTOR_BACKEND == "elasticsearch" and self.es_client is not None:
+            self.nodes = self.export_nodes_from_elasticsearch(self.es_client)
+            return self.nodes
+        
+        nodes = []
+        if hasattr(self.index, 'storage_context') and hasattr(self.index.storage_context, 'docstore'):
+            for node_id in self.index.storage_context.docstore.docs:
+                node = self.index.storage_context.docstore.get_node(node_id)
+                if node:
+                    nodes.append(node)
+        return nodes
+    
+    def get_document_index(self) -> DocumentChunkIndex:
+        """document id -> chunk ids (chunk store, or built from the nodes when there is none)"""
+        if self.document_index is None and self.chunk_store is not None:
+            self.document_index = self.chunk_store
+        if self.document_index is None:
+            self.document_index = DocumentChunkIndex.build(self.get_all_nodes())
+        return self.document_index
+    
+    def retrieve_routed(self, query: str) -> List:
+        """Two-level retrieval: route to the top-N documents, then search chunks within them"""
+        query_embedding = self.embed_model.get_query_embedding(query)
+        routed = self.document_router.route(query, query_embedding, self.config.DOCUMENT_ROUTER_TOP_N)
+        self.logger.log_info(f"Routed to documents: {', '.join(f'{doc_id} ({score:.3f})' for doc_id, score in routed)}")
+        return self._retrieve_by_documents([doc_id for doc_id, _ in routed], query)
     
     def _retrieve_by_document(self, doc_id: str, query: str) -> List:
         """Retrieve chunks từ tài liệu cụ thể"""
+        return self._retrieve_by_documents([doc_id], query)
+    
+    def _retrieve_by_documents(self, doc_ids: List[str], query: str) -> List:
+        """Retrieve chunks chỉ trong các tài liệu cho trước (filter đẩy xuống vector search và BM25)"""
+        if not doc_ids:
+            return []
+        top_k = self.config.TOP_K * 2
         try:
-            # Tìm tất cả nodes
-            all_nodes = []
-            if hasattr(self.index, 'storage_context') and hasattr(self.index.storage_context, 'docstore'):
-                for node_id in self.index.storage_context.docstore.docs:
-                    node = self.index.storage_context.docstore.get_node(node_id)
-                    if node and hasattr(node, 'metadata'):
-                        # Kiểm tra metadata có chứa doc_id không
-                        metadata = node.metadata
-                        if isinstance(metadata, dict):
-                            file_name = metadata.get('file_name', '')
-                            if f'public_{doc_id}' in file_name.lower() or f'public-{doc_id}' in file_name.lower():
-                                all_nodes.append(node)
-            
-            # Nếu tìm thấy nodes từ tài liệu cụ thể, retrieve từ đó
-            if all_nodes:
-                # Tạo retriever tạm thời từ nodes này
-                from llama_index.core.retrievers import VectorIndexRetriever
-                temp_retriever = VectorIndexRetriever(
-                    index=self.index,
-                    similarity_top_k=min(len(all_nodes), self.config.TOP_K * 2)
+            if self.config.VECTOR_BACKEND == "elasticsearch":
+                # Một request kNN + match, cả hai nhánh cùng filter theo document id
+                retriever = ElasticsearchHybridRetriever(
+                    es_client=self.es_client,
+                    index_name=self.config.ELASTICSEARCH_INDEX,
+                    embed_model=self.embed_model,
+                    text_field=self.config.ELASTICSEARCH_TEXT_FIELD,
+                    vector_field=self.config.ELASTICSEARCH_VECTOR_FIELD,
+                    alpha=self.config.HYBRID_ALPHA,
+                    top_k=top_k,
+                    num_candidates=self.config.ES_KNN_NUM_CANDIDATES,
+                    fusion=self.config.ES_HYBRID_FUSION,
+                    rrf_rank_constant=self.config.ES_RRF_RANK_CONSTANT,
                 )
-                nodes = temp_retriever.retrieve(query)
-                # Lọc chỉ lấy nodes từ tài liệu cụ thể
-                filtered_nodes = []
-                for n in nodes:
-                    metadata = getattr(n, 'metadata', {})
-                    if isinstance(metadata, dict):
-                        file_name = str(metadata.get('file_name', '')).lower()
-                        if f'public_{doc_id}' in file_name or f'public-{doc_id}' in file_name:
-                            filtered_nodes.append(n)
-                return filtered_nodes if filtered_nodes else nodes
-            
-            return []
+                # Chunk đại diện cho chunk trùng của tài liệu khác ghi tài liệu đó trong source_docs
+                return retriever.search(query, es_filter={"bool": {
+                    "should": [
+                        {"terms": {f"metadata.{DOC_ID_KEY}": doc_ids}},
+                        {"terms": {f"metadata.{SOURCE_DOCS_KEY}": doc_ids}},
+                    ],
+                    "minimum_should_match": 1,
+                }})
+            
+            document_index = self.get_document_index()
+            chunk_ids = [chunk_id for doc_id in doc_ids for chunk_id in document_index.chunk_ids(doc_id)]
+            if not chunk_ids:
+                return []
+            
+            # Vector search chỉ chấm các chunk của các tài liệu (node_ids -> mask của store)
+            top_k = min(len(chunk_ids), top_k)
+            vector_nodes = VectorIndexRetriever(
+                index=self.index,
+                similarity_top_k=top_k,
+                node_ids=chunk_ids,
+            ).retrieve(query)
+            if not isinstance(self.retriever, HybridRetriever):
+                return vector_nodes
+            
+            keyword_nodes = self.retriever.bm25_retriever.retrieve_restricted(query, chunk_ids, top_k)
+            return self.retriever._combine(vector_nodes, keyword_nodes)
         except Exception as e:
             self.logger.log_error(f"Error retrieving by document: {str(e)}")
             return []
@@ -1015,13 +1726,18 @@ Hướng dẫn chung:
         """Answer a single MCQ question using adaptive retrieval + custom generation"""
         
         try:
-            # 1. Phân loại câu hỏi
-            q_type = self.classify_question(question)
+            prepared = self._prepared.get(self.question_key(question, options))
+            if prepared is not None:
+                # Đã phân loại + reformulate + retrieve theo batch trong prepare_batch
+                q_type, reformulated_query = prepared
+            else:
+                # 1. Phân loại câu hỏi
+                q_type = self.classify_question(question)
+                
+                # 2. Reformulate query for better retrieval
+                reformulated_query = self.reformulate_query(question, options)
             self.logger.log_info(f"Question classified as: {q_type}")
             
-            # 2. Reformulate query for better retrieval
-            reformulated_query = self.reformulate_query(question, options)
-            
             # 3. Adaptive retrieval theo loại câu hỏi
             nodes = self.adaptive_retrieval(question, q_type, reformulated_query)
             
@@ -1142,10 +1858,9 @@ Hướng dẫn chung:
         self.setup_reranker()
         self.setup_generation_model()
         
-        documents = self.load_documents()
-        
         # Create vector index
-        self.create_vector_index(documents, force_rebuild_index)
+        # Documents chỉ được load khi cần build index mới (warm start không cần)
+        self.create_vector_index(None, force_rebuild_index)
         
         # Setup query engine
         self.setup_query_engine()
@@ -1182,30 +1897,960 @@ Hướng dẫn chung:
             self.logger.log_error("Failed to connect to Elasticsearch", e)
             raise
 
-    def create_elasticsearch_index(self, documents: List, force_rebuild: bool = False):
+    def create_elasticsearch_vector_store(self, index_name: str = None) -> ElasticsearchStore:
+        """Create ElasticsearchStore bound to the configured index (alias) or to a given index"""
+        # ElasticsearchStore cần AsyncElasticsearch client, để store tự tạo từ URL
+        return ElasticsearchStore(
+            index_name=index_name or self.config.ELASTICSEARCH_INDEX,
+            es_url=self.config.ELASTICSEARCH_URL,
+            es_user=self.config.ELASTICSEARCH_USER,
+            es_password=self.config.ELASTICSEARCH_PASSWORD,
+            text_field=self.config.ELASTICSEARCH_TEXT_FIELD,
+            vector_field=self.config.ELASTICSEARCH_VECTOR_FIELD,
+            metadata_mappings=self.get_elasticsearch_metadata_mappings(),
+        )
+
+    def get_elasticsearch_metadata_mappings(self) -> Dict:
+        """Explicit mappings of chunk metadata fields"""
+        # Document id là keyword để filter term theo tài liệu, đặc trưng chunk là số nguyên
+        return {
+            DOC_ID_KEY: {"type": "keyword"},
+            SOURCE_DOCS_KEY: {"type": "keyword"},
+            "file_name": {"type": "keyword"},
+            **{key: {"type": "integer"} for key in FEATURES},
+        }
+
+    def get_elasticsearch_index_options(self) -> Dict:
+        """dense_vector index_options (HNSW graph, optionally over int8-quantized vectors)"""
+        if self.config.ES_VECTOR_INDEX_TYPE not in ("hnsw", "int8_hnsw"):
+            raise ValueError(f"Unsupported Elasticsearch vector index type: {self.config.ES_VECTOR_INDEX_TYPE}")
+        return {
+            "type": self.config.ES_VECTOR_INDEX_TYPE,
+            "m": self.config.ES_HNSW_M,
+            "ef_construction": self.config.ES_HNSW_EF_CONSTRUCTION,
+        }
+
+    def get_elasticsearch_mappings(self, num_dimensions: int) -> Dict:
+        """Explicit index mappings: quantized HNSW vector field, text field, keyword document ids"""
+        mappings = {
+            "properties": {
+                self.config.ELASTICSEARCH_TEXT_FIELD: {"type": "text"},
+                self.config.ELASTICSEARCH_VECTOR_FIELD: {
+                    "type": "dense_vector",
+                    "dims": num_dimensions,
+                    "index": True,
+                    "similarity": "cosine",
+                    "index_options": self.get_elasticsearch_index_options(),
+                },
+                "metadata": {"properties": {
+                    # Id của LlamaIndex (ElasticsearchStore cũng map keyword)
+                    "document_id": {"type": "keyword"},
+                    "doc_id": {"type": "keyword"},
+                    "ref_doc_id": {"type": "keyword"},
+                    **self.get_elasticsearch_metadata_mappings(),
+                }},
+            }
+        }
+        if self.config.ES_SOURCE_EXCLUDE_VECTORS:
+            mappings["_source"] = {"excludes": [self.config.ELASTICSEARCH_VECTOR_FIELD]}
+        return mappings
+
+    def ensure_elasticsearch_index(self, num_dimensions: int):
+        """Create the index with the explicit mappings (ElasticsearchStore would create it with defaults)"""
+        index_name = self.get_elasticsearch_write_index()
+        if self.es_client.indices.exists(index=index_name):
+            return
+        self.es_client.indices.create(
+            index=index_name,
+            mappings=self.get_elasticsearch_mappings(num_dimensions),
+        )
+        self.logger.log_info(
+            f"Created index '{index_name}' ({num_dimensions} dims, "
+            f"{self.config.ES_VECTOR_INDEX_TYPE} m={self.config.ES_HNSW_M} "
+            f"ef_construction={self.config.ES_HNSW_EF_CONSTRUCTION})"
+        )
+
+    def get_elasticsearch_file_name_field(self) -> str:
+        """Keyword field of file_name (index build trước khi có mapping tường minh dùng sub-field .keyword)"""
+        response = self.es_client.indices.get_field_mapping(
+            index=self.config.ELASTICSEARCH_INDEX, fields="metadata.file_name")
+        for index_mapping in response.values():
+            field = index_mapping["mappings"].get("metadata.file_name", {}).get("mapping", {})
+            if field.get("file_name", {}).get("type") == "keyword":
+                return "metadata.file_name"
+        return "metadata.file_name.keyword"
+
+    def get_elasticsearch_write_index(self) -> str:
+        """Index written by builds/updates: the versioned index behind the alias, or the configured name"""
+        return self.es_index_version or self.config.ELASTICSEARCH_INDEX
+
+    def get_elasticsearch_storage_path(self, suffix: str) -> str:
+        """Path of an artifact (manifest, BM25, router, ...) stored next to the written index"""
+        return os.path.join(self.config.INDEX_STORAGE_DIR, f"{self.get_elasticsearch_write_index()}{suffix}")
+
+    def resolve_elasticsearch_index(self) -> str:
+        """Index the alias points to (index build trước khi có alias: chính tên đã cấu hình)"""
+        alias = self.config.ELASTICSEARCH_INDEX
+        if self.es_client.indices.exists_alias(name=alias):
+            return sorted(self.es_client.indices.get_alias(name=alias))[-1]
+        return alias
+
+    def new_elasticsearch_index_version(self) -> str:
+        """Name of a new, unused versioned index for a blue/green build (sorts by build time)"""
+        base_name = f"{self.config.ELASTICSEARCH_INDEX}_v{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        storage_files = os.listdir(self.config.INDEX_STORAGE_DIR) if os.path.isdir(self.config.INDEX_STORAGE_DIR) else []
+        # Hai lần build trong cùng một giây (vd. chạy lại sau khi build lỗi): thêm số thứ tự
+        # thay vì ghi vào index / artifact của lần build trước
+        index_name, attempt = base_name, 0
+        while self.es_client.indices.exists(index=index_name) \
+                or any(file_name.startswith(index_name + ".") for file_name in storage_files):
+            attempt += 1
+            index_name = f"{base_name}_{attempt:02d}"
+        return index_name
+
+    def delete_elasticsearch_index(self):
+        """Delete the configured index, or every versioned index (behind the alias or kept for rollback)"""
+        alias = self.config.ELASTICSEARCH_INDEX
+        index_names = set(self.es_client.indices.get(index=f"{alias}_v*"))
+        if self.es_client.indices.exists_alias(name=alias):
+            index_names.update(self.es_client.indices.get_alias(name=alias))
+        elif self.es_client.indices.exists(index=alias):
+            index_names.add(alias)
+        for index_name in sorted(index_names):
+            self.logger.log_info(f"Deleting existing index: {index_name}")
+            self.es_client.indices.delete(index=index_name)
+            self.delete_elasticsearch_artifacts(index_name)
+
+    def delete_elasticsearch_artifacts(self, index_name: str):
+        """Remove the artifacts (manifest, BM25, router, chunk store, tables) stored for an index"""
+        if not os.path.isdir(self.config.INDEX_STORAGE_DIR):
+            return
+        for file_name in os.listdir(self.config.INDEX_STORAGE_DIR):
+            if not file_name.startswith(index_name + "."):
+                continue
+            path = os.path.join(self.config.INDEX_STORAGE_DIR, file_name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def swap_elasticsearch_alias(self, index_name: str):
+        """
+        Point the alias at a freshly built index in one atomic update, then drop old versions
+
+        Index cũ (trước khi dùng alias) trùng tên alias được xóa trong cùng request, nên
+        không có lúc nào tên index không truy vấn được.
+        """
+        alias = self.config.ELASTICSEARCH_INDEX
+        actions = [{"add": {"index": index_name, "alias": alias}}]
+        legacy_index = False
+        if self.es_client.indices.exists_alias(name=alias):
+            actions = [
+                {"remove": {"index": old_index, "alias": alias}}
+                for old_index in self.es_client.indices.get_alias(name=alias)
+            ] + actions
+        elif self.es_client.indices.exists(index=alias):
+            actions = [{"remove_index": {"index": alias}}] + actions
+            legacy_index = True
+        self.es_client.indices.update_aliases(actions=actions)
+        self.logger.log_info(f"Alias '{alias}' now points to '{index_name}'")
+        
+        if legacy_index:
+            self.delete_elasticsearch_artifacts(alias)
+        self.cleanup_elasticsearch_versions()
+
+    def cleanup_elasticsearch_versions(self):
+        """Delete versioned indices older than the ES_KEEP_INDEX_VERSIONS most recent previous ones"""
+        current = self.resolve_elasticsearch_index()
+        versions = sorted(self.es_client.indices.get(index=f"{self.config.ELASTICSEARCH_INDEX}_v*"), reverse=True)
+        old_versions = [index_name for index_name in versions if index_name != current]
+        for index_name in old_versions[self.config.ES_KEEP_INDEX_VERSIONS:]:
+            self.logger.log_info(f"Deleting old index version: {index_name}")
+            self.es_client.indices.delete(index=index_name)
+            self.delete_elasticsearch_artifacts(index_name)
+
+    def create_bulk_writer(self) -> Optional[ElasticsearchBulkWriter]:
+        """Bulk writer for index builds, None when chunks go through the vector store's add path"""
+        if self.config.VECTOR_BACKEND != "elasticsearch" or not self.config.ES_BULK_INGEST:
+            return None
+        return ElasticsearchBulkWriter(
+            self.es_client,
+            self.get_elasticsearch_write_index(),
+            text_field=self.config.ELASTICSEARCH_TEXT_FIELD,
+            vector_field=self.config.ELASTICSEARCH_VECTOR_FIELD,
+            index_mappings=self.get_elasticsearch_mappings,
+            bulk_size=self.config.ES_BULK_SIZE,
+            threads=self.config.ES_BULK_THREADS,
+            max_retries=self.config.ES_BULK_MAX_RETRIES,
+            initial_backoff=self.config.ES_BULK_INITIAL_BACKOFF,
+        )
+
+    def iter_nodes_from_elasticsearch(self, es_client: Elasticsearch) -> Iterator:
+        """Stream all stored chunks (text + metadata, without vectors) from Elasticsearch"""
+        # Scroll toàn bộ index, bỏ qua vector field để giảm dung lượng truyền về
+        for hit in helpers.scan(
+            es_client,
+            index=self.config.ELASTICSEARCH_INDEX,
+            query={"query": {"match_all": {}}},
+            size=self.config.ELASTICSEARCH_SCROLL_SIZE,
+            source_excludes=[self.config.ELASTICSEARCH_VECTOR_FIELD],
+        ):
+            yield convert_es_hit_to_node(hit, self.config.ELASTICSEARCH_TEXT_FIELD)
+
+    def export_nodes_from_elasticsearch(self, es_client: Elasticsearch) -> List:
+        """Export all stored chunks (text + metadata, without vectors) from Elasticsearch"""
+        return list(self.iter_nodes_from_elasticsearch(es_client))
+
+    def load_existing_index(self, es_client: Elasticsearch) -> bool:
+        """Warm start: attach to an existing Elasticsearch index without re-embedding"""
+        start_time = time.time()
+        
+        doc_count = es_client.count(index=self.config.ELASTICSEARCH_INDEX)["count"]
+        if doc_count == 0:
+            self.logger.log_info("Existing index is empty, a new index will be built")
+            return False
+        
+        vector_store = self.create_elasticsearch_vector_store()
+        self.index = VectorStoreIndex.from_vector_store(vector_store)
+        
+        # Chunk text cho BM25 / lọc theo tài liệu đọc từ chunk store (memory-map) thay vì
+        # export cả index vào RAM; hybrid phía server dùng BM25 của ES nên không build lại store
+        self.chunk_store = self.load_or_build_chunk_store(
+            doc_count, build=self.config.HYBRID_MODE != "elasticsearch")
+        
+        elapsed = time.time() - start_time
+        self.logger.log_info(
+            f"Attached to existing index '{self.config.ELASTICSEARCH_INDEX}' "
+            f"({doc_count} chunks) in {elapsed:.2f}s"
+        )
+        return True
+
+    def index_documents(self, documents: Iterable, vector_store, writer: ChunkStoreWriter = None,
+                        dedup: NearDuplicateIndex = None) -> Dict[str, int]:
+        """
+        Chunk documents, embed the chunks and write them into the vector store
+
+        Streaming ingest: `documents` có thể là generator (iter_documents). Chunking chạy
+        trên process pool theo từng tài liệu, song song với embedding; chunk được gom thành
+        window INDEX_INSERT_BATCH_SIZE chunk, embed + ghi vào store rồi giải phóng (tài liệu,
+        chunk và embedding của window không được giữ lại), nên bộ nhớ đỉnh không tăng theo corpus.
+        Mỗi window (kèm embedding đầy đủ số chiều) được ghi tiếp vào chunk store qua `writer`;
+        chỉ trả về số chunk theo file cho manifest. `dedup` (cập nhật incremental) là index
+        gần trùng đã seed bằng các chunk đã lưu.
+        """
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        self.index = VectorStoreIndex([], storage_context=storage_context)
+        table_store = self.get_table_store() if self.config.TABLE_STORE_ENABLED else None
+        
+        # Đo peak memory từng window (chỉ cấp phát Python/numpy, không gồm tensor của torch)
+        trace_memory = self.config.INGEST_MEMORY_REPORT and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        
+        # Backend Elasticsearch: embed trong process rồi ghi bằng bulk writer song song
+        bulk_writer = self.create_bulk_writer()
+        
+        # Chunk gần trùng không được embed/lưu; chunk giữ lại đã ghi mà nhận thêm
+        # tài liệu nguồn (stale) được cập nhật metadata sau cùng
+        if dedup is None:
+            dedup = self.create_dedup_index(stored_node=writer.get_node if writer is not None else None)
+        stale = {}
+        self.duplicate_sources = {}
+        self.updated_chunks = stale
+        
+        start_time = time.time()
+        window = []
+        chunk_counts: Dict[str, int] = {}
+        num_documents = num_windows = num_chunks = 0
+        chunked = iter_document_chunks(
+            documents,
+            self.config.CHUNK_SIZE,
+            self.config.CHUNK_OVERLAP,
+            num_workers=self.config.CHUNKING_WORKERS,
+            max_pending=self.config.CHUNKING_QUEUE_SIZE,
+        )
+        try:
+            with bulk_writer if bulk_writer is not None else nullcontext():
+                for document, document_nodes in chunked:
+                    num_documents += 1
+                    # Tách bảng nguyên vẹn (thay thế bảng cũ của file này)
+                    if table_store is not None:
+                        table_store.add_documents([document])
+                    if dedup is not None:
+                        document_nodes = self._collapse_duplicates(document_nodes, dedup, window, stale)
+                    window.extend(document_nodes)
+                    if len(window) >= self.config.INDEX_INSERT_BATCH_SIZE:
+                        num_windows += 1
+                        self._insert_window(window, num_windows, num_documents, num_chunks, start_time,
+                                            bulk_writer, writer)
+                        num_chunks += len(window)
+                        self._count_chunks_by_file(window, chunk_counts)
+                        window = []
+                if window:
+                    num_windows += 1
+                    self._insert_window(window, num_windows, num_documents, num_chunks, start_time,
+                                        bulk_writer, writer)
+                    num_chunks += len(window)
+                    self._count_chunks_by_file(window, chunk_counts)
+                    window = []
+                if stale:
+                    self.update_stored_chunks(list(stale.values()), vector_store, bulk_writer, writer)
+                    if writer is not None:
+                        writer.update_nodes(stale.values())
+            if isinstance(vector_store, LocalVectorStore):
+                # Ghi graph HNSW / mã nén một lần cho cả lần ingest
+                vector_store.persist()
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+        
+        if table_store is not None:
+            table_store.save(self.get_table_store_path())
+        
+        if dedup is not None:
+            dedup.save(self.get_dedup_signatures_path())
+            report = dedup.report()
+            self.logger.log_info(
+                f"Near-duplicate compaction: {report['duplicates']}/{report['chunks']} chunks collapsed "
+                f"({report['ratio']:.1%}), saved {report['duplicates']} embeddings and "
+                f"{report['text_mb']:.2f}MB text, {len(stale)} stored chunks updated"
+            )
+        
+        if bulk_writer is not None:
+            self.logger.log_info(
+                f"Elasticsearch bulk ingest: {bulk_writer.num_written} docs written "
+                f"({bulk_writer.docs_per_second():.1f} docs/s)"
+            )
+        
+        elapsed = time.time() - start_time
+        self.logger.log_info(
+            f"Ingested {num_chunks} chunks from {num_documents} documents in {num_windows} windows "
+            f"({elapsed:.1f}s, {num_chunks / max(elapsed, 1e-9):.1f} chunks/s)"
+        )
+        
+        # Log hiệu quả của embedding cache
+        cache = self.embed_model.__dict__.get('qwen_cache') if self.embed_model is not None else None
+        if cache is not None:
+            stats = cache.stats()
+            self.logger.log_info(
+                f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries ({stats['size_mb']:.1f}MB)"
+            )
+        return chunk_counts
+
+    def _insert_window(self, window: List, window_number: int, num_documents: int,
+                       num_indexed: int, start_time: float, bulk_writer: ElasticsearchBulkWriter = None,
+                       writer: ChunkStoreWriter = None):
+        """Embed one ingest window, write it into the vector store and the chunk store, log its peak memory"""
+        embed_start = time.time()
+        full_embeddings = self.embed_chunks(window)
+        embed_elapsed = max(time.time() - embed_start, 1e-9)
+        if writer is not None:
+            writer.append(window, full_embeddings if writer.with_vectors else None)
+        embeddings = Qwen3EmbeddingLlamaIndex.truncate_matrix(full_embeddings, self.config.EMBEDDING_DIM)
+        if bulk_writer is None:
+            # Ghi window vào vector store trong khi worker chunk tiếp; bỏ embedding khỏi node
+            # sau khi ghi để node không giữ vector
+            for node, embedding in zip(window, embeddings.tolist()):
+                node.embedding = embedding
+            self.index.insert_nodes(window)
+            for node in window:
+                node.embedding = None
+            throughput = f", {len(window) / embed_elapsed:.1f} embeddings/s"
+        else:
+            # Đẩy vào bulk writer, không chờ ES ghi xong
+            bulk_writer.write(window, embeddings.tolist())
+            throughput = (
+                f", {len(window) / embed_elapsed:.1f} embeddings/s, "
+                f"{bulk_writer.docs_per_second():.1f} docs/s written"
+            )
+        
+        memory = ""
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            memory = f", peak memory {peak / 1024 / 1024:.1f}MB"
+        self.logger.log_info(
+            f"Window {window_number}: indexed {num_indexed + len(window)} chunks "
+            f"from {num_documents} documents ({time.time() - start_time:.1f}s{throughput}{memory})"
+        )
+
+    def embed_chunks(self, nodes: List) -> np.ndarray:
+        """Full-dimension (before Matryoshka truncation) embeddings of chunks, embed_batch_size texts per forward pass"""
+        embed_model = Settings.embed_model
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        if not hasattr(embed_model, "get_full_text_embeddings"):
+            return np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
+        batch_size = embed_model.embed_batch_size
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            embeddings.extend(embed_model.get_full_text_embeddings(texts[start:start + batch_size]))
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def create_dedup_index(self, chunk_store: ChunkStore = None, exclude_files: Set[str] = None,
+                           stored_node: Callable[[str], BaseNode] = None) -> Optional[NearDuplicateIndex]:
+        """
+        MinHash/LSH index for one ingest, None when near-duplicate compaction is disabled
+        
+        Cập nhật incremental truyền chunk store hiện có: index được seed bằng signature đã lưu
+        (hoặc tính lại từ text của store) của các chunk không thuộc `exclude_files`, để chunk
+        của file mới được so với cả chunk đã lưu như khi build lại toàn bộ. `stored_node`: đọc lại
+        chunk đại diện đã ghi theo chunk id (ChunkStoreWriter.get_node của lần ingest).
+        """
+        if not self.config.CHUNK_DEDUP_ENABLED:
+            return None
+        dedup = NearDuplicateIndex(
+            num_perm=self.config.CHUNK_DEDUP_NUM_PERM,
+            bands=self.config.CHUNK_DEDUP_BANDS,
+            threshold=self.config.CHUNK_DEDUP_THRESHOLD,
+            stored_node=stored_node,
+        )
+        if chunk_store is None:
+            return dedup
+        
+        start_time = time.time()
+        path = self.get_dedup_signatures_path()
+        seeded = dedup.load_signatures(path, exclude_files, is_stored=lambda chunk_id: chunk_store.row(chunk_id) is not None)
+        source = path
+        if seeded is None:
+            seeded = dedup.seed_chunks(
+                (chunk_store.chunk_id(row), chunk_store.metadata(row).get('file_name', ''), chunk_store.text(row))
+                for row in chunk_store.iter_rows(exclude_files)
+            )
+            source = "chunk store text"
+        self.logger.log_info(
+            f"Seeded near-duplicate index with {seeded} stored chunks from {source} in {time.time() - start_time:.2f}s")
+        return dedup
+    
+    def release_source_documents(self, chunk_store: ChunkStore, exclude_files: Set[str]) -> Dict:
+        """Stored chunks of other files that list a changed/removed file in source_docs, with those files dropped"""
+        if chunk_store is None or not exclude_files:
+            return {}
+        doc_ids = {document_id(file_name) for file_name in exclude_files}
+        released = {}
+        for doc_id in doc_ids:
+            for row in chunk_store.document_rows(doc_id).tolist():
+                # Chunk của chính file bị xóa/thay đổi đã bị xóa khỏi index
+                if chunk_store.doc_ids[chunk_store.doc_codes[row]] in doc_ids:
+                    continue
+                chunk_id = chunk_store.chunk_id(row)
+                node = released.get(chunk_id) or chunk_store.node(row)
+                remove_source_documents(node, doc_ids)
+                released[chunk_id] = node
+        return released
+    
+    def get_dedup_signatures_path(self) -> str:
+        """MinHash signatures of the stored chunks (seed for incremental near-duplicate compaction)"""
+        if self.config.VECTOR_BACKEND == "local":
+            return os.path.join(self.config.LOCAL_VECTOR_STORE_DIR, "minhash.npz")
+        return self.get_elasticsearch_storage_path(".minhash.npz")
+
+    def _collapse_duplicates(self, document_nodes: List, dedup: NearDuplicateIndex,
+                             window: List, stale: Dict) -> List:
+        """Drop near-duplicate chunks of one document, recording which files they collapsed into"""
+        pending = {node.node_id: node for node in window}
+        kept, duplicates = dedup.collapse(document_nodes, pending)
+        for duplicate, representative in duplicates:
+            representative_file = representative.metadata.get('file_name', '')
+            duplicate_file = duplicate.metadata.get('file_name', '')
+            if representative_file == duplicate_file:
+                continue
+            # Xóa/đổi file giữ chunk đại diện thì file có chunk trùng phải index lại
+            self.duplicate_sources.setdefault(representative_file, set()).add(duplicate_file)
+            if representative.node_id not in pending:
+                stale[representative.node_id] = representative
+        return kept
+
+    def update_stored_chunks(self, nodes: List, vector_store, bulk_writer: ElasticsearchBulkWriter = None,
+                             writer: ChunkStoreWriter = None):
+        """Rewrite the metadata of chunks that are already in the vector store"""
+        if bulk_writer is not None and self.config.ES_SOURCE_EXCLUDE_VECTORS:
+            # Partial update dựng lại document từ _source (không có vector): ghi lại cả document
+            # với vector đã có (spool của lần ingest này hoặc cột vector của chunk store)
+            embeddings = self.stored_chunk_vectors(nodes, writer)
+            bulk_writer.write(nodes, Qwen3EmbeddingLlamaIndex.truncate_matrix(
+                embeddings, self.config.EMBEDDING_DIM).tolist())
+        elif bulk_writer is not None:
+            bulk_writer.update_metadata(nodes)
+        elif isinstance(vector_store, LocalVectorStore):
+            vector_store.update_metadata(nodes)
+        else:
+            # Store không hỗ trợ cập nhật metadata: embed lại và ghi đè theo node id
+            self.index.insert_nodes(nodes)
+
+    def stored_chunk_vectors(self, nodes: List, writer: ChunkStoreWriter = None) -> np.ndarray:
+        """Full-dimension vectors of already indexed chunks, only embedding the ones with no stored vector"""
+        chunk_store = ChunkStore.load(self.get_chunk_store_dir())
+        embeddings: List[Optional[np.ndarray]] = []
+        for node in nodes:
+            embedding = writer.vector(node.node_id) if writer is not None else None
+            if embedding is None and chunk_store is not None and chunk_store.has_vectors:
+                row = chunk_store.row(node.node_id)
+                if row is not None:
+                    embedding = np.asarray(chunk_store.vectors[row], dtype=np.float32)
+            embeddings.append(embedding)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            self.logger.log_info(f"{len(missing)} stored chunks have no saved vector, embedding them again")
+            for i, embedding in zip(missing, self.embed_chunks([nodes[i] for i in missing])):
+                embeddings[i] = embedding
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def get_index_build_params(self) -> Dict:
+        """Parameters that invalidate every stored chunk when they change"""
+        params = {
+            "embedding_model": self.config.EMBEDDING_MODEL,
+            "chunk_size": self.config.CHUNK_SIZE,
+            "chunk_overlap": self.config.CHUNK_OVERLAP,
+        }
+        # Chỉ ghi khi có truncate, để index cũ (vector đầy đủ) vẫn tương thích
+        if self.config.EMBEDDING_DIM:
+            params["embedding_dim"] = self.config.EMBEDDING_DIM
+        if self.config.CHUNK_DEDUP_ENABLED:
+            params["chunk_dedup_threshold"] = self.config.CHUNK_DEDUP_THRESHOLD
+        return params
+
+    def get_manifest_path(self) -> str:
+        """Path of the manifest file stored alongside the index"""
+        if self.config.VECTOR_BACKEND == "local":
+            return os.path.join(self.config.LOCAL_VECTOR_STORE_DIR, "manifest.json")
+        return self.get_elasticsearch_storage_path(".manifest.json")
+
+    def get_bm25_index_dir(self) -> str:
+        """Directory of the persisted BM25 index stored alongside the vector index"""
+        if self.config.VECTOR_BACKEND == "local":
+            return os.path.join(self.config.LOCAL_VECTOR_STORE_DIR, "bm25")
+        return self.get_elasticsearch_storage_path(".bm25")
+
+    def get_chunk_fingerprint(self) -> Optional[str]:
+        """Fingerprint of the current chunk set (from the chunk store when available), None if empty"""
+        if self.chunk_store is not None:
+            return self.chunk_store.fingerprint if len(self.chunk_store) else None
+        nodes = self.get_all_nodes()
+        return nodes_fingerprint(nodes) if nodes else None
+
+    def load_or_build_bm25_index(self) -> BM25Index:
+        """Open the persisted BM25 index, rebuilding it if the chunk set has changed"""
+        index_dir = self.get_bm25_index_dir()
+        start_time = time.time()
+        bm25_index = BM25Index.load(index_dir)
+        if bm25_index is not None and bm25_index.fingerprint == self.get_chunk_fingerprint():
+            self.logger.log_info(
+                f"Loaded BM25 index '{index_dir}' ({bm25_index.num_docs} chunks, "
+                f"{len(bm25_index.vocab)} terms) in {time.time() - start_time:.2f}s"
+            )
+            return bm25_index
+        
+        bm25_index = build_bm25_index(self.get_all_nodes())
+        bm25_index.save(index_dir)
+        self.logger.log_info(
+            f"Built BM25 index '{index_dir}' ({bm25_index.num_docs} chunks, "
+            f"{len(bm25_index.vocab)} terms) in {time.time() - start_time:.2f}s"
+        )
+        return bm25_index
+
+    def get_document_router_dir(self) -> str:
+        """Directory of the persisted document router (next to the vector index)"""
+        if self.config.VECTOR_BACKEND == "local":
+            return os.path.join(self.config.LOCAL_VECTOR_STORE_DIR, "document_router")
+        return self.get_elasticsearch_storage_path(".router")
+    
+    def load_or_build_document_router(self) -> Optional[DocumentRouter]:
+        """Open the persisted document router, rebuilding it if the chunk set has changed"""
+        # Elasticsearch chỉ dựng router được từ cột vector của chunk store: kiểm tra trước khi tính
+        # fingerprint, để warm start không export cả index chỉ để rồi tắt routing
+        if self.config.VECTOR_BACKEND != "local" and (self.chunk_store is None or not self.chunk_store.has_vectors):
+            self.logger.log_info(
+                "Chunk store has no vector column, document routing disabled (use --rebuild-index to enable it)")
+            return None
+        fingerprint = self.get_chunk_fingerprint()
+        if fingerprint is None:
+            return None
+        router_dir = self.get_document_router_dir()
+        start_time = time.time()
+        router = DocumentRouter.load(router_dir)
+        if router is not None and router.fingerprint == fingerprint \
+                and router.alpha == self.config.DOCUMENT_ROUTER_ALPHA:
+            self.logger.log_info(f"Loaded document router '{router_dir}' ({len(router.doc_ids)} documents)")
+            return router
+        
+        # Embedding tài liệu = trung bình embedding các chunk: backend local đọc thẳng từ store,
+        # Elasticsearch đọc cột vector của chunk store (ghi lúc ingest), không embed lại corpus
+        if self.config.VECTOR_BACKEND == "local":
+            nodes = self.get_all_nodes()
+            chunk_embeddings = self.create_vector_store().get_embeddings([n.node_id for n in nodes])
+        else:
+            nodes = list(self.chunk_store.iter_nodes())
+            chunk_embeddings = Qwen3EmbeddingLlamaIndex.truncate_matrix(
+                np.asarray(self.chunk_store.vectors, dtype=np.float32), self.config.EMBEDDING_DIM)
+        router = DocumentRouter.build(nodes, chunk_embeddings, alpha=self.config.DOCUMENT_ROUTER_ALPHA)
+        router.save(router_dir)
+        self.logger.log_info(
+            f"Built document router '{router_dir}' ({len(router.doc_ids)} documents) "
+            f"in {time.time() - start_time:.2f}s"
+        )
+        return router
+
+    def get_chunk_store_dir(self) -> str:
+        """Directory of the columnar chunk store (next to the vector index)"""
+        if self.config.VECTOR_BACKEND == "local":
+            return os.path.join(self.config.LOCAL_VECTOR_STORE_DIR, "chunk_store")
+        return self.get_elasticsearch_storage_path(".chunks")
+
+    def write_chunk_store(self, nodes: Iterable, vectors: Iterable = None) -> ChunkStore:
+        """Write chunks (and optionally their full-dimension vectors) into the chunk store, replacing the previous one"""
+        start_time = time.time()
+        chunk_store = ChunkStore.write(self.get_chunk_store_dir(), nodes, vectors)
+        self.log_chunk_store_written(chunk_store, start_time)
+        return chunk_store
+
+    def log_chunk_store_written(self, chunk_store: ChunkStore, start_time: float):
+        """Log the size of a chunk store written since `start_time`"""
+        vector_info = f", {chunk_store.vector_dim}-dim vectors" if chunk_store.has_vectors else ""
+        self.logger.log_info(
+            f"Wrote chunk store '{chunk_store.store_dir}' ({len(chunk_store)} chunks, "
+            f"{len(chunk_store.doc_ids)} documents{vector_info}) in {time.time() - start_time:.2f}s"
+        )
+
+    def load_or_build_chunk_store(self, num_chunks: int, build: bool = True) -> Optional[ChunkStore]:
+        """Open the chunk store, rebuilding it from the vector store if it does not match the index"""
+        store_dir = self.get_chunk_store_dir()
+        chunk_store = ChunkStore.load(store_dir)
+        if chunk_store is not None and len(chunk_store) == num_chunks:
+            self.logger.log_info(f"Loaded chunk store '{store_dir}' ({len(chunk_store)} chunks)")
+            return chunk_store
+        if not build:
+            return None
+        
+        # Index build trước khi có chunk store (hoặc store lệch): đọc lại chunk từ vector store.
+        # Vector của index chỉ dùng được làm cột vector khi không bị cắt Matryoshka
+        self.logger.log_info(f"Chunk store '{store_dir}' missing or stale, rebuilding from the index")
+        if self.config.VECTOR_BACKEND == "local" and not self.config.EMBEDDING_DIM:
+            vector_store = self.create_vector_store()
+            return self.write_chunk_store(
+                vector_store.get_nodes(), (row for _, embeddings in vector_store.iter_batches() for row in embeddings))
+        if self.config.VECTOR_BACKEND == "local":
+            nodes = self.create_vector_store().get_nodes()
+        else:
+            nodes = self.iter_nodes_from_elasticsearch(self.es_client)
+        return self.write_chunk_store(nodes)
+
+    def get_table_store_path(self) -> str:
+        """Path of the persisted table store (next to the vector index)"""
+        if self.config.VECTOR_BACKEND == "local":
+            return os.path.join(self.config.LOCAL_VECTOR_STORE_DIR, "tables.jsonl")
+        return self.get_elasticsearch_storage_path(".tables.jsonl")
+    
+    def get_table_store(self) -> TableStore:
+        """Loaded table store; index build trước khi có table store thì tách bảng từ documents một lần"""
+        if self.table_store is not None:
+            return self.table_store
+        path = self.get_table_store_path()
+        self.table_store = TableStore.load(path)
+        if self.table_store is None:
+            self.table_store = TableStore()
+            if os.path.exists(self.config.DOCUMENT_PATH):
+                for document in self.iter_documents():
+                    self.table_store.add_documents([document])
+                self.table_store.save(path)
+        return self.table_store
+
+    def get_index_name(self) -> str:
+        """Name of the index for the configured backend"""
+        if self.config.VECTOR_BACKEND == "local":
+            return self.config.LOCAL_VECTOR_STORE_DIR
+        return self.config.ELASTICSEARCH_INDEX
+
+    def create_vector_store(self):
+        """Create vector store for the configured backend"""
+        if self.config.VECTOR_BACKEND == "local":
+            # Dùng chung một instance vì store giữ memmap + metadata trong process
+            if self.vector_store is None:
+                self.vector_store = LocalVectorStore(
+                    persist_dir=self.config.LOCAL_VECTOR_STORE_DIR,
+                    dtype=self.config.LOCAL_VECTOR_DTYPE,
+                    index_type=self.config.LOCAL_VECTOR_INDEX,
+                    hnsw_m=self.config.HNSW_M,
+                    hnsw_ef_construction=self.config.HNSW_EF_CONSTRUCTION,
+                    hnsw_ef_search=self.config.HNSW_EF_SEARCH,
+                    hnsw_library=self.config.HNSW_LIBRARY,
+                    quantization=self.config.LOCAL_VECTOR_QUANTIZATION,
+                    rescore_factor=self.config.QUANTIZATION_RESCORE_FACTOR,
+                    pq_subvector_dim=self.config.PQ_SUBVECTOR_DIM,
+                )
+            return self.vector_store
+        return self.create_elasticsearch_vector_store()
+
+    def scan_document_manifest(self) -> IndexManifest:
+        """Hash current document directory into a manifest"""
+        return IndexManifest.from_directory(
+            self.get_index_name(),
+            self.get_index_build_params(),
+            self.config.DOCUMENT_PATH,
+        )
+
+    def _count_chunks_by_file(self, nodes: List, counts: Dict[str, int] = None) -> Dict[str, int]:
+        """Đếm số chunk theo file_name (cộng dồn vào `counts` nếu có)"""
+        counts = {} if counts is None else counts
+        for node in nodes:
+            file_name = node.metadata.get('file_name', 'unknown')
+            counts[file_name] = counts.get(file_name, 0) + 1
+        return counts
+
+    def delete_document_chunks(self, file_names: List[str], chunk_store: ChunkStore = None):
+        """Delete every stored chunk that belongs to the given files"""
+        if not file_names:
+            return
+        if self.config.TABLE_STORE_ENABLED:
+            table_store = self.get_table_store()
+            table_store.remove_files(file_names)
+            table_store.save(self.get_table_store_path())
+        if self.config.VECTOR_BACKEND == "local":
+            vector_store = self.create_vector_store()
+            if chunk_store is not None and len(chunk_store) == vector_store.count():
+                # Chunk id của các file lấy từ cột mã tài liệu của chunk store: xóa theo id
+                # (tra hash), không phải parse metadata của mọi record trong sidecar
+                vector_store.delete_nodes(
+                    node_ids=[chunk_store.chunk_id(row) for row in chunk_store.file_rows(file_names).tolist()])
+                return
+            vector_store.delete_nodes(filters=MetadataFilters(filters=[
+                MetadataFilter(key="file_name", value=file_names, operator=FilterOperator.IN)
+            ]))
+            return
+        self.es_client.delete_by_query(
+            index=self.config.ELASTICSEARCH_INDEX,
+            query={"terms": {self.get_elasticsearch_file_name_field(): file_names}},
+            refresh=True,
+        )
+
+    def update_index_incrementally(self) -> bool:
+        """
+        Re-chunk and re-embed only added/changed files, delete chunks of removed files
+        
+        Returns:
+            False nếu index được build với tham số khác (cần build lại toàn bộ)
+        """
+        manifest_path = self.get_manifest_path()
+        stored = IndexManifest.load(manifest_path)
+        if stored is None:
+            self.logger.log_info(
+                "No index manifest found, skipping incremental update "
+                "(use --rebuild-index to enable it)"
+            )
+            return True
+        
+        current = self.scan_document_manifest()
+        if not stored.is_compatible(current):
+            self.logger.log_info(
+                f"Index build parameters changed ({stored.build_params} -> {current.build_params})"
+            )
+            return False
+        
+        added, changed, removed = stored.diff(current)
+        if not (added or changed or removed):
+            self.logger.log_info("Index is up to date with documents directory")
+            return True
+        
+        self.logger.log_info(
+            f"Incremental index update: {len(added)} added, "
+            f"{len(changed)} changed, {len(removed)} removed files"
+        )
+        
+        # File có chunk trùng chỉ được lưu ở chunk đại diện của file thay đổi/bị xóa: index lại
+        dependents = [
+            file_name for file_name in stored.dependent_files(changed + removed)
+            if file_name in current.files and file_name not in added + changed
+        ]
+        if dependents:
+            self.logger.log_info(f"Re-indexing {len(dependents)} files with collapsed duplicates: {dependents}")
+            changed = changed + dependents
+        
+        # Chunk gần trùng: chunk của file mới phải được so với các chunk đã lưu (seed từ chunk
+        # store), index cũ chưa có chunk store thì build lại toàn bộ để kết quả gộp giống nhau
+        chunk_store = ChunkStore.load(self.get_chunk_store_dir())
+        exclude_files = set(changed + removed)
+        if self.config.CHUNK_DEDUP_ENABLED and chunk_store is None:
+            self.logger.log_info("Near-duplicate compaction needs the chunk store for incremental updates, rebuilding")
+            return False
+        # Chunk đại diện ở file khác bỏ document id của file thay đổi/bị xóa khỏi source_docs
+        # (file thay đổi vẫn trùng thì được gộp lại khi ingest)
+        released = self.release_source_documents(chunk_store, exclude_files)
+        
+        # Chunk store mới ghi theo luồng: chunk của file không đổi trước (chunk đã lưu bỏ bớt tài
+        # liệu nguồn lấy bản mới), rồi chunk mới theo từng window của ingest (store chưa có thì
+        # build lúc warm start); cột vector chỉ giữ được khi store cũ có vector. Chunk đại diện
+        # của chunk trùng được đọc lại từ writer
+        writer = None
+        if chunk_store is not None:
+            start_time = time.time()
+            writer = ChunkStoreWriter(self.get_chunk_store_dir(), with_vectors=chunk_store.has_vectors)
+        dedup = self.create_dedup_index(chunk_store, exclude_files, writer.get_node if writer is not None else None)
+        
+        # Xóa chunks cũ của file thay đổi hoặc bị xóa
+        self.delete_document_chunks(changed + removed, chunk_store)
+        
+        # Chunk + embed lại chỉ các file thêm mới/thay đổi
+        chunk_counts = {}
+        self.duplicate_sources = {}
+        self.updated_chunks = {}
+        with writer if writer is not None else nullcontext():
+            if writer is not None:
+                stored_vectors = chunk_store.iter_vectors(exclude_files) if chunk_store.has_vectors \
+                    else itertools.repeat(None)
+                for node, vector in zip(chunk_store.iter_nodes(exclude_files), stored_vectors):
+                    writer.append([released.get(node.node_id, node)], None if vector is None else [vector])
+            
+            if added or changed:
+                self.setup_chunking()
+                documents = self.iter_documents(added + changed)
+                chunk_counts = self.index_documents(documents, self.create_vector_store(), writer, dedup)
+                if self.es_client is not None:
+                    self.es_client.indices.refresh(index=self.config.ELASTICSEARCH_INDEX)
+            elif dedup is not None:
+                # Chỉ xóa file: bỏ signature của chunk đã xóa
+                dedup.save(self.get_dedup_signatures_path())
+            
+            released_only = [node for chunk_id, node in released.items() if chunk_id not in self.updated_chunks]
+            if released_only:
+                bulk_writer = self.create_bulk_writer()
+                vector_store = self.create_vector_store()
+                if self.index is None:
+                    self.index = VectorStoreIndex.from_vector_store(vector_store)
+                with bulk_writer if bulk_writer is not None else nullcontext():
+                    self.update_stored_chunks(released_only, vector_store, bulk_writer, writer)
+        if writer is not None:
+            self.log_chunk_store_written(writer.chunk_store, start_time)
+        
+        # Giữ số chunk của các file không đổi, cập nhật file mới
+        reindexed = set(changed + removed)
+        for file_name, entry in current.files.items():
+            if file_name in stored.files and file_name not in changed:
+                entry["num_chunks"] = stored.files[file_name].get("num_chunks")
+                sources = [
+                    source for source in stored.files[file_name].get("duplicate_sources", [])
+                    if source not in reindexed
+                ]
+                if sources:
+                    entry["duplicate_sources"] = sources
+        current.set_chunk_counts(chunk_counts)
+        current.set_duplicate_sources(self.duplicate_sources)
+        current.save(manifest_path)
+        
+        self.logger.log_info("Incremental index update completed")
+        return True
+
+    def create_local_index(self, documents: List = None, force_rebuild: bool = False):
+        """Create or load the embedded in-process vector index (no Elasticsearch)"""
+        store_dir = self.config.LOCAL_VECTOR_STORE_DIR
+        store_exists = LocalVectorStore.exists(store_dir)
+        vector_store = self.create_vector_store()
+        
+        if store_exists and force_rebuild:
+            self.logger.log_info(f"Clearing existing local vector store: {store_dir}")
+            vector_store.clear()
+        
+        elif store_exists:
+            start_time = time.time()
+            
+            # Cập nhật các file thêm mới/thay đổi/bị xóa trước khi warm start
+            index_usable = True
+            if self.config.INCREMENTAL_INDEX_UPDATE:
+                index_usable = self.update_index_incrementally()
+            
+            if index_usable and vector_store.count() > 0:
+                self.index = VectorStoreIndex.from_vector_store(vector_store)
+                self.chunk_store = self.load_or_build_chunk_store(vector_store.count())
+                elapsed = time.time() - start_time
+                self.logger.log_info(
+                    f"Loaded local vector store '{store_dir}' ({len(self.chunk_store)} chunks) in {elapsed:.2f}s"
+                )
+                return
+            
+            self.logger.log_info(f"Clearing incompatible local vector store: {store_dir}")
+            vector_store.clear()
+        
+        # Đọc documents dần theo từng file nếu chưa được truyền vào (streaming ingest)
+        if documents is None:
+            documents = self.iter_documents()
+        elif not documents:
+            raise ValueError("Documents are required for creating new index")
+        
+        self.logger.log_info("Creating new local vector store...")
+        self.setup_chunking()
+        self.table_store = TableStore()  # Build lại toàn bộ: bỏ bảng của index cũ
+        start_time = time.time()
+        with ChunkStoreWriter(self.get_chunk_store_dir()) as writer:
+            chunk_counts = self.index_documents(documents, vector_store, writer)
+        self.chunk_store = writer.chunk_store
+        self.log_chunk_store_written(self.chunk_store, start_time)
+        
+        # Lưu manifest để các lần sau chỉ cập nhật file thay đổi
+        manifest = self.scan_document_manifest()
+        manifest.set_chunk_counts(chunk_counts)
+        manifest.set_duplicate_sources(self.duplicate_sources)
+        manifest.save(self.get_manifest_path())
+        
+        self.logger.log_info(f"Local vector store created with {vector_store.count()} chunks")
+        
+        if self.config.LOCAL_VECTOR_QUANTIZATION != "none":
+            # Train lại quantizer trên toàn bộ vector (lúc add chỉ có batch đầu)
+            vector_store.train_quantizer()
+            self.log_quantization_report(vector_store)
+
+    def log_quantization_report(self, vector_store: LocalVectorStore):
+        """Log index size and recall trade-off of the quantized storage mode"""
+        report = vector_store.quantization_report(top_k=self.config.HYBRID_TOP_K)
+        if report is None:
+            return
+        recall_keys = [key for key in report if key.startswith("recall@")]
+        self.logger.log_info(
+            f"Quantization '{report['quantization']}': {report['float_mb']:.1f}MB {report['vector_dtype']} -> "
+            f"{report['codes_mb']:.2f}MB codes ({report['compression']:.1f}x), "
+            + ", ".join(f"{key}={report[key]:.3f}" for key in recall_keys)
+        )
+
+    def create_elasticsearch_index(self, documents: List = None, force_rebuild: bool = False):
         """Create or load Elasticsearch index with hybrid retrieval support"""
         
         # Setup Elasticsearch client - đảm bảo luôn được khởi tạo
         es_client = self.setup_elasticsearch_client()
+        self.es_client = es_client
         
+        index_exists = False
         try:
-            # Kiểm tra index đã tồn tại chưa
+            # Kiểm tra index đã tồn tại chưa (tên cấu hình có thể là alias trỏ tới index có version)
             index_exists = es_client.indices.exists(index=self.config.ELASTICSEARCH_INDEX)
+            if index_exists:
+                self.es_index_version = self.resolve_elasticsearch_index()
             
-            if index_exists and not force_rebuild:
-                # Index đã được load ở initialize(), không cần làm gì thêm
-                self.logger.log_info(f"Index already loaded in initialize()")
-                return
-                
-            elif index_exists and force_rebuild:
-                self.logger.log_info(f"Deleting existing index: {self.config.ELASTICSEARCH_INDEX}")
-                es_client.indices.delete(index=self.config.ELASTICSEARCH_INDEX)
+            # Blue/green: giữ index cũ phục vụ truy vấn tới khi index mới build xong
+            if index_exists and force_rebuild and not self.config.ES_BLUE_GREEN_REBUILD:
+                self.delete_elasticsearch_index()
             
         except Exception as e:
             self.logger.log_info(f"Could not check existing index ({str(e)}), creating new one...")
         
+        if index_exists and not force_rebuild:
+            # Cập nhật các file thêm mới/thay đổi/bị xóa trước khi warm start
+            index_usable = True
+            if self.config.INCREMENTAL_INDEX_UPDATE:
+                index_usable = self.update_index_incrementally()
+            
+            # Warm start: dùng lại index đã có, không embed lại corpus
+            if index_usable and self.load_existing_index(es_client):
+                return
+            
+            if not index_usable:
+                self.logger.log_info(f"Index {self.config.ELASTICSEARCH_INDEX} is incompatible, rebuilding")
+                if not self.config.ES_BLUE_GREEN_REBUILD:
+                    self.delete_elasticsearch_index()
+        
+        # Đọc documents dần theo từng file nếu chưa được truyền vào (streaming ingest)
+        if documents is None:
+            documents = self.iter_documents()
+        
         # Validate documents required for new index
-        if documents is None or len(documents) == 0:
+        elif len(documents) == 0:
             raise ValueError("Documents are required for creating new index")
         
         self.logger.log_info("Creating new Elasticsearch index with hybrid retrieval support...")
@@ -1213,129 +2858,307 @@ Hướng dẫn chung:
         # Setup optimal chunking
         self.setup_chunking()
         
-        # Tạo ElasticsearchStore với custom mapping để hỗ trợ hybrid search
-        vector_store = ElasticsearchStore(
-            index_name=self.config.ELASTICSEARCH_INDEX,
-            es_client=es_client,  # Đảm bảo es_client đã được khởi tạo
-            # Elasticsearch sẽ tự động lưu cả text và vector
-            # text_field: lưu text content
-            # vector_field: lưu embedding vector
-        )
-        
-        # Create index từ documents
-        # Documents sẽ được chunked và embedded tự động
-        self.index = VectorStoreIndex.from_documents(
-            documents,
-            vector_store=vector_store,
-            show_progress=True,
-            # transformations are applied automatically from Settings
-        )
+        # Blue/green: build vào index mới có version, alias chỉ đổi sang khi build xong
+        if self.config.ES_BLUE_GREEN_REBUILD:
+            self.es_index_version = self.new_elasticsearch_index_version()
+        else:
+            self.es_index_version = self.config.ELASTICSEARCH_INDEX
+        build_index = self.es_index_version
+        self.logger.log_info(f"Building index '{build_index}'")
+        
+        # Tạo ElasticsearchStore, Elasticsearch sẽ lưu cả text và vector
+        # text_field: lưu text content
+        # vector_field: lưu embedding vector
+        vector_store = self.create_elasticsearch_vector_store(build_index)
+        
+        # Mapping tường minh (HNSW lượng tử, keyword); bulk writer tự tạo index với mapping này
+        if not self.config.ES_BULK_INGEST:
+            self.ensure_elasticsearch_index(
+                self.config.EMBEDDING_DIM or len(self.embed_model.get_text_embedding("dimension")))
+        
+        # Chunk + embed documents, ghi từng window vào chunk store (nguồn của BM25 / router)
+        self.table_store = TableStore()  # Build lại toàn bộ: bỏ bảng của index cũ
+        start_time = time.time()
+        with ChunkStoreWriter(self.get_chunk_store_dir()) as writer:
+            chunk_counts = self.index_documents(documents, vector_store, writer)
+        self.chunk_store = writer.chunk_store
+        self.log_chunk_store_written(self.chunk_store, start_time)
+        
+        # Lưu manifest để các lần sau chỉ cập nhật file thay đổi
+        manifest = self.scan_document_manifest()
+        manifest.set_chunk_counts(chunk_counts)
+        manifest.set_duplicate_sources(self.duplicate_sources)
+        manifest.save(self.get_manifest_path())
 
         # Flush và refresh index để đảm bảo dữ liệu được lưu vào disk
         try:
-            if es_client.indices.exists(index=self.config.ELASTICSEARCH_INDEX):
-                es_client.indices.flush(index=self.config.ELASTICSEARCH_INDEX)
-                es_client.indices.refresh(index=self.config.ELASTICSEARCH_INDEX)
+            if es_client.indices.exists(index=build_index):
+                es_client.indices.flush(index=build_index)
+                es_client.indices.refresh(index=build_index)
                 self.logger.log_info("Elasticsearch index flushed and refreshed - data persisted to disk")
             else:
                 self.logger.log_info("Index not found, skipping flush/refresh")
         except Exception as e:
             self.logger.log_error(f"Could not flush/refresh index: {str(e)}")
         
+        if self.config.ES_BLUE_GREEN_REBUILD:
+            # Đổi alias sang index mới, truy vấn từ đây đi qua alias
+            self.swap_elasticsearch_alias(build_index)
+            self.index = VectorStoreIndex.from_vector_store(self.create_elasticsearch_vector_store())
+        
         self.logger.log_info("Elasticsearch index created successfully with hybrid retrieval support")
 
+    def iter_index_batches(self, num_chunks: int) -> Iterator[Tuple[List, np.ndarray]]:
+        """
+        Stream stored chunks with their vectors, INDEX_INSERT_BATCH_SIZE chunks per batch
+
+        Vector lấy từ cột vector của chunk store (vector đầy đủ, trước khi cắt Matryoshka) khi
+        store khớp index; backend local không cắt vector thì đọc thẳng vector store (float32).
+        Elasticsearch không trả vector trong _source và không có cột vector thì báo lỗi thay vì
+        embed lại cả corpus.
+        """
+        batch_size = self.config.INDEX_INSERT_BATCH_SIZE
+        chunk_store = ChunkStore.load(self.get_chunk_store_dir())
+        if chunk_store is not None and (not chunk_store.has_vectors or len(chunk_store) != num_chunks):
+            chunk_store = None
+        if self.config.VECTOR_BACKEND == "local":
+            if chunk_store is not None and self.config.EMBEDDING_DIM:
+                yield from chunk_store.iter_batches(batch_size)
+            else:
+                yield from self.create_vector_store().iter_batches(batch_size)
+            return
+        if chunk_store is not None:
+            yield from chunk_store.iter_batches(batch_size)
+            return
+        
+        nodes, embeddings = [], []
+        for hit in helpers.scan(
+            self.es_client,
+            index=self.config.ELASTICSEARCH_INDEX,
+            query={"query": {"match_all": {}}},
+            size=self.config.ELASTICSEARCH_SCROLL_SIZE,
+        ):
+            embedding = hit["_source"].get(self.config.ELASTICSEARCH_VECTOR_FIELD)
+            if embedding is None:
+                raise ValueError(
+                    f"Index {self.config.ELASTICSEARCH_INDEX} does not return vectors in _source and chunk store "
+                    f"'{self.get_chunk_store_dir()}' has no vector column matching it (use --rebuild-index)"
+                )
+            embeddings.append(embedding)
+            nodes.append(convert_es_hit_to_node(hit, self.config.ELASTICSEARCH_TEXT_FIELD))
+            if len(nodes) == batch_size:
+                yield nodes, np.asarray(embeddings, dtype=np.float32)
+                nodes, embeddings = [], []
+        if nodes:
+            yield nodes, np.asarray(embeddings, dtype=np.float32)
+
+    def export_index_snapshot(self, path: str, vector_dtype: str = None) -> int:
+        """Dump every stored chunk (text, metadata, vector) into a snapshot file, without the embedding model"""
+        start_time = time.time()
+        if self.config.VECTOR_BACKEND == "local":
+            if not LocalVectorStore.exists(self.config.LOCAL_VECTOR_STORE_DIR):
+                raise ValueError(f"No local vector store found at {self.config.LOCAL_VECTOR_STORE_DIR}")
+            num_chunks = self.create_vector_store().count()
+        else:
+            self.es_client = self.setup_elasticsearch_client()
+            if not self.es_client.indices.exists(index=self.config.ELASTICSEARCH_INDEX):
+                raise ValueError(f"Index {self.config.ELASTICSEARCH_INDEX} does not exist")
+            self.es_index_version = self.resolve_elasticsearch_index()
+            num_chunks = self.es_client.count(index=self.config.ELASTICSEARCH_INDEX)["count"]
+        
+        # Manifest + bảng đi kèm để index khôi phục vẫn cập nhật incremental được
+        manifest = IndexManifest.load(self.get_manifest_path())
+        table_store = TableStore.load(self.get_table_store_path())
+        header = {
+            "created_at": datetime.now().isoformat(),
+            "source": self.get_index_name(),
+            "num_chunks": num_chunks,
+            "build_params": manifest.build_params if manifest is not None else self.get_index_build_params(),
+            "files": manifest.files if manifest is not None else None,
+            "tables": table_store.tables if table_store is not None else None,
+        }
+        self.logger.log_info(f"Exporting {num_chunks} chunks from '{self.get_index_name()}' to {path}...")
+        with SnapshotWriter(path, header, vector_dtype or self.config.SNAPSHOT_VECTOR_DTYPE) as writer:
+            for nodes, embeddings in self.iter_index_batches(num_chunks):
+                writer.write(nodes, embeddings)
+        
+        self.logger.log_info(
+            f"Exported {writer.num_chunks} chunks to {path} "
+            f"({os.path.getsize(path) / 1024 / 1024:.1f}MB) in {time.time() - start_time:.2f}s"
+        )
+        return writer.num_chunks
+
+    def import_index_snapshot(self, path: str, force: bool = False) -> int:
+        """
+        Bulk-load a snapshot into a fresh index of the configured backend
+
+        Không embed lại: vector trong snapshot (cắt Matryoshka nếu snapshot lưu vector đầy đủ)
+        được ghi thẳng (bulk writer với Elasticsearch); chunk store kèm cột vector, manifest,
+        table store và document router được dựng từ snapshot.
+        """
+        start_time = time.time()
+        reader = SnapshotReader(path)
+        header = reader.header
+        build_params = self.get_index_build_params()
+        if header["build_params"] != build_params:
+            raise ValueError(
+                f"Snapshot was built with {header['build_params']}, current configuration uses {build_params}"
+            )
+        
+        # Chỉ khôi phục vào index trống (hoặc xóa index cũ khi force)
+        if self.config.VECTOR_BACKEND == "local":
+            vector_store = self.create_vector_store()
+            if vector_store.count() and not force:
+                raise ValueError(
+                    f"Local vector store {self.config.LOCAL_VECTOR_STORE_DIR} is not empty (use --force to replace it)"
+                )
+            vector_store.clear()
+        else:
+            self.es_client = self.setup_elasticsearch_client()
+            if self.es_client.indices.exists(index=self.config.ELASTICSEARCH_INDEX):
+                if not force:
+                    raise ValueError(
+                        f"Index {self.config.ELASTICSEARCH_INDEX} already exists (use --force to replace it)"
+                    )
+                if not self.config.ES_BLUE_GREEN_REBUILD:
+                    self.delete_elasticsearch_index()
+            # Blue/green: nạp vào index mới có version, đổi alias khi xong
+            if self.config.ES_BLUE_GREEN_REBUILD:
+                self.es_index_version = self.new_elasticsearch_index_version()
+            else:
+                self.es_index_version = self.config.ELASTICSEARCH_INDEX
+        
+        self.logger.log_info(f"Importing {header['num_chunks']} chunks from {path} into '{self.get_index_name()}'...")
+        bulk_writer = self.create_bulk_writer()
+        if bulk_writer is None and self.config.VECTOR_BACKEND == "elasticsearch":
+            vector_store = self.create_elasticsearch_vector_store(self.get_elasticsearch_write_index())
+        num_chunks = 0
+        with bulk_writer or nullcontext():
+            for nodes, embeddings in reader.iter_blocks():
+                embeddings = Qwen3EmbeddingLlamaIndex.truncate_matrix(embeddings, self.config.EMBEDDING_DIM)
+                if bulk_writer is not None:
+                    bulk_writer.write(nodes, embeddings.tolist())
+                else:
+                    if self.config.VECTOR_BACKEND == "elasticsearch":
+                        self.ensure_elasticsearch_index(embeddings.shape[1])
+                    for node, embedding in zip(nodes, embeddings):
+                        node.embedding = embedding.tolist()
+                    vector_store.add(nodes)
+                num_chunks += len(nodes)
+                self.logger.log_info(
+                    f"Imported {num_chunks}/{header['num_chunks']} chunks ({time.time() - start_time:.1f}s)"
+                )
+        if self.config.VECTOR_BACKEND == "local":
+            vector_store.persist()
+            if self.config.LOCAL_VECTOR_QUANTIZATION != "none":
+                vector_store.train_quantizer()
+        
+        self.chunk_store = self.write_chunk_store(
+            reader.iter_nodes(), (row for _, embeddings in reader.iter_blocks() for row in embeddings))
+        if header.get("files") is not None:
+            IndexManifest(self.get_index_name(), build_params, header["files"]).save(self.get_manifest_path())
+        if header.get("tables") is not None:
+            TableStore(header["tables"]).save(self.get_table_store_path())
+        # Signature MinHash không có trong snapshot: lần cập nhật incremental tính lại từ chunk store
+        if os.path.exists(self.get_dedup_signatures_path()):
+            os.remove(self.get_dedup_signatures_path())
+        if self.config.DOCUMENT_ROUTING != "off" and num_chunks:
+            # Embedding tài liệu lấy từ vector trong snapshot (cột vector của chunk store vừa ghi)
+            router = DocumentRouter.build(
+                list(self.chunk_store.iter_nodes()),
+                Qwen3EmbeddingLlamaIndex.truncate_matrix(
+                    np.asarray(self.chunk_store.vectors, dtype=np.float32), self.config.EMBEDDING_DIM),
+                alpha=self.config.DOCUMENT_ROUTER_ALPHA,
+            )
+            router.save(self.get_document_router_dir())
+        if self.config.VECTOR_BACKEND == "elasticsearch" and self.config.ES_BLUE_GREEN_REBUILD:
+            self.swap_elasticsearch_alias(self.es_index_version)
+        
+        self.logger.log_info(
+            f"Imported {num_chunks} chunks into '{self.get_index_name()}' in {time.time() - start_time:.2f}s "
+            f"({num_chunks / max(time.time() - start_time, 1e-9):.1f} chunks/s)"
+        )
+        return num_chunks
+
+    def get_batch_search_params(self) -> Dict:
+        """Elasticsearch params cho retrieve_many (_msearch); backend local dùng query_many của store"""
+        if self.config.VECTOR_BACKEND != "elasticsearch":
+            return {}
+        return {
+            "es_client": self.es_client,
+            "es_index_name": self.config.ELASTICSEARCH_INDEX,
+            "es_text_field": self.config.ELASTICSEARCH_TEXT_FIELD,
+            "es_vector_field": self.config.ELASTICSEARCH_VECTOR_FIELD,
+        }
+    
     def create_hybrid_retriever(self):
         """Create hybrid retriever combining vector search and keyword search"""
         
+        if self.config.VECTOR_BACKEND == "elasticsearch" and self.config.HYBRID_MODE == "elasticsearch":
+            self.logger.log_info(f"Using server-side hybrid search ({self.config.ES_HYBRID_FUSION} fusion)")
+            return ElasticsearchHybridRetriever(
+                es_client=self.es_client,
+                index_name=self.config.ELASTICSEARCH_INDEX,
+                embed_model=self.embed_model,
+                text_field=self.config.ELASTICSEARCH_TEXT_FIELD,
+                vector_field=self.config.ELASTICSEARCH_VECTOR_FIELD,
+                alpha=self.config.HYBRID_ALPHA,
+                top_k=self.config.HYBRID_COMBINED_TOP_K,
+                num_candidates=self.config.ES_KNN_NUM_CANDIDATES,
+                fusion=self.config.ES_HYBRID_FUSION,
+                rrf_rank_constant=self.config.ES_RRF_RANK_CONSTANT,
+            )
+        
         # Vector retriever (semantic search)
-        vector_retriever = VectorIndexRetriever(
-            index=self.index,
-            similarity_top_k=self.config.HYBRID_TOP_K,
-        )
+        matryoshka_refine = self.config.EMBEDDING_DIM and self.config.MATRYOSHKA_REFINE
+        if matryoshka_refine and (self.chunk_store is None or not self.chunk_store.has_vectors):
+            self.logger.log_info(
+                "Chunk store has no vector column, Matryoshka refine disabled (use --rebuild-index to enable it)")
+            matryoshka_refine = False
+        if matryoshka_refine:
+            # Shortlist bằng vector ngắn, rescore bằng vector đầy đủ
+            vector_retriever = MatryoshkaRefineRetriever(
+                BatchVectorIndexRetriever(
+                    index=self.index,
+                    similarity_top_k=self.config.HYBRID_TOP_K * self.config.MATRYOSHKA_REFINE_FACTOR,
+                    **self.get_batch_search_params(),
+                ),
+                embed_model=self.embed_model,
+                chunk_store=self.chunk_store,
+                top_k=self.config.HYBRID_TOP_K,
+            )
+        else:
+            vector_retriever = BatchVectorIndexRetriever(
+                index=self.index,
+                similarity_top_k=self.config.HYBRID_TOP_K,
+                **self.get_batch_search_params(),
+            )
         
-        # BM25 retriever (keyword search) - lấy nodes từ index
-        nodes = []
+        # BM25 retriever (keyword search) - lấy nodes từ chunk store / index
         try:
-            # Với Elasticsearch, cần lấy nodes từ docstore hoặc từ Elasticsearch
-            if hasattr(self.index, 'storage_context') and hasattr(self.index.storage_context, 'docstore'):
-                for node_id in self.index.storage_context.docstore.docs:
-                    node = self.index.storage_context.docstore.get_node(node_id)
-                    if node:
-                        nodes.append(node)
-            else:
-                # Fallback: nếu không có docstore, chỉ dùng vector retriever
-                self.logger.log_info("No docstore available, using vector retriever only")
-                return vector_retriever
+            fingerprint = self.get_chunk_fingerprint()
         except Exception as e:
             self.logger.log_error(f"Error getting nodes for BM25: {str(e)}")
             # Fallback: nếu lỗi, chỉ dùng vector retriever
             return vector_retriever
         
-        if not nodes:
+        if fingerprint is None:
             self.logger.log_info("No nodes found, using vector retriever only")
             return vector_retriever
         
-        # Tạo BM25 retriever từ nodes
-        bm25_retriever = BM25Retriever.from_defaults(
-            nodes=nodes,
+        # Node của kết quả BM25 đọc theo chunk id từ chunk store (O(1), không giữ node trong RAM);
+        # index cũ chưa có chunk store thì ghi một lần thay vì dựng dict node_id -> node
+        if self.chunk_store is None:
+            self.chunk_store = self.write_chunk_store(self.get_all_nodes())
+        
+        # BM25 retriever từ index CSR lưu trên đĩa (chỉ build lại khi tập chunk thay đổi)
+        bm25_retriever = BM25IndexRetriever(
+            self.load_or_build_bm25_index(),
+            get_node=self.chunk_store.get_node,
             similarity_top_k=self.config.HYBRID_TOP_K,
+            pruning=self.config.BM25_DYNAMIC_PRUNING,
         )
         
-        # Tạo hybrid retriever với weighted combination
-        class HybridRetriever(BaseRetriever):
-            def __init__(self, vector_retriever, bm25_retriever, alpha=0.5, top_k=10):
-                super().__init__()
-                self.vector_retriever = vector_retriever
-                self.bm25_retriever = bm25_retriever
-                self.alpha = alpha  # 0.5 = balanced, 0.0 = only keyword, 1.0 = only vector
-                self.top_k = top_k  # Truyền top_k vào
-            
-            def _retrieve(self, query_bundle):
-                # Retrieve từ cả 2 methods
-                vector_nodes = self.vector_retriever.retrieve(query_bundle)
-                keyword_nodes = self.bm25_retriever.retrieve(query_bundle)
-                
-                # Combine results với weighted scoring
-                combined_nodes = {}
-                
-                # Add vector results
-                for node in vector_nodes:
-                    node_id = node.node_id
-                    score = getattr(node, 'score', 0.0)
-                    combined_nodes[node_id] = {
-                        'node': node,
-                        'vector_score': score * self.alpha,
-                        'keyword_score': 0.0
-                    }
-                
-                # Add keyword results
-                for node in keyword_nodes:
-                    node_id = node.node_id
-                    score = getattr(node, 'score', 0.0)
-                    if node_id in combined_nodes:
-                        combined_nodes[node_id]['keyword_score'] = score * (1 - self.alpha)
-                    else:
-                        combined_nodes[node_id] = {
-                            'node': node,
-                            'vector_score': 0.0,
-                            'keyword_score': score * (1 - self.alpha)
-                        }
-                
-                # Calculate combined scores
-                for node_id, data in combined_nodes.items():
-                    combined_score = data['vector_score'] + data['keyword_score']
-                    data['node'].score = combined_score
-                
-                # Sort by combined score và return top K
-                sorted_nodes = sorted(
-                    combined_nodes.values(),
-                    key=lambda x: x['vector_score'] + x['keyword_score'],
-                    reverse=True
-                )
-                
-                # Return top K nodes
-                return [item['node'] for item in sorted_nodes[:self.top_k]]
-        
         hybrid_retriever = HybridRetriever(
             vector_retriever=vector_retriever,
             bm25_retriever=bm25_retriever,
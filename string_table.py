@@ -0,0 +1,101 @@
+"""
+String Table Module
+Danh sách chuỗi dạng memory-map: UTF-8 nối liền + offset, kèm bảng băm (crc32, open
+addressing) để tra chuỗi -> vị trí O(1) mà không nạp list / dict của chuỗi vào RAM
+"""
+
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+EMPTY_SLOT = -1
+
+
+def _slot(key: bytes, mask: int) -> int:
+    return zlib.crc32(key) & mask
+
+
+def build_hash_table(keys: Iterable[bytes], count: int) -> np.ndarray:
+    """Open addressing table slot -> position (-1 = empty) over `count` keys, load factor <= 0.5"""
+    table_size = 1 << max(4, (2 * count).bit_length())
+    table = np.full(table_size, EMPTY_SLOT, dtype=np.int64)
+    for position, key in enumerate(keys):
+        slot = _slot(key, table_size - 1)
+        while table[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & (table_size - 1)
+        table[slot] = position
+    return table
+
+
+class StringTable:
+    """
+    Read-only list of strings with string -> position lookup
+
+    Ba mảng: blob (uint8, UTF-8 nối liền), offsets (int64, n + 1) và table (bảng băm);
+    load() memory-map cả ba nên số chuỗi không ảnh hưởng bộ nhớ lúc khởi động.
+    """
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray, table: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+        self._table = table
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def key(self, position: int) -> bytes:
+        """UTF-8 bytes of the string at a position"""
+        return self._blob[int(self._offsets[position]):int(self._offsets[position + 1])].tobytes()
+
+    def __getitem__(self, position: int) -> str:
+        return self.key(position).decode('utf-8')
+
+    def __iter__(self) -> Iterator[str]:
+        for position in range(len(self)):
+            yield self[position]
+
+    def __contains__(self, string: str) -> bool:
+        return self.get(string) is not None
+
+    def get(self, string: str) -> Optional[int]:
+        """Position of a string (hash table probe), None if it is not in the table"""
+        if not len(self):
+            return None
+        key = string.encode('utf-8')
+        mask = len(self._table) - 1
+        slot = _slot(key, mask)
+        while True:
+            position = int(self._table[slot])
+            if position == EMPTY_SLOT:
+                return None
+            if self.key(position) == key:
+                return position
+            slot = (slot + 1) & mask
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> 'StringTable':
+        """Build an in-memory table (position = order of `strings`)"""
+        keys = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, keys), dtype=np.int64, count=len(keys)), out=offsets[1:])
+        blob = np.frombuffer(b''.join(keys), dtype=np.uint8)
+        return cls(blob, offsets, build_hash_table(keys, len(keys)))
+
+    def save(self, blob_path: str, offsets_path: str, table_path: str):
+        """Write the three arrays (each can then be memory-mapped by load)"""
+        with open(blob_path, 'wb') as f:
+            f.write(np.asarray(self._blob).tobytes())
+        np.save(offsets_path, np.asarray(self._offsets))
+        np.save(table_path, np.asarray(self._table))
+
+    @classmethod
+    def load(cls, blob_path: str, offsets_path: str, table_path: str) -> 'StringTable':
+        """Memory-map a saved table"""
+        # np.memmap không map được file rỗng
+        if os.path.getsize(blob_path) == 0:
+            blob = np.zeros(0, dtype=np.uint8)
+        else:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode='r')
+        return cls(blob, np.load(offsets_path, mmap_mode='r'), np.load(table_path, mmap_mode='r'))
@@ -0,0 +1,262 @@
+"""
+Table Store Module
+Tách nguyên vẹn từng bảng (HTML <table> hoặc Markdown pipe table) trong tài liệu lúc ingest,
+gắn với tài liệu nguồn và caption ("Bảng 2.5: ..."), tra cứu theo nhãn bảng
+"""
+
+import os
+import re
+import json
+import logging
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+
+from document_index import document_id
+
+logger = logging.getLogger(__name__)
+
+TABLE_STORE_VERSION = 1
+
+# Caption: "Bảng 2.5: ...", "_Bảng 1: ..._", "Table 3 - ..."
+CAPTION_PATTERN = re.compile(r'^[\s_*]*(?:bảng|table)\s*(\d+(?:\.\d+)*)', re.IGNORECASE)
+# Nhãn bảng được nhắc trong câu hỏi
+LABEL_PATTERN = re.compile(r'(?:bảng|table)\s*(\d+(?:\.\d+)*)', re.IGNORECASE)
+HEADING_PATTERN = re.compile(r'^#{1,6}\s+(.*)')
+PIPE_SEPARATOR_PATTERN = re.compile(r'^\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$')
+
+# Số dòng tối đa quanh bảng để tìm caption
+CAPTION_WINDOW = 3
+
+
+def question_table_labels(question: str) -> List[str]:
+    """Table numbers referenced by a question, in order ("So sánh Bảng 3.2 và Bảng 3.3" -> ["3.2", "3.3"])"""
+    return list(dict.fromkeys(LABEL_PATTERN.findall(question)))
+
+
+def _clean_cell(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class _HTMLTableParser(HTMLParser):
+    """
+    Collect the rows of one HTML table, expanding colspan/rowspan into repeated cells
+
+    Bảng con lồng trong ô được làm phẳng thành text của ô đó.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rows: List[List[str]] = []
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+        self._span = (1, 1)
+        self._pending: Dict[int, List] = {}  # cột -> [text, số dòng còn lại] của rowspan
+        self._depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            self._depth += 1
+        if self._depth > 1:
+            if tag in ('td', 'th', 'br') and self._cell is not None:
+                self._cell.append(' ')
+            return
+        if tag == 'tr':
+            self._row = []
+        elif tag in ('td', 'th') and self._row is not None:
+            attrs = dict(attrs)
+            self._cell = []
+            self._span = (int(attrs.get('colspan') or 1), int(attrs.get('rowspan') or 1))
+        elif tag == 'br' and self._cell is not None:
+            self._cell.append(' ')
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def _fill_pending(self):
+        # Chèn các ô rowspan từ dòng trên vào đúng cột
+        while len(self._row) in self._pending:
+            column = len(self._row)
+            text, remaining = self._pending[column]
+            self._row.append(text)
+            if remaining <= 1:
+                del self._pending[column]
+            else:
+                self._pending[column][1] = remaining - 1
+
+    def handle_endtag(self, tag):
+        if tag == 'table':
+            self._depth -= 1
+            return
+        if self._depth > 1:
+            return
+        if tag in ('td', 'th') and self._cell is not None:
+            text = _clean_cell(''.join(self._cell))
+            colspan, rowspan = self._span
+            for _ in range(colspan):
+                self._fill_pending()
+                if rowspan > 1:
+                    self._pending[len(self._row)] = [text, rowspan - 1]
+                self._row.append(text)
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self._fill_pending()
+            if any(self._row):
+                self.rows.append(self._row)
+            self._row = None
+
+
+def parse_html_table(html: str) -> List[List[str]]:
+    parser = _HTMLTableParser()
+    parser.feed(html)
+    parser.close()
+    return parser.rows
+
+
+def parse_pipe_table(lines: List[str]) -> List[List[str]]:
+    rows = []
+    for line in lines:
+        if PIPE_SEPARATOR_PATTERN.match(line):
+            continue
+        cells = line.strip().strip('|').split('|')
+        rows.append([_clean_cell(cell) for cell in cells])
+    return rows
+
+
+def extract_tables(text: str, file_name: str) -> List[Dict]:
+    """
+    Extract every table of a Markdown document
+
+    Mỗi bảng: table_id, doc_id, file_name, label (số bảng, vd. "2.5"), caption,
+    heading (tiêu đề mục chứa bảng), rows (danh sách các dòng, mỗi dòng là list ô).
+    Caption tìm ở dòng không rỗng ngay trước bảng, nếu không có thì ngay sau bảng.
+    """
+    doc_id = document_id(file_name)
+    lines = text.split('\n')
+    tables = []
+    heading = ""
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        heading_match = HEADING_PATTERN.match(line)
+        if heading_match:
+            heading = heading_match.group(1).strip()
+
+        start, end, rows = i, None, None
+        if line.lstrip().lower().startswith('<table'):
+            # Bảng có thể lồng bảng con trong ô: kết thúc khi đóng hết các thẻ <table>
+            end, depth = i, 0
+            while end < len(lines):
+                depth += lines[end].lower().count('<table') - lines[end].lower().count('</table>')
+                if depth <= 0 or end == len(lines) - 1:
+                    break
+                end += 1
+            rows = parse_html_table('\n'.join(lines[start:end + 1]))
+        elif line.lstrip().startswith('|') and i + 1 < len(lines) and PIPE_SEPARATOR_PATTERN.match(lines[i + 1]):
+            end = i + 1
+            while end + 1 < len(lines) and lines[end + 1].lstrip().startswith('|'):
+                end += 1
+            rows = parse_pipe_table(lines[start:end + 1])
+
+        if rows:
+            before = [l for l in lines[max(0, start - CAPTION_WINDOW):start] if l.strip()]
+            after = [l for l in lines[end + 1:end + 1 + CAPTION_WINDOW] if l.strip()]
+            caption = ""
+            if before and CAPTION_PATTERN.match(before[-1]):
+                caption = before[-1]
+            elif after and CAPTION_PATTERN.match(after[0]):
+                caption = after[0]
+            caption = caption.strip().strip('_*').strip()
+            label_match = CAPTION_PATTERN.match(caption)
+            tables.append({
+                "table_id": f"{doc_id}#t{len(tables):02d}",
+                "doc_id": doc_id,
+                "file_name": file_name,
+                "label": label_match.group(1) if label_match else None,
+                "caption": caption,
+                "heading": heading,
+                "rows": rows,
+            })
+        i = end + 1 if end is not None else i + 1
+    return tables
+
+
+def render_tsv(table: Dict, max_rows: int = None) -> str:
+    """Compact TSV rendering (caption line + one line per row) for the generator prompt"""
+    title = table["caption"] or table["heading"] or table["table_id"]
+    rows = table["rows"] if max_rows is None else table["rows"][:max_rows]
+    lines = [f"{title} ({table['file_name']})"]
+    lines.extend('\t'.join(cell.replace('\t', ' ') for cell in row) for row in rows)
+    if max_rows is not None and len(table["rows"]) > max_rows:
+        lines.append(f"... ({len(table['rows']) - max_rows} dòng nữa)")
+    return '\n'.join(lines)
+
+
+class TableStore:
+    """All extracted tables, indexed by file and by table label"""
+
+    def __init__(self, tables: List[Dict] = None):
+        self.tables: List[Dict] = []
+        self._by_label: Dict[str, List[Dict]] = {}
+        for table in tables or []:
+            self._add(table)
+
+    def _add(self, table: Dict):
+        self.tables.append(table)
+        if table["label"]:
+            self._by_label.setdefault(table["label"], []).append(table)
+
+    def add_documents(self, documents: List):
+        """Extract tables of loaded documents, replacing earlier tables of the same files"""
+        file_names = {doc.metadata.get('file_name', '') for doc in documents}
+        self.remove_files(file_names)
+        for doc in documents:
+            for table in extract_tables(doc.text, doc.metadata.get('file_name', '')):
+                self._add(table)
+
+    def remove_files(self, file_names):
+        file_names = set(file_names)
+        kept = [table for table in self.tables if table["file_name"] not in file_names]
+        if len(kept) != len(self.tables):
+            self.__init__(kept)
+
+    def clear(self):
+        self.__init__()
+
+    def lookup(self, label: str, doc_id: str = None) -> List[Dict]:
+        """Tables with the given label ("2.5"), optionally restricted to one document"""
+        tables = self._by_label.get(label, [])
+        if doc_id:
+            tables = [table for table in tables if table["doc_id"] == doc_id]
+        return tables
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def save(self, path: str):
+        """Write one table per line (atomic rename)"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"version": TABLE_STORE_VERSION}) + '\n')
+            for table in self.tables:
+                f.write(json.dumps(table, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['TableStore']:
+        """Load a saved store, None if missing or unreadable"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if header.get("version") != TABLE_STORE_VERSION:
+                    return None
+                tables = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load table store from {path}: {e}")
+            return None
+        return cls(tables)
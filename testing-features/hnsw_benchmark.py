@@ -0,0 +1,82 @@
+"""
+Benchmark HNSW vs exact search on the local vector store
+Đo thời gian build, recall@k (so với exact search) và latency theo từng giá trị ef_search,
+cho cả bản numpy và hnswlib (nếu đã cài)
+"""
+
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rag_system import RAGConfig
+from local_vector_store import LocalVectorStore
+from hnsw_index import create_hnsw_index, hnswlib
+
+# Dùng store đã build (backend local); nếu chưa có thì sinh dữ liệu ngẫu nhiên
+store_dir = os.environ.get("STORE_DIR", RAGConfig.LOCAL_VECTOR_STORE_DIR)
+num_queries = int(os.environ.get("NUM_QUERIES", "200"))
+top_k = int(os.environ.get("TOP_K", "10"))
+ef_values = [int(ef) for ef in os.environ.get("EF_VALUES", "16,32,64,128,256").split(",")]
+
+print("=" * 60)
+print("HNSW Benchmark (recall@k vs exact search)")
+print("=" * 60)
+
+rng = np.random.default_rng(0)
+
+if LocalVectorStore.exists(store_dir):
+    print(f"\n1. Loading local vector store from {store_dir}...")
+    store = LocalVectorStore(persist_dir=store_dir)
+    vectors = np.asarray(store._vectors, dtype=np.float32)
+else:
+    print(f"\n1. No store at {store_dir}, generating synthetic vectors...")
+    vectors = rng.normal(size=(10000, 256)).astype(np.float32)
+vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+print(f"   {vectors.shape[0]} vectors, dim {vectors.shape[1]}")
+
+# Query = vector có sẵn + nhiễu, gần với phân bố query thật hơn vector ngẫu nhiên
+query_rows = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+queries = vectors[query_rows] + rng.normal(scale=0.05, size=(len(query_rows), vectors.shape[1]))
+queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+print("\n2. Exact search (ground truth)...")
+start_time = time.time()
+exact_scores = queries @ vectors.T
+ground_truth = np.argsort(-exact_scores, axis=1)[:, :top_k]
+exact_ms = (time.time() - start_time) / len(queries) * 1000
+print(f"   {exact_ms:.3f} ms/query")
+
+libraries = os.environ.get("HNSW_LIBRARIES", "numpy,hnswlib").split(",")
+if hnswlib is None and "hnswlib" in libraries:
+    print("\n   hnswlib not installed, skipping it")
+    libraries.remove("hnswlib")
+
+print(f"\n3. Building HNSW (M={RAGConfig.HNSW_M}, efConstruction={RAGConfig.HNSW_EF_CONSTRUCTION})...")
+indexes, build_seconds = {}, {}
+for library in libraries:
+    hnsw = create_hnsw_index(lambda rows: vectors[rows], library=library, m=RAGConfig.HNSW_M,
+                             ef_construction=RAGConfig.HNSW_EF_CONSTRUCTION)
+    start_time = time.time()
+    hnsw.add(np.arange(len(vectors)))
+    build_seconds[library] = time.time() - start_time
+    indexes[library] = hnsw
+    print(f"   {library:>8}: {build_seconds[library]:.2f}s "
+          f"({len(vectors) / build_seconds[library]:.0f} vectors/s)")
+
+print(f"\n4. Build time / recall@{top_k} / latency per ef_search:")
+print(f"   {'library':>8} {'build_s':>8} {'ef':>6} {'recall':>8} {'ms/query':>10} {'speedup':>8}")
+for library, hnsw in indexes.items():
+    for ef in ef_values:
+        hits = 0
+        start_time = time.time()
+        for query, truth in zip(queries, ground_truth):
+            rows, _ = hnsw.search(query, top_k, ef=ef)
+            hits += len(set(rows.tolist()) & set(truth.tolist()))
+        hnsw_ms = (time.time() - start_time) / len(queries) * 1000
+        recall = hits / (len(queries) * top_k)
+        print(f"   {library:>8} {build_seconds[library]:>8.2f} {ef:>6} {recall:>8.4f} "
+              f"{hnsw_ms:>10.3f} {exact_ms / hnsw_ms:>7.2f}x")
+
+print("\n✓ Benchmark completed")